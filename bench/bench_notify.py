@@ -0,0 +1,133 @@
+"""
+Benachrichtigungs-Benchmark: reminder_tasks, backup_email und check_free_slots_alarm
+laufen gegen einen lokalen SMTP-Sink (fake_smtp.py) und eine Fake-Twilio-API
+(fake_twilio.py) mit In-Memory-Firestore. Gemessen werden Nachrichten/s,
+Verbindungen und Handshake-Zeit sowie Wiederholungen nach vorübergehenden Fehlern.
+
+    python bench/bench_notify.py
+    python bench/bench_notify.py --reminders 500 --latency-ms 20 --fail-rate 0.1
+    python bench/bench_notify.py --json notify.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from google.cloud import firestore
+
+from bench_pages import APP_PATH, make_users
+from fake_firestore import FakeFirestoreClient
+from fake_smtp import SMTPSink
+from fake_twilio import FakeTwilio
+
+
+def seed(client, reminders, admins):
+    """User mit SMS-Reminder, je eine Buchung morgen, zusätzliche Admins; keine Sommerpause"""
+    users = make_users(reminders)
+    for u in users[1:]:
+        u.update(active=True, sms_notifications=True)
+    for i in range(admins - 1):
+        users.append({'email': f"admin{i:02d}@bench.local", 'name': f"Admin {i:02d}", 'phone': '',
+                      'password_hash': hashlib.sha256(b"x").hexdigest(), 'role': 'admin', 'active': True})
+    client.seed('users', [dict(u) for u in users])
+    tomorrow = (date.today()+timedelta(days=1)).isoformat()
+    client.seed('bookings', [{'slot_date': tomorrow, 'slot_time': "17:00-20:00", 'status': 'confirmed',
+                              'user_email': u['email'], 'user_name': u['name'], 'user_phone': u['phone']}
+                             for u in users[1:reminders+1]])
+    client.collection('settings').document('summer_breaks').set({'value': []})
+
+
+def load_app(client, sink, twilio, backup_recipients):
+    env = {
+        'STORAGE_BACKEND': 'firestore', 'FIRESTORE_EMULATOR_HOST': 'fake',
+        'SNAPSHOT_PATH': os.path.join(tempfile.mkdtemp(prefix="ww-notify-"), "snapshot.jsonl.gz"),
+        'SMTP_SERVER': '127.0.0.1', 'SMTP_PORT': str(sink.port), 'SMTP_STARTTLS': 'false',
+        'SMTP_USER': 'bench@wasserwacht.de', 'SMTP_PASSWORD': 'bench',
+        'ADMIN_EMAIL_RECEIVER': 'admin@wasserwacht.de',
+        'BACKUP_EMAILS': json.dumps([f"backup{i:02d}@bench.local" for i in range(backup_recipients)]),
+        'TWILIO_ACCOUNT_SID': 'AC' + '0'*32, 'TWILIO_AUTH_TOKEN': 'bench', 'TWILIO_PHONE_NUMBER': '+4915100000000',
+        'TWILIO_API_BASE': twilio.base_url, 'ENABLE_SMS_REMINDER': 'true',
+    }
+    os.environ.update(env)
+    sys.path.insert(0, str(APP_PATH.parent))
+    with mock.patch.object(firestore, 'Client', lambda *a, **kw: client):
+        import streamlit_app
+    return streamlit_app
+
+
+def measure(name, fn, sink, twilio):
+    sink.stats.reset()
+    twilio.stats.reset()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter()-t0
+    smtp, http = sink.stats.snapshot(), twilio.stats.snapshot()
+    delivered = smtp['messages'] + http['messages']
+    return {'scenario': name, 'elapsed_s': round(elapsed, 3), 'messages': delivered,
+            'per_s': round(delivered/elapsed, 1) if elapsed else 0.0,
+            'smtp_connections': smtp['connections'], 'handshake_ms': smtp['handshake_ms'],
+            'http_requests': http['requests'], 'http_connections': http['connections'],
+            'retries': smtp['rejected'] + http['failures']}
+
+
+def run_benchmark(reminders, admins, backup_recipients, backup_kb, latency_ms, fail_rate, backoff, seed_value=1):
+    sink = SMTPSink(latency=latency_ms/1000, fail_rate=fail_rate, seed=seed_value).start()
+    twilio = FakeTwilio(latency=latency_ms/1000, fail_rate=fail_rate, seed=seed_value).start()
+    client = FakeFirestoreClient()
+    seed(client, reminders, admins)
+    try:
+        app = load_app(client, sink, twilio, backup_recipients)
+        app.mailer.transport.backoff = app.sms.transport.backoff = backoff
+        payload = os.urandom(backup_kb*1024)
+
+        def alarm():
+            app.ww_db.set_setting('free_slots_alarm', {})
+            app.check_free_slots_alarm()
+
+        return [
+            measure('reminder_tasks', app.reminder_tasks, sink, twilio),
+            measure('backup_email', lambda: app.mailer.backup_email(payload), sink, twilio),
+            measure('free_slots_alarm', alarm, sink, twilio),
+        ]
+    finally:
+        sink.stop()
+        twilio.stop()
+
+
+def print_report(results):
+    for r in results:
+        print(f"{r['scenario']:<17} {r['messages']:>5} Nachrichten in {r['elapsed_s']:>7.3f}s "
+              f"= {r['per_s']:>8.1f}/s  SMTP-Verbindungen={r['smtp_connections']:>3} "
+              f"Handshake={r['handshake_ms']:>6.2f}ms  HTTP={r['http_requests']:>4} Requests/"
+              f"{r['http_connections']:>3} Verbindungen  Wiederholungen={r['retries']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', type=int, default=200, help="Buchungen morgen mit SMS-Reminder")
+    parser.add_argument('--admins', type=int, default=5, help="Empfänger des Freie-Slots-Alarms")
+    parser.add_argument('--backup-recipients', type=int, default=5)
+    parser.add_argument('--backup-kb', type=int, default=256, help="Größe des Backup-Anhangs")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latenz pro SMTP-Befehl bzw. HTTP-Request")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Anteil vorübergehender Fehler (451/503/429)")
+    parser.add_argument('--backoff', type=float, default=0.01, help="Basis-Wartezeit der Wiederholungen in s")
+    parser.add_argument('--json', type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.reminders, args.admins, args.backup_recipients, args.backup_kb,
+                            args.latency_ms, args.fail_rate, args.backoff)
+    print_report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""
+Seiten-Benchmark: misst pro Seite gelesene Firestore-Dokumente, Queries,
+Laufzeit und Spitzen-Speicher. Die App läuft über streamlit.testing.v1.AppTest
+gegen den In-Memory-Firestore (fake_firestore.py) mit synthetischen Daten.
+
+    python bench/bench_pages.py                          # 1k und 10k Buchungen
+    python bench/bench_pages.py --sizes 1000 10000 100000
+    python bench/bench_pages.py --update-baseline        # baseline.json neu schreiben
+    python bench/bench_pages.py --track reads,queries,wall_ms --time-threshold 0.5
+    python bench/bench_pages.py --latency-ms 20          # Netzwerk-Latenz pro Lese-RPC simulieren
+
+Exit-Code 1, wenn eine überwachte Metrik die Baseline um mehr als den
+Schwellwert überschreitet.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from google.cloud import firestore
+from google.oauth2 import service_account
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from fake_firestore import FakeFirestoreClient
+
+APP_PATH = Path(__file__).resolve().parents[1] / "streamlit_app.py"
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+ADMIN_EMAIL = "admin@wasserwacht.de"
+SLOT_TIMES = ["17:00-20:00", "14:00-17:00"]
+
+# Seite -> optionaler Button, dessen Klick gemessen wird (statt des reinen Renderns)
+PAGES = {
+    'home': None,
+    'calendar': None,
+    'dashboard': None,
+    'all_bookings': None,
+    'export': "📊 Excel Download",
+}
+METRICS = ['reads', 'queries', 'kb_read', 'wall_ms', 'peak_kb']
+# Absolute Toleranz, damit Rauschen bei kleinen Werten nicht als Regression zählt
+MIN_DELTA = {'reads': 0, 'queries': 0, 'kb_read': 1, 'wall_ms': 20, 'peak_kb': 256}
+
+
+def default_users(n_bookings):
+    return min(500, max(50, n_bookings // 200))
+
+
+def make_users(n_users):
+    users = [{
+        'id': 'admin', 'email': ADMIN_EMAIL, 'name': 'Admin', 'phone': '',
+        'password_hash': hashlib.sha256(b"admin123").hexdigest(), 'role': 'admin', 'active': True,
+        'email_notifications': True, 'sms_notifications': False, 'sms_booking_confirmation': True,
+    }]
+    for i in range(n_users):
+        users.append({
+            'email': f"helfer{i:03d}@bench.local", 'name': f"Helfer {i:03d}", 'phone': f"0170{i:07d}",
+            'password_hash': hashlib.sha256(f"pw{i}".encode()).hexdigest(), 'role': 'user',
+            'active': i % 17 != 0, 'email_notifications': True, 'sms_notifications': i % 3 == 0,
+            'sms_booking_confirmation': True,
+        })
+    return users
+
+
+def make_bookings(n_bookings, users, rng, today):
+    """Buchungen über ~3 Jahre Historie und 90 Tage Zukunft, ~15% storniert"""
+    bookings = []
+    for _ in range(n_bookings):
+        u = rng.choice(users)
+        d = today + timedelta(days=rng.randint(-3*365, 90))
+        status = 'cancelled' if rng.random() < 0.15 else 'confirmed'
+        bookings.append({
+            'slot_date': d.isoformat(), 'slot_time': rng.choice(SLOT_TIMES),
+            'user_email': u['email'], 'user_name': u['name'], 'user_phone': u['phone'],
+            'status': status,
+        })
+    return bookings
+
+
+def seeded_client(n_bookings, n_users, seed=42, latency=0.0):
+    rng = random.Random(seed)
+    client = FakeFirestoreClient(latency=latency)
+    users = make_users(n_users)
+    client.seed('users', [dict(u) for u in users])
+    client.seed('bookings', make_bookings(n_bookings, users, rng, date.today()))
+    return client
+
+
+def patched_firestore(client):
+    """firestore.Client und die Service-Account-Prüfung auf den Fake umbiegen"""
+    return [
+        mock.patch.object(firestore, 'Client', lambda *a, **kw: client),
+        mock.patch.object(service_account.Credentials, 'from_service_account_info', lambda *a, **kw: None),
+    ]
+
+
+def new_app(timeout):
+    at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+    at.secrets['STORAGE_BACKEND'] = 'firestore'
+    at.secrets['firebase'] = {'service_account_key': json.dumps({'project_id': 'bench'})}
+    at.secrets['ADMIN_EMAIL'] = ADMIN_EMAIL
+    return at
+
+
+def login(at, client):
+    at.run()
+    snap = client.collection('users').document('admin').get()
+    user = snap.to_dict()
+    user['id'] = snap.id
+    at.session_state.user = user
+
+
+def measure_page(at, client, page, button):
+    at.session_state.page = page
+    at.run()  # Warm-up (Caches, Widgets)
+
+    def action():
+        if button:
+            next(b for b in at.button if b.label == button).click()
+        at.run()
+
+    client.stats.reset()
+    t0 = time.perf_counter()
+    action()
+    wall_ms = (time.perf_counter()-t0)*1000
+    counts = client.stats.snapshot()
+
+    tracemalloc.start()
+    action()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    error = at.exception[0].message if at.exception else None
+    return {'reads': counts['reads'], 'queries': counts['queries'], 'kb_read': round(counts['bytes']/1024, 1),
+            'wall_ms': round(wall_ms, 1), 'peak_kb': round(peak/1024), 'error': error}
+
+
+def run_benchmark(sizes, users=None, pages=None, timeout=600, latency_ms=0):
+    results = {}
+    os.environ['STORAGE_BACKEND'] = 'firestore'
+    snapshot_dir = tempfile.mkdtemp(prefix="ww-bench-")
+    for n in sizes:
+        # Frischer lokaler Snapshot pro Datensatz (sonst würde ein alter Lauf geladen)
+        os.environ['SNAPSHOT_PATH'] = os.path.join(snapshot_dir, f"snapshot_{n}.jsonl.gz")
+        n_users = users or default_users(n)
+        client = seeded_client(n, n_users, latency=latency_ms/1000)
+        st.cache_resource.clear()
+        st.cache_data.clear()
+        patches = patched_firestore(client)
+        for p in patches:
+            p.start()
+        try:
+            at = new_app(timeout)
+            login(at, client)
+            for page in pages or PAGES:
+                key = f"{n}:{page}"
+                results[key] = measure_page(at, client, page, PAGES[page])
+                r = results[key]
+                print(f"{n:>7} Buchungen {n_users:>4} User  {page:<13} "
+                      f"reads={r['reads']:>7} queries={r['queries']:>4} kb={r['kb_read']:>8.1f} "
+                      f"wall={r['wall_ms']:>9.1f}ms peak={r['peak_kb']:>7}KB"
+                      + (f"  ❌ {r['error']}" if r['error'] else ""))
+        finally:
+            for p in patches:
+                p.stop()
+    return results
+
+
+def compare(results, baseline, track, threshold, time_threshold):
+    """Regressionen gegenüber der Baseline als Liste von Meldungen"""
+    regressions = []
+    for key, current in results.items():
+        if current.get('error'):
+            regressions.append(f"{key}: Fehler {current['error']}")
+            continue
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric in track:
+            limit = time_threshold if metric == 'wall_ms' else threshold
+            old, new = base.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old*(1+limit) and new-old > MIN_DELTA[metric]:
+                regressions.append(f"{key}: {metric} {old} -> {new} (+{(new-old)/max(old,1):.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--users', type=int, default=None, help="Anzahl User (Standard: 50-500 je nach Größe)")
+    parser.add_argument('--pages', nargs='+', choices=list(PAGES), default=None)
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--track', default='reads,queries,kb_read', help=f"Kommagetrennt aus {METRICS}")
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--time-threshold', type=float, default=0.50)
+    parser.add_argument('--latency-ms', type=float, default=0, help="Simulierte Latenz pro Lese-RPC")
+    parser.add_argument('--json', type=Path, default=None, help="Ergebnisse zusätzlich als JSON schreiben")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.users, args.pages, latency_ms=args.latency_ms)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2, sort_keys=True))
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update({k: {m: v[m] for m in METRICS} for k, v in results.items() if not v['error']})
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True)+"\n")
+        print(f"✅ Baseline geschrieben: {args.baseline}")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    track = [m.strip() for m in args.track.split(',') if m.strip() in METRICS]
+    regressions = compare(results, baseline, track, args.threshold, args.time_threshold)
+    if regressions:
+        print("\n❌ Regressionen:")
+        for r in regressions:
+            print(f"  - {r}")
+        return 1
+    print("\n✅ Keine Regressionen" if baseline else "\n⚠️ Keine Baseline vorhanden (--update-baseline)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""
+In-Memory Firestore-Ersatz für Benchmarks und Lasttests.
+Bildet die Teile der google-cloud-firestore API nach, die streamlit_app.py nutzt,
+und zählt gelesene Dokumente und Queries wie die Firestore-Abrechnung.
+"""
+
+import copy
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud import firestore
+
+RANGE_OPS = {'<', '<=', '>', '>='}
+OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class Stats:
+    """Zähler für gelesene Dokumente, Queries und Schreibvorgänge"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.reads = 0
+        self.queries = 0
+        self.writes = 0
+        self.bytes = 0
+
+    def snapshot(self):
+        return {'reads': self.reads, 'queries': self.queries, 'writes': self.writes, 'bytes': self.bytes}
+
+    def count(self, reads=0, queries=0, writes=0, nbytes=0):
+        with self.lock:
+            self.reads += reads
+            self.queries += queries
+            self.writes += writes
+            self.bytes += nbytes
+
+
+def _size(data):
+    """Grobe Payload-Größe eines Dokuments (Feldnamen + Werte als Text)"""
+    return sum(len(k) + len(str(v)) for k, v in data.items()) if data else 0
+
+
+def _resolve(data):
+    """SERVER_TIMESTAMP-Sentinels beim Schreiben durch die aktuelle Zeit ersetzen"""
+    now = datetime.now(timezone.utc)
+    return {k: (now if v is firestore.SERVER_TIMESTAMP else v) for k, v in data.items()}
+
+
+class DocumentSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _docs(self):
+        return self._client._store.setdefault(self._collection, {})
+
+    def get(self, transaction=None):
+        self._client._rpc()
+        with self._client._lock:
+            data = self._docs.get(self.id)
+            self._client.stats.count(reads=1, queries=1, nbytes=_size(data))
+            return DocumentSnapshot(self, copy.deepcopy(data) if data is not None else None)
+
+    def set(self, data, merge=False):
+        self._client.stats.count(writes=1)
+        with self._client._lock:
+            current = (self._docs.get(self.id) if merge else None) or {}
+            resolved = _resolve(data)
+            for key, value in resolved.items():
+                if isinstance(value, firestore.Increment):
+                    resolved[key] = current.get(key, 0) + value.value
+            self._docs[self.id] = {**current, **resolved}
+            self._client._dirty(self._collection)
+
+    def create(self, data):
+        with self._client._lock:
+            if self.id in self._docs:
+                raise AlreadyExists(f"Document already exists: {self._collection}/{self.id}")
+            self.set(data)
+
+    def update(self, data):
+        self._client.stats.count(writes=1)
+        with self._client._lock:
+            if self.id not in self._docs:
+                raise NotFound(f"No document to update: {self._collection}/{self.id}")
+            resolved = _resolve(data)
+            for key, value in resolved.items():
+                if isinstance(value, firestore.Increment):
+                    resolved[key] = self._docs[self.id].get(key, 0) + value.value
+            self._docs[self.id].update(resolved)
+            self._client._dirty(self._collection)
+
+    def delete(self):
+        self._client.stats.count(writes=1)
+        with self._client._lock:
+            self._docs.pop(self.id, None)
+            self._client._dirty(self._collection)
+
+    def collection(self, name):
+        return CollectionReference(self._client, f"{self._collection}/{self.id}/{name}")
+
+
+class Query:
+    def __init__(self, client, collection, filters=(), limit=None, orders=(), fields=None, offset=0):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._limit = limit
+        self._orders = tuple(orders)
+        self._fields = fields
+        self._offset = offset
+
+    def _copy(self, **kwargs):
+        params = dict(filters=self._filters, limit=self._limit, orders=self._orders,
+                      fields=self._fields, offset=self._offset)
+        params.update(kwargs)
+        return Query(self._client, self._collection, **params)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field, op, value),))
+
+    def limit(self, n):
+        return self._copy(limit=n)
+
+    def offset(self, n):
+        return self._copy(offset=n)
+
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def _check_index(self):
+        """Bereichsfilter oder Sortierung kombiniert mit weiteren Feldern braucht einen Composite-Index"""
+        eq = {f for f, op, _ in self._filters if op not in RANGE_OPS}
+        ranges = {f for f, op, _ in self._filters if op in RANGE_OPS}
+        orders = {f for f, _ in self._orders}
+        if len(ranges) > 1:
+            raise FailedPrecondition("Cannot have inequality filters on multiple properties")
+        if (ranges and eq) or (orders and (eq or ranges - orders)) or len(orders) > 1:
+            fields = eq | ranges | orders
+            if not self._client.has_index(self._collection, fields):
+                raise FailedPrecondition(f"The query requires an index on {sorted(fields)}")
+
+    def _matches(self):
+        self._check_index()
+        client = self._client
+        with client._lock:
+            docs = client._store.get(self._collection, {})
+            candidates = None
+            for field, op, value in self._filters:
+                if op == '==':
+                    ids = client._eq_index(self._collection, field).get(_hashable(value), ())
+                    candidates = set(ids) if candidates is None else candidates & set(ids)
+            items = docs.items() if candidates is None else ((i, docs[i]) for i in candidates if i in docs)
+            result = [(doc_id, data) for doc_id, data in items
+                      if all(OPS[op](data.get(f), v) for f, op, v in self._filters)]
+        for field, direction in reversed(self._orders):
+            result.sort(key=lambda x: (x[1].get(field) is None, x[1].get(field)),
+                        reverse=direction in ('DESCENDING', firestore.Query.DESCENDING))
+        if not self._orders and candidates is not None:
+            result.sort(key=lambda x: x[0])
+        result = result[self._offset:]
+        if self._limit is not None:
+            result = result[:self._limit]
+        return result
+
+    def stream(self, transaction=None):
+        self._client._rpc()
+        result = self._matches()
+        if self._fields is not None:
+            result = [(doc_id, {k: v for k, v in data.items() if k in self._fields}) for doc_id, data in result]
+        self._client.stats.count(reads=max(1, len(result)), queries=1,
+                                 nbytes=sum(_size(data) for _, data in result))
+        for doc_id, data in result:
+            yield DocumentSnapshot(DocumentReference(self._client, self._collection, doc_id), data)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias)
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias or 'count'
+
+    def get(self, transaction=None):
+        self._query._client._rpc()
+        n = len(self._query._matches())
+        # Aggregationen kosten 1 Read pro angefangene 1000 Index-Einträge
+        self._query._client.stats.count(reads=max(1, -(-n // 1000)), queries=1)
+        return [[AggregationResult(self._alias, n)]]
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name.rsplit('/', 1)[-1]
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return datetime.now(timezone.utc), ref
+
+    def list_documents(self):
+        with self._client._lock:
+            ids = list(self._client._store.get(self._collection, {}))
+        return [DocumentReference(self._client, self._collection, i) for i in ids]
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def create(self, ref, data):
+        self._ops.append(lambda: ref.set(data))
+
+    def commit(self):
+        with self._client._lock:
+            for op in self._ops:
+                op()
+        self._ops = []
+
+
+class Transaction(WriteBatch):
+    """Transaktion: Schreibvorgänge werden beim Commit unter dem globalen Lock
+    ausgeführt; Lesen innerhalb der Transaktion geschieht ebenfalls unter dem Lock."""
+
+    def __init__(self, client):
+        super().__init__(client)
+        self._read_only = False
+        self._max_attempts = 5
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._lock.acquire()
+        self._id = b'fake'
+
+    def _rollback(self):
+        self._ops = []
+        if self._id is not None:
+            self._id = None
+            self._client._lock.release()
+
+    def _commit(self):
+        try:
+            for op in self._ops:
+                op()
+        finally:
+            self._ops = []
+            self._id = None
+            self._client._lock.release()
+        return []
+
+    def _clean_up(self):
+        self._ops = []
+        self._id = None
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    @property
+    def id(self):
+        return self._id
+
+
+class FakeFirestoreClient:
+    """Ersatz für firestore.Client; indexes=None bedeutet 'alle Composite-Indizes vorhanden',
+    latency simuliert die Netzwerk-Laufzeit pro Lese-RPC in Sekunden"""
+
+    def __init__(self, indexes=None, project='bench', latency=0.0):
+        self.project = project
+        self.stats = Stats()
+        self.indexes = indexes
+        self.latency = latency
+        self._store = {}
+        self._indexes_eq = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def _rpc(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def document(self, path):
+        collection, doc_id = path.rsplit('/', 1)
+        return DocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs):
+        return Transaction(self)
+
+    def collections(self):
+        return [CollectionReference(self, name) for name in self._store if '/' not in name]
+
+    def has_index(self, collection, fields):
+        return self.indexes is None or (collection, frozenset(fields)) in self.indexes
+
+    def _eq_index(self, collection, field):
+        key = (collection, field)
+        index = self._indexes_eq.get(key)
+        if index is None:
+            index = {}
+            for doc_id, data in self._store.get(collection, {}).items():
+                index.setdefault(_hashable(data.get(field)), []).append(doc_id)
+            self._indexes_eq[key] = index
+        return index
+
+    def _dirty(self, collection):
+        for key in [k for k in self._indexes_eq if k[0] == collection]:
+            del self._indexes_eq[key]
+
+    def seed(self, collection, docs):
+        """Dokumente ohne Zählung direkt einspielen (Benchmark-Setup)"""
+        with self._lock:
+            target = self._store.setdefault(collection, {})
+            for data in docs:
+                target[data.pop('id', None) or uuid.uuid4().hex[:20]] = data
+            self._dirty(collection)
+
+
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
+
@@ -0,0 +1,122 @@
+"""
+Minimaler SMTP-Empfänger für Benchmarks (wie ein aiosmtpd-Sink, nur Standardbibliothek).
+Nimmt Mails ohne TLS an, akzeptiert jedes AUTH PLAIN, zählt Verbindungen, Handshake-Zeit
+und Nachrichten und simuliert Latenz pro Befehl sowie vorübergehende Fehler (451 bei RCPT).
+"""
+
+import random
+import socketserver
+import threading
+import time
+
+
+class SinkStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.messages = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.handshake_ms = []
+
+    def snapshot(self):
+        with self.lock:
+            hs = self.handshake_ms
+            return {'connections': self.connections, 'messages': self.messages, 'rejected': self.rejected,
+                    'kb': round(self.bytes/1024, 1),
+                    'handshake_ms': round(sum(hs)/len(hs), 2) if hs else 0.0}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Antworten sofort senden (sonst Nagle + Delayed ACK: ~40 ms pro Befehl)
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        t0 = time.perf_counter()
+        with sink.stats.lock:
+            sink.stats.connections += 1
+        self.reply("220 sink ESMTP")
+        for raw in self.rfile:
+            cmd = raw.decode('utf-8', 'replace').strip()
+            verb = cmd[:4].upper()
+            if sink.latency:
+                time.sleep(sink.latency)
+            if verb == 'EHLO':
+                self.reply("250-sink")
+                self.reply("250-AUTH PLAIN")
+                self.reply("250 SIZE 52428800")
+            elif verb == 'HELO':
+                self.reply("250 sink")
+            elif verb == 'AUTH':
+                with sink.stats.lock:
+                    sink.stats.handshake_ms.append((time.perf_counter()-t0)*1000)
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == 'MAIL':
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                if sink.fail():
+                    with sink.stats.lock:
+                        sink.stats.rejected += 1
+                    self.reply("451 4.3.0 Temporary failure, try again")
+                else:
+                    self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for line in self.rfile:
+                    if line in (b".\r\n", b".\n"):
+                        break
+                    size += len(line)
+                with sink.stats.lock:
+                    sink.stats.messages += 1
+                    sink.stats.bytes += size
+                self.reply("250 OK queued")
+            elif verb in ('RSET', 'NOOP'):
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """SMTP-Sink in einem Hintergrund-Thread; port=0 wählt einen freien Port"""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=1, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.stats = SinkStats()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.sink = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def fail(self):
+        with self._rng_lock:
+            return self._rng.random() < self.fail_rate
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
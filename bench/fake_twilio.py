@@ -0,0 +1,112 @@
+"""
+Fake der Twilio-REST-API für Benchmarks: nimmt POST .../Messages.json an und antwortet
+wie Twilio (201 + JSON). Latenz und Fehlerquote (503 bzw. 429) sind einstellbar; gezählt
+werden Requests, TCP-Verbindungen (Keep-Alive) und zugestellte Nachrichten.
+
+Die App wird per TWILIO_API_BASE=http://127.0.0.1:<port> darauf umgeleitet.
+"""
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class TwilioStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.connections = 0
+        self.messages = 0
+        self.failures = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'connections': self.connections,
+                    'messages': self.messages, 'failures': self.failures}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.fake.stats.lock:
+            self.server.fake.stats.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        with fake.stats.lock:
+            fake.stats.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        if not self.path.endswith("/Messages.json"):
+            self.respond(404, {'code': 20404, 'message': "Not found", 'status': 404})
+            return
+        status = fake.fail()
+        if status:
+            with fake.stats.lock:
+                fake.stats.failures += 1
+            self.respond(status, {'code': 20429 if status == 429 else 20500,
+                                  'message': "Too Many Requests" if status == 429 else "Service unavailable",
+                                  'status': status})
+            return
+        with fake.stats.lock:
+            fake.stats.messages += 1
+        self.respond(201, {'sid': "SM" + uuid.uuid4().hex, 'status': "queued",
+                           'to': form.get('To', [''])[0], 'from': form.get('From', [''])[0],
+                           'body': form.get('Body', [''])[0], 'num_segments': "1"})
+
+
+class FakeTwilio:
+    """HTTP-Server in einem Hintergrund-Thread; Fehler sind je zur Hälfte 503 und 429"""
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=1, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.stats = TwilioStats()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail(self):
+        with self._rng_lock:
+            r = self._rng.random()
+        if r >= self.fail_rate:
+            return None
+        return 503 if r < self.fail_rate/2 else 429
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
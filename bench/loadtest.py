@@ -0,0 +1,205 @@
+"""
+Lasttest für gleichzeitige Sessions: N simulierte User (je eine AppTest-Instanz
+in einem eigenen Thread) buchen und stornieren überlappende Slots derselben Wochen.
+
+    python bench/loadtest.py --sessions 8 --actions 20
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python bench/loadtest.py --emulator
+
+Berichtet Durchsatz, p50/p95/p99-Latenz je Aktion, Doppelbuchungen und die
+Anzahl laufender Scheduler-Threads. Mit --fail-on-double-booking Exit-Code 1,
+sobald ein Slot mehrfach bestätigt gebucht ist.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from unittest import mock
+
+from google.cloud import firestore
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+from streamlit.runtime.media_file_manager import MediaFileManager
+from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+from streamlit.testing.v1 import AppTest
+
+from bench_pages import APP_PATH, make_users
+from fake_firestore import FakeFirestoreClient
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values)-1) * p/100
+    f, c = int(k), min(int(k)+1, len(values)-1)
+    return values[f] + (values[c]-values[f]) * (k-f)
+
+
+def scheduler_threads():
+    return sum(1 for t in threading.enumerate() if t.name.startswith("APScheduler"))
+
+
+def shared_runtime():
+    """AppTest setzt Runtime._instance pro Lauf und danach wieder auf None. Bei
+    mehreren gleichzeitigen Sessions würde ein fertiger Lauf den anderen die
+    Runtime wegnehmen, daher liefert Runtime.instance() hier ein gemeinsames Mock."""
+    runtime = mock.MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    return mock.patch.object(Runtime, 'instance', classmethod(lambda cls: runtime))
+
+
+def seed(client, n_users):
+    """User anlegen und Sommerpause leeren, damit alle Wochen buchbar sind"""
+    users = make_users(n_users)
+    for u in users:
+        client.collection('users').document(u.pop('id', None) or u['email']).set(u)
+    client.collection('settings').document('summer_breaks').set({'value': []})
+    return [u for u in users if u['role'] == 'user' and u['active']]
+
+
+class Session(threading.Thread):
+    def __init__(self, user, weeks, actions, cancel_ratio, timeout, rng, results):
+        super().__init__(daemon=True)
+        self.user = user
+        self.weeks = weeks
+        self.actions = actions
+        self.cancel_ratio = cancel_ratio
+        self.timeout = timeout
+        self.rng = rng
+        self.results = results
+        self.errors = []
+
+    def timed(self, kind, fn):
+        t0 = time.perf_counter()
+        fn()
+        self.results[kind].append((time.perf_counter()-t0)*1000)
+
+    def run(self):
+        try:
+            at = AppTest.from_file(str(APP_PATH), default_timeout=self.timeout)
+            self.timed('start', at.run)
+            at.session_state.user = dict(self.user)
+            for _ in range(self.actions):
+                at.session_state.page = 'home'
+                at.session_state.current_week = self.rng.choice(self.weeks)
+                self.timed('view', at.run)
+                book = [b for b in at.button if b.label == "✅ Buchen"]
+                cancel = [b for b in at.button if b.label == "🔴 Stornieren"]
+                if cancel and (not book or self.rng.random() < self.cancel_ratio):
+                    self.rng.choice(cancel).click()
+                    self.timed('cancel', at.run)
+                elif book:
+                    self.rng.choice(book).click()
+                    self.timed('book', at.run)
+                if at.exception:
+                    self.errors.append(at.exception[0].message)
+        except Exception as e:
+            self.errors.append(repr(e))
+
+
+def double_bookings(client):
+    slots = Counter((d.get('slot_date'), d.get('slot_time'))
+                    for d in (doc.to_dict() for doc in client.collection('bookings').where('status', '==', 'confirmed').stream()))
+    return {k: v for k, v in slots.items() if v > 1}
+
+
+def run_loadtest(sessions, actions, weeks, cancel_ratio, emulator=False, timeout=120, seed_value=1):
+    os.environ['STORAGE_BACKEND'] = 'firestore'
+    os.environ['SNAPSHOT_PATH'] = os.path.join(tempfile.mkdtemp(prefix="ww-load-"), "snapshot.jsonl.gz")
+    patches = [shared_runtime()]
+    if emulator:
+        if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+            raise SystemExit("❌ FIRESTORE_EMULATOR_HOST ist nicht gesetzt")
+        client = firestore.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT", "wasserwacht-local"))
+    else:
+        client = FakeFirestoreClient()
+        os.environ['FIRESTORE_EMULATOR_HOST'] = 'fake'
+        patches.append(mock.patch.object(firestore, 'Client', lambda *a, **kw: client))
+    for p in patches:
+        p.start()
+    st.cache_resource.clear()
+    try:
+        users = seed(client, max(sessions, 1))
+        start_week = date.today() - timedelta(days=date.today().weekday()) + timedelta(days=7)
+        target_weeks = [start_week + timedelta(days=7*i) for i in range(weeks)]
+        threads_before = scheduler_threads()
+
+        results = defaultdict(list)
+        workers = [Session(users[i % len(users)], target_weeks, actions, cancel_ratio, timeout,
+                           random.Random(seed_value+i), results) for i in range(sessions)]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter()-t0
+
+        writes = sum(len(results[k]) for k in ('book', 'cancel'))
+        report = {
+            'sessions': sessions, 'elapsed_s': round(elapsed, 2),
+            'actions': writes + len(results['view']),
+            'throughput_per_s': round((writes + len(results['view']))/elapsed, 2),
+            'latency_ms': {k: {'n': len(v), 'p50': round(percentile(v, 50), 1),
+                               'p95': round(percentile(v, 95), 1), 'p99': round(percentile(v, 99), 1),
+                               'mean': round(statistics.fmean(v), 1) if v else 0.0}
+                           for k, v in sorted(results.items())},
+            'double_bookings': len(double_bookings(client)),
+            'scheduler_threads': scheduler_threads() - threads_before,
+            'errors': [e for w in workers for e in w.errors],
+        }
+        if not emulator:
+            report['firestore'] = client.stats.snapshot()
+        return report
+    finally:
+        for p in patches:
+            p.stop()
+        if not emulator:
+            os.environ.pop('FIRESTORE_EMULATOR_HOST', None)
+
+
+def print_report(r):
+    print(f"\n🏊 {r['sessions']} Sessions, {r['actions']} Aktionen in {r['elapsed_s']}s "
+          f"-> {r['throughput_per_s']} Aktionen/s")
+    for kind, l in r['latency_ms'].items():
+        print(f"  {kind:<7} n={l['n']:>5}  p50={l['p50']:>8.1f}ms  p95={l['p95']:>8.1f}ms  p99={l['p99']:>8.1f}ms")
+    print(f"  Doppelbuchungen:   {r['double_bookings']}")
+    print(f"  Scheduler-Threads: {r['scheduler_threads']} (neu gestartet)")
+    if 'firestore' in r:
+        print(f"  Firestore:         {r['firestore']}")
+    if r['errors']:
+        print(f"  ❌ {len(r['errors'])} Fehler, z.B. {r['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--actions', type=int, default=20, help="Buchen/Stornieren-Versuche pro Session")
+    parser.add_argument('--weeks', type=int, default=1, help="Anzahl Zielwochen (weniger = mehr Konkurrenz)")
+    parser.add_argument('--cancel-ratio', type=float, default=0.3)
+    parser.add_argument('--emulator', action='store_true', help="Gegen FIRESTORE_EMULATOR_HOST statt In-Memory-Fake")
+    parser.add_argument('--json', type=Path, default=None)
+    parser.add_argument('--fail-on-double-booking', action='store_true')
+    args = parser.parse_args(argv)
+
+    report = run_loadtest(args.sessions, args.actions, args.weeks, args.cancel_ratio, args.emulator)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.fail_on_double_booking and report['double_bookings']:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
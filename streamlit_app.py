@@ -4,12 +4,27 @@ Alle Bugs behoben | Admin Debug-Panel | E-Mail/SMS funktionieren | Production-Re
 """
 
 import streamlit as st
+import base64
+import gzip
 import hashlib
+import hmac
+import html
 import io
 import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
 import zipfile
+from abc import ABC, abstractmethod
 import calendar as cal_module
-from datetime import datetime, timedelta, date
+import csv
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
+from functools import lru_cache
+from datetime import datetime, timedelta, date, timezone
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -20,12 +35,23 @@ import pytz
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from twilio.rest import Client
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
 from google.cloud import firestore
 from google.oauth2 import service_account
-from collections import Counter
+from google.auth.credentials import AnonymousCredentials
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
 
 # ===== PAGE CONFIG =====
 st.set_page_config(
@@ -40,19 +66,77 @@ VERSION = "8.0 - Debug Edition"
 TIMEZONE_STR = "Europe/Berlin"
 TZ = pytz.timezone(TIMEZONE_STR)
 
+# Standard-Slots; werden verwendet solange die Collection 'slot_templates' leer ist
 WEEKLY_SLOTS = [
     {"id": 1, "day": "tuesday", "day_name": "Dienstag", "start": "17:00", "end": "20:00"},
     {"id": 2, "day": "friday", "day_name": "Freitag", "start": "17:00", "end": "20:00"},
     {"id": 3, "day": "saturday", "day_name": "Samstag", "start": "14:00", "end": "17:00"},
 ]
 
-BAVARIA_HOLIDAYS = {
-    "2025": ["2025-01-01", "2025-01-06", "2025-04-18", "2025-04-21", "2025-05-01", 
-             "2025-05-29", "2025-06-09", "2025-06-19", "2025-08-15", "2025-10-03", 
-             "2025-11-01", "2025-12-25", "2025-12-26"],
-    "2026": ["2026-01-01", "2026-01-06", "2026-04-03", "2026-04-06", "2026-05-01", 
-             "2026-05-14", "2026-05-25", "2026-06-04", "2026-08-15", "2026-10-03", 
-             "2026-11-01", "2026-12-25", "2026-12-26"]
+WEEKDAYS = ["monday","tuesday","wednesday","thursday","friday","saturday","sunday"]
+WEEKDAY_NAMES = ["Montag","Dienstag","Mittwoch","Donnerstag","Freitag","Samstag","Sonntag"]
+
+# Sommerpause: "MM-DD" gilt jedes Jahr, "YYYY-MM-DD" nur für das konkrete Datum
+# Überschreibbar über Setting 'summer_breaks' (Liste von {'start':..,'end':..})
+SUMMER_BREAKS_DEFAULT = [{"start": "06-01", "end": "09-30"}]
+
+# Speicher-Backend: STORAGE_BACKEND = "firestore" (Standard) oder "sqlite"
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, email TEXT NOT NULL, data TEXT NOT NULL);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE TABLE IF NOT EXISTS bookings (id TEXT PRIMARY KEY, slot_date TEXT NOT NULL, slot_time TEXT NOT NULL,
+    status TEXT NOT NULL, user_email TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_bookings_slot ON bookings(slot_date, slot_time, status);
+CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_email, slot_date);
+CREATE TABLE IF NOT EXISTS archive (id TEXT PRIMARY KEY, slot_date TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS archive_index (month TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS slot_templates (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS booking_months (month TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS booking_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, booking_id TEXT,
+    user_email TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_events_booking ON booking_events(booking_id);
+CREATE INDEX IF NOT EXISTS idx_events_user ON booking_events(user_email, seq);
+CREATE TABLE IF NOT EXISTS views (key TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS user_stats (email TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS notifications (id INTEGER PRIMARY KEY AUTOINCREMENT, recipient TEXT NOT NULL, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS job_runs (id TEXT PRIMARY KEY, job TEXT NOT NULL, started_at TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_job_runs_started ON job_runs(started_at);
+CREATE TABLE IF NOT EXISTS idempotency (key TEXT PRIMARY KEY, at TEXT NOT NULL);
+"""
+
+# Serienbuchung: maximale Termine pro Vorgang (Firestore erlaubt 500 Schreibvorgänge je Commit)
+SERIES_MAX_SLOTS = 100
+
+# Massenimport/-export von Usern: Spalten und akzeptierte Überschriften
+USER_EXPORT_COLUMNS = ["email","name","phone","role","active","email_notifications","sms_notifications","notification_mode"]
+USER_IMPORT_ALIASES = {"e-mail":"email","mail":"email","telefon":"phone","handy":"phone",
+                       "rolle":"role","passwort":"password","aktiv":"active"}
+
+# Buchungs-Export: (Feld, Spaltenüberschrift, Spaltenbreite)
+EXPORT_COLUMNS = [("slot_date","Datum",12), ("slot_time","Zeit",13), ("user_name","Name",24),
+                  ("user_email","E-Mail",30), ("status","Status",11)]
+EXPORT_STATUS = {"Alle":None, "Bestätigt":"confirmed", "Storniert":"cancelled"}
+
+# Zustellung von Buchungs-/Storno-Mails: sofort oder gesammelt in der Tageszusammenfassung
+NOTIFICATION_MODES = {"instant":"Sofort", "daily":"Tägliche Zusammenfassung"}
+
+# Ereignisprotokoll: Ereignisse pro Verarbeitungsschritt, Länge der User-Historie
+EVENT_BATCH = 400
+EVENT_HISTORY = 50
+EVENT_SCAN_LIMIT = 5000  # Obergrenze für Ereignis-Abfragen ohne Composite-Index
+# Aufbau von views/user_stats; ältere Stände werden beim nächsten Einrechnen neu erzeugt
+VIEWS_SCHEMA = 2
+# Einträge pro Seite im persönlichen Schichtverlauf
+HISTORY_PAGE = 20
+# Vergangene Schichten, die user_stats neben den kommenden vorhält (für "Letzte Schicht" nach Stornos)
+RECENT_SHIFTS = 5
+
+# Composite-Indizes für list_bookings (Bereich auf slot_date + Gleichheit)
+REQUIRED_INDEXES = {
+    "bookings_status_date": ("status", "slot_date"),
+    "bookings_user_status_date": ("user_email", "status", "slot_date"),
 }
 
 COLORS = {
@@ -64,14 +148,27 @@ COLORS = {
     "orange": "#FF8C00", "orange_hell": "#FFA500"
 }
 
+def get_secret(key, default=None):
+    """Konfiguration aus Umgebungsvariable oder st.secrets (ohne secrets.toml: default)"""
+    if key in os.environ:
+        return os.environ[key]
+    try:
+        if not st.secrets.load_if_toml_exists():
+            return default
+        return st.secrets.get(key, default)
+    except Exception:
+        return default
+
 # ===== FIREBASE INIT =====
 @st.cache_resource
 def init_firestore():
     try:
-        if not hasattr(st, 'secrets'):
-            st.error("❌ Keine Secrets gefunden!")
-            st.stop()
-        key = st.secrets.get("firebase", {}).get("service_account_key")
+        if os.environ.get("FIRESTORE_EMULATOR_HOST"):
+            # Lokaler Firestore-Emulator (Tests/Lasttests): keine Credentials nötig
+            project = os.environ.get("GOOGLE_CLOUD_PROJECT","wasserwacht-local")
+            print(f"✅ Firestore-Emulator: {os.environ['FIRESTORE_EMULATOR_HOST']} ({project})")
+            return firestore.Client(credentials=AnonymousCredentials(), project=project)
+        key = get_secret("firebase", {}).get("service_account_key")
         if not key:
             st.error("❌ Firebase Service Account Key fehlt in Secrets!")
             st.stop()
@@ -82,7 +179,15 @@ def init_firestore():
         st.error(f"❌ Firebase Init Fehler: {e}")
         st.stop()
 
-db = init_firestore()
+@st.cache_resource
+def init_sqlite(path):
+    """Eine SQLite-Verbindung pro Prozess, serialisiert über ein Lock"""
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SQLITE_SCHEMA)
+    print(f"✅ SQLite geöffnet: {path}")
+    return conn, threading.RLock()
 
 # ===== HELPER FUNCTIONS =====
 def hash_pw(pw):
@@ -95,9 +200,17 @@ def week_start(d=None):
     return d - timedelta(days=d.weekday())
 
 def slot_date(ws, day):
-    days = {"monday":0,"tuesday":1,"wednesday":2,"thursday":3,"friday":4,"saturday":5,"sunday":6}
+    days = {d:i for i,d in enumerate(WEEKDAYS)}
     return (ws + timedelta(days=days.get(day,0))).strftime("%Y-%m-%d")
 
+def slot_hours(slot_time):
+    """Dauer eines Slots 'HH:MM-HH:MM' in Stunden (über Mitternacht berücksichtigt)"""
+    try:
+        start, end = (datetime.strptime(t.strip(), "%H:%M") for t in slot_time.split('-'))
+        return round(((end - start).seconds) / 3600, 2)
+    except (ValueError, AttributeError):
+        return 0
+
 def fmt_de(d):
     try:
         if isinstance(d, str):
@@ -106,28 +219,284 @@ def fmt_de(d):
     except:
         return str(d)
 
+# ===== FEIERTAGE & SPERRTAGE =====
+def easter_sunday(year):
+    """Ostersonntag (gregorianisch, Anonymer Algorithmus)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19*a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2*e + 2*i - h - k) % 7
+    m = (a + 11*h + 22*l) // 451
+    month, day = divmod(h + l - 7*m + 114, 31)
+    return date(year, month, day+1)
+
+@lru_cache(maxsize=None)
+def bavaria_holidays(year):
+    """Gesetzliche Feiertage in Bayern für ein beliebiges Jahr: {date: Name}"""
+    easter = easter_sunday(year)
+    return {
+        date(year,1,1): "Neujahr",
+        date(year,1,6): "Heilige Drei Könige",
+        easter-timedelta(days=2): "Karfreitag",
+        easter+timedelta(days=1): "Ostermontag",
+        date(year,5,1): "Tag der Arbeit",
+        easter+timedelta(days=39): "Christi Himmelfahrt",
+        easter+timedelta(days=50): "Pfingstmontag",
+        easter+timedelta(days=60): "Fronleichnam",
+        date(year,8,15): "Mariä Himmelfahrt",
+        date(year,10,3): "Tag der Deutschen Einheit",
+        date(year,11,1): "Allerheiligen",
+        date(year,12,25): "1. Weihnachtstag",
+        date(year,12,26): "2. Weihnachtstag",
+    }
+
+def summer_break_error(start, end):
+    """Fehlermeldung für einen Zeitraum oder None. MM-TT gilt jährlich (Ende vor Beginn = über Neujahr),
+    JJJJ-MM-TT einmalig"""
+    if len(start) == 5 and len(end) == 5:
+        try:
+            date.fromisoformat(f"2000-{start}"), date.fromisoformat(f"2000-{end}")  # Schaltjahr: 02-29 erlaubt
+        except ValueError:
+            return "kein gültiges Datum"
+        return None
+    if len(start) == 10 and len(end) == 10:
+        try:
+            if date.fromisoformat(start) > date.fromisoformat(end):
+                return "Ende liegt vor Beginn"
+        except ValueError:
+            return "kein gültiges Datum"
+        return None
+    return "Format MM-TT oder JJJJ-MM-TT (beide gleich)"
+
+def normalize_summer_breaks(ranges):
+    """Setting-Wert in ein hashbares Tupel ((start,end),...) umwandeln; ungültige Zeiträume entfallen"""
+    result = []
+    for r in ranges or []:
+        try:
+            start, end = (r.get('start',''), r.get('end','')) if isinstance(r, dict) else r
+            start, end = str(start).strip(), str(end).strip()
+        except (TypeError, ValueError):
+            continue
+        if summer_break_error(start, end) is None:
+            result.append((start, end))
+    return tuple(result)
+
+_summer_breaks_by_version = {}
+
+def current_summer_breaks():
+    """Sommerpausen aus dem Setting 'summer_breaks', je Settings-Version einmal normalisiert.
+    Wird bei jedem Aufruf geprüft, damit auch Scheduler- und Kiosk-Threads Änderungen sehen."""
+    version = data_versions().get('settings',0)
+    breaks = _summer_breaks_by_version.get(version)
+    if breaks is None:
+        ranges = cached_setting('summer_breaks', None)
+        breaks = normalize_summer_breaks(SUMMER_BREAKS_DEFAULT if ranges is None else ranges)
+        _summer_breaks_by_version.clear()
+        _summer_breaks_by_version[version] = breaks
+    return breaks
+
+def _expand_range(start, end):
+    d = start
+    while d <= end:
+        yield d.toordinal()
+        d += timedelta(days=1)
+
+def _month_day(year, md):
+    """'MM-TT' im Jahr year; 02-29 wird außerhalb von Schaltjahren zum 28.02."""
+    try:
+        return date.fromisoformat(f"{year}-{md}")
+    except ValueError:
+        return date(year, 2, 28)
+
+@lru_cache(maxsize=64)
+def summer_days(year, summer_breaks):
+    """Sommerpause-Tage eines Jahres als frozenset von Ordinalzahlen"""
+    days = set()
+    for start, end in summer_breaks:
+        if len(start) == 5:
+            s, e = _month_day(year, start), _month_day(year, end)
+            if s <= e:
+                days.update(_expand_range(s, e))
+            else:  # über Neujahr: Ende des Vorjahres-Zeitraums und Beginn des neuen
+                days.update(_expand_range(date(year,1,1), e))
+                days.update(_expand_range(s, date(year,12,31)))
+        else:
+            days.update(_expand_range(max(date.fromisoformat(start), date(year,1,1)),
+                                      min(date.fromisoformat(end), date(year,12,31))))
+    return frozenset(days)
+
+@lru_cache(maxsize=64)
+def blocked_days(year, summer_breaks):
+    """Gesperrte Tage eines Jahres als {ordinal: Grund} (Feiertag hat Vorrang)"""
+    index = dict.fromkeys(summer_days(year, summer_breaks), "Sommerpause")
+    for d in bavaria_holidays(year):
+        index[d.toordinal()] = "Feiertag"
+    return index
+
+@lru_cache(maxsize=4096)
+def _day_key(d):
+    """'YYYY-MM-DD' -> (Jahr, Ordinal); gecacht statt strptime pro Aufruf"""
+    d = date.fromisoformat(d[:10])
+    return d.year, d.toordinal()
+
+def _to_key(d):
+    if isinstance(d, str):
+        return _day_key(d)
+    if isinstance(d, datetime):
+        d = d.date()
+    return d.year, d.toordinal()
+
+def block_reason(d):
+    try:
+        year, o = _to_key(d)
+    except (ValueError, TypeError):
+        return None
+    return blocked_days(year, current_summer_breaks()).get(o)
+
+def is_blocked(d):
+    return block_reason(d) is not None
+
 def is_holiday(d):
-    if isinstance(d, date):
-        d = d.strftime("%Y-%m-%d")
-    return d in BAVARIA_HOLIDAYS.get(d[:4], [])
+    return block_reason(d) == "Feiertag"
 
 def is_summer(d):
     try:
-        if isinstance(d, str):
-            d = datetime.strptime(d, "%Y-%m-%d")
-        return 6 <= d.month <= 9
-    except:
+        year, o = _to_key(d)
+    except (ValueError, TypeError):
         return False
+    return o in summer_days(year, current_summer_breaks())
 
-def is_blocked(d):
-    return is_holiday(d) or is_summer(d)
+# ===== SLOT-KALENDER =====
+class SlotInstance(NamedTuple):
+    date: str
+    start: str
+    end: str
+    slot_id: object
+    capacity: int = 1
 
-def block_reason(d):
-    if is_holiday(d):
-        return "Feiertag"
-    elif is_summer(d):
-        return "Sommerpause"
-    return None
+    @property
+    def time(self):
+        return f"{self.start}-{self.end}"
+
+    @property
+    def day_name(self):
+        return WEEKDAY_NAMES[date.fromisoformat(self.date).weekday()]
+
+
+class SlotCalendar:
+    """Vorkompilierte, nach Datum sortierte Slot-Instanzen aus Slot-Templates.
+    Wird jahresweise erzeugt; Bereichsabfragen laufen per bisect."""
+
+    def __init__(self, templates):
+        self.templates = [t for t in templates if t.get('day') in WEEKDAYS and t.get('active', True)]
+        self._years = {}
+
+    def _compile_year(self, year):
+        if year in self._years:
+            return self._years[year]
+        jan1 = date(year,1,1)
+        instances = []
+        for t in self.templates:
+            first = jan1 + timedelta(days=(WEEKDAYS.index(t['day']) - jan1.weekday()) % 7)
+            valid_from = t.get('valid_from') or ''
+            valid_until = t.get('valid_until') or '9999-12-31'
+            for n in range(first.toordinal(), date(year,12,31).toordinal()+1, 7):
+                ds = date.fromordinal(n).isoformat()
+                if valid_from <= ds <= valid_until:
+                    instances.append(SlotInstance(ds, t['start'], t['end'], t['id'], int(t.get('capacity') or 1)))
+        instances.sort(key=lambda i: (i.date, i.start, i.end))
+        self._years[year] = (instances, [i.date for i in instances])
+        return self._years[year]
+
+    def between(self, start, end):
+        """Alle Slots mit start <= Datum <= end (ISO-Strings oder date)"""
+        start, end = str(start)[:10], str(end)[:10]
+        result = []
+        for year in range(int(start[:4]), int(end[:4])+1):
+            instances, dates = self._compile_year(year)
+            result.extend(instances[bisect_left(dates, start):bisect_right(dates, end)])
+        return result
+
+    def week(self, ws):
+        """Slots der Woche ab Montag ws"""
+        return self.between(ws, ws + timedelta(days=6))
+
+    def series(self, slot_id, start, end):
+        """Alle Termine eines Slot-Templates im Zeitraum, ohne Feiertage und Sommerpause"""
+        return [i for i in self.between(start, end) if i.slot_id == slot_id and not is_blocked(i.date)]
+
+# ===== ARCHIV-SEGMENTE (komprimiert, je Monat) =====
+class BlobStore(ABC):
+    """Ablage für Archiv-Segmente. LocalBlobStore schreibt ins Dateisystem; für flüchtige
+    Hosts (z.B. Streamlit Cloud) eine Unterklasse für einen Objektspeicher einhängen."""
+
+    @abstractmethod
+    def put(self, key, data):
+        ...
+
+    @abstractmethod
+    def get(self, key):
+        """Bytes oder None, wenn es den Schlüssel nicht gibt"""
+
+    @abstractmethod
+    def delete(self, key):
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+@st.cache_resource
+def archive_store():
+    """Blob-Store für Archiv-Segmente (ARCHIVE_PATH, Standard: lokales Verzeichnis)"""
+    path = get_secret("ARCHIVE_PATH", ".wasserwacht_archive")
+    print(f"✅ Archiv-Ablage: {os.path.abspath(path)}")
+    return LocalBlobStore(path)
+
+def write_segment(month, bookings):
+    """Buchungen eines Monats als gzip-JSONL ablegen; Rückgabe (Schlüssel, Bytes)"""
+    key = f"bookings/{month}.jsonl.gz"
+    lines = "".join(json.dumps(b, default=_snap_encode) + "\n"
+                    for b in sorted(bookings, key=lambda b: (b.get('slot_date', ''), b.get('slot_time', ''), b['id'])))
+    data = gzip.compress(lines.encode('utf-8'))
+    archive_store().put(key, data)
+    return key, len(data)
+
+def read_segment(key):
+    data = archive_store().get(key)
+    if data is None:
+        print(f"⚠️ Archiv-Segment fehlt: {key}")
+        return []
+    return [json.loads(line, object_hook=_snap_decode) for line in gzip.decompress(data).decode('utf-8').splitlines() if line]
 
 # ===== CSS INJECTION =====
 def inject_css(dark=False):
@@ -151,28 +520,577 @@ def inject_css(dark=False):
     .stTextInput input:focus {{border-color:{primary};box-shadow:0 0 0 2px {primary}40;}}
     </style>""", unsafe_allow_html=True)
 
-# ===== DATABASE CLASS =====
-class WasserwachtDB:
+# ===== DATABASE CLASSES =====
+class StorageBackend:
+    """Gemeinsame Schnittstelle aller Speicher-Backends (Firestore, SQLite).
+    Backend-spezifisch sind nur die Primitive; Auth, Statistik und Wochenansicht
+    bauen darauf auf."""
+    remote = False  # True: Netzwerk-Backend, lokaler Snapshot lohnt sich
+    
     def __init__(self):
-        self.db = db
         self._init_admin()
     
     def _init_admin(self):
         """Admin-User beim ersten Start erstellen"""
         if hasattr(st,'secrets'):
-            email = st.secrets.get("ADMIN_EMAIL","admin@wasserwacht.de")
-            pw = st.secrets.get("ADMIN_PASSWORD","admin123")
+            email = get_secret("ADMIN_EMAIL","admin@wasserwacht.de")
+            pw = get_secret("ADMIN_PASSWORD","admin123")
             if not self.get_user(email):
-                try:
-                    self.db.collection('users').add({
-                        'email':email,'name':'Admin','phone':'','password_hash':hash_pw(pw),
-                        'role':'admin','active':True,'email_notifications':True,
-                        'sms_notifications':False,'sms_booking_confirmation':True,
-                        'created_at':firestore.SERVER_TIMESTAMP
-                    })
+                ok,msg = self.create_user(email,'Admin','',pw,role='admin')
+                if ok:
                     print(f"✅ Admin erstellt: {email}")
-                except Exception as e:
-                    print(f"Admin-Erstellung fehlgeschlagen: {e}")
+                else:
+                    print(f"Admin-Erstellung fehlgeschlagen: {msg}")
+    
+    # --- Users ---
+    def get_user(self,email):
+        raise NotImplementedError
+    
+    def create_user(self,email,name,phone,password,role='user'):
+        raise NotImplementedError
+    
+    def get_all_users(self):
+        raise NotImplementedError
+    
+    def update_user(self,uid,**kwargs):
+        raise NotImplementedError
+    
+    @staticmethod
+    def _revoke_sessions(kwargs):
+        """Passwortwechsel oder Deaktivierung beendet alle Sitzungen des Users (Tokens mit älterem iat)"""
+        if 'password_hash' in kwargs or kwargs.get('active') is False:
+            return {**kwargs,'sessions_revoked_at':int(time.time()*1000)}
+        return kwargs
+    
+    def delete_user(self,email):
+        raise NotImplementedError
+    
+    def import_users(self,rows):
+        """Viele User auf einmal anlegen (rows: Dicts mit email,name,phone,role,active,password).
+        Dubletten werden gegen eine einmal geladene E-Mail-Menge geprüft, geschrieben wird
+        gebündelt. Fehlt das Passwort, wird eines erzeugt und muss beim Login geändert werden.
+        Rückgabe je Zeile {'row','email','status','message','password'}"""
+        try:
+            existing = {e.lower() for e in self._existing_emails()}
+        except Exception as e:
+            print(f"❌ import_users Fehler: {e}")
+            return [{'row':n,'email':str(r.get('email','')),'status':'error','message':str(e),'password':''}
+                    for n,r in enumerate(rows,start=1)]
+        results,docs = [],[]
+        for n,row in enumerate(rows,start=1):
+            email = str(row.get('email') or '').strip()
+            name = str(row.get('name') or '').strip()
+            role = str(row.get('role') or 'user').strip().lower()
+            password = str(row.get('password') or '').strip()
+            mode = str(row.get('notification_mode') or '').strip()
+            if '@' not in email:
+                error = "Ungültige E-Mail"
+            elif not name:
+                error = "Name fehlt"
+            elif role not in ('user','admin'):
+                error = f"Unbekannte Rolle '{role}'"
+            elif email.lower() in existing:
+                error = "E-Mail bereits registriert"
+            else:
+                error = None
+            if error:
+                results.append({'row':n,'email':email,'status':'error','message':error,'password':''})
+                continue
+            existing.add(email.lower())
+            generated = '' if password else secrets.token_urlsafe(9)
+            docs.append({
+                'email':email,'name':name,'phone':str(row.get('phone') or '').strip(),
+                'password_hash':hash_pw(password or generated),'role':role,
+                'active':str(row.get('active','true')).strip().lower() not in ('false','0','nein','no'),
+                'email_notifications':True,'sms_notifications':False,'sms_booking_confirmation':True,
+                'notification_mode':mode if mode in NOTIFICATION_MODES else 'instant',
+                'must_change_password':bool(generated)
+            })
+            results.append({'row':n,'email':email,'status':'ok','message':"angelegt",'password':generated})
+        if docs:
+            try:
+                self._insert_users(docs)
+                self._bump('users')
+                print(f"✅ {len(docs)} User importiert")
+            except Exception as e:
+                print(f"❌ import_users Fehler: {e}")
+                for r in results:
+                    if r['status'] == 'ok':
+                        r.update(status='error',message=str(e),password='')
+        return results
+    
+    def _existing_emails(self):
+        raise NotImplementedError
+    
+    def _insert_users(self,docs):
+        raise NotImplementedError
+    
+    def auth(self,email,password):
+        u = self.get_user(email)
+        if not u or not u.get('active',True):
+            return False,None
+        if u['password_hash'] == hash_pw(password):
+            return True,u
+        return False,None
+    
+    # --- Bookings ---
+    def list_bookings(self,status=None,date_from=None,date_to=None,user_email=None,fields=None):
+        """Buchungen gefiltert nach Status, Datumsbereich (inklusive) und User;
+        fields begrenzt die geladenen Felder (Projektion, 'id' ist immer dabei)"""
+        raise NotImplementedError
+    
+    def count_bookings(self,status=None,date_from=None,date_to=None,user_email=None):
+        return len(self.list_bookings(status,date_from,date_to,user_email,fields=['slot_date']))
+    
+    def count_users(self,active_only=True):
+        users = self.get_all_users()
+        return len([u for u in users if u.get('active',True)]) if active_only else len(users)
+    
+    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone,capacity=1):
+        """Slot buchen, solange weniger als capacity bestätigte Buchungen bestehen"""
+        raise NotImplementedError
+    
+    def get_booking(self,slot_date,slot_time):
+        raise NotImplementedError
+    
+    def create_series(self,slots,user_email,user_name,user_phone):
+        """Serie [(datum,zeit,plätze),...] atomar buchen; volle Termine werden übersprungen.
+        Rückgabe (True,{'booked':[...],'taken':[...]}) oder (False,Fehlermeldung)"""
+        raise NotImplementedError
+    
+    def cancel_booking(self,bid,cancelled_by,event='cancel'):
+        """Stornieren; event='override' kennzeichnet das Überschreiben durch einen Admin"""
+        raise NotImplementedError
+    
+    def archive_old(self,strict=False):
+        """Buchungen älter als 12 Monate archivieren; Rückgabe: Anzahl. strict=True lässt Fehler durch
+        (Scheduler-Jobs, damit das Job-Ledger sie protokolliert), sonst 0"""
+        raise NotImplementedError
+    
+    def index_status(self):
+        """Fehlende Indizes und Anzahl Fallback-Abfragen (nur Firestore)"""
+        return {'missing':[],'degraded_queries':0}
+    
+    def get_week_bookings(self,ws):
+        we = (datetime.strptime(ws,'%Y-%m-%d')+timedelta(days=6)).strftime('%Y-%m-%d')
+        return self.list_bookings(status='confirmed',date_from=ws,date_to=we)
+    
+    def get_user_bookings(self,email,future_only=False):
+        date_from = datetime.now().strftime("%Y-%m-%d") if future_only else None
+        bookings = self.list_bookings(status='confirmed',date_from=date_from,user_email=email)
+        return sorted(bookings,key=lambda x:x['slot_date'])
+    
+    # --- Datenversionen (meta/versions) ---
+    def get_versions(self):
+        """Zähler je Bereich ('bookings','users','settings','archive'), bei jedem Schreibzugriff erhöht"""
+        raise NotImplementedError
+    
+    def _bump_version(self,area):
+        raise NotImplementedError
+    
+    def subscribe_versions(self,callback):
+        """Änderungen an den Versionen abonnieren; None, wenn das Backend das nicht kann"""
+        return None
+    
+    def changes_since(self,since,date_from,date_to):
+        """Für den lokalen Snapshot: seit 'since' (updated_at) geänderte Users, Settings und
+        Buchungen; since=None lädt alles (Buchungen nur im Fenster)"""
+        raise NotImplementedError
+    
+    def _bump(self,area):
+        try:
+            self._bump_version(area)
+        except Exception as e:
+            print(f"⚠️ Version '{area}' nicht erhöht: {e}")
+        invalidate_versions()
+    
+    # --- Monatsübersichten (booking_months/{YYYY-MM}) ---
+    @staticmethod
+    def _empty_month(month):
+        return {'month':month,'days':{},'confirmed':0,'cancelled':0}
+    
+    @staticmethod
+    def slot_entries(summary,slot_date,slot_time):
+        """Buchungen eines Slots laut Monatsübersicht; ältere Übersichten speichern ein einzelnes Dict"""
+        entries = summary['days'].get(slot_date,{}).get(slot_time,[])
+        return [entries] if isinstance(entries,dict) else entries
+    
+    @staticmethod
+    def slot_refusal(entries,user_email,capacity):
+        """Grund, warum der Slot nicht (mehr) buchbar ist, sonst None"""
+        if any(e.get('user_email') == user_email for e in entries):
+            return "Slot bereits von dir gebucht"
+        if len(entries) >= capacity:
+            return "Slot bereits gebucht" if capacity == 1 else f"Slot bereits voll ({len(entries)}/{capacity})"
+        return None
+    
+    @staticmethod
+    def _slot_entry(booking,bid):
+        return {'id':bid,'user_name':booking.get('user_name',''),'user_email':booking.get('user_email','')}
+    
+    @classmethod
+    def _month_add(cls,summary,booking,bid):
+        entries = cls.slot_entries(summary,booking['slot_date'],booking['slot_time'])
+        summary['days'].setdefault(booking['slot_date'],{})[booking['slot_time']] = entries + [cls._slot_entry(booking,bid)]
+        summary['confirmed'] += 1
+    
+    @classmethod
+    def _month_set_slot(cls,summary,slot_date,slot_time,entries):
+        """Buchungen eines Slots in der Übersicht ersetzen (z.B. aus der Slot-Belegung) und
+        'confirmed' neu zählen"""
+        day = summary['days'].setdefault(slot_date,{})
+        if entries:
+            day[slot_time] = entries
+        else:
+            day.pop(slot_time,None)
+            if not day:
+                del summary['days'][slot_date]
+        summary['confirmed'] = sum(len(cls.slot_entries(summary,d,t)) for d,times in summary['days'].items() for t in times)
+    
+    @classmethod
+    def _month_cancel(cls,summary,booking,bid):
+        day = summary['days'].get(booking['slot_date'],{})
+        entries = [e for e in cls.slot_entries(summary,booking['slot_date'],booking['slot_time']) if e.get('id') != bid]
+        if entries:
+            day[booking['slot_time']] = entries
+        elif booking['slot_time'] in day:
+            del day[booking['slot_time']]
+            if not day:
+                del summary['days'][booking['slot_date']]
+        summary['confirmed'] = max(0,summary['confirmed']-1)
+        summary['cancelled'] += 1
+    
+    @classmethod
+    def _build_month(cls,month,bookings):
+        summary = cls._empty_month(month)
+        for b in sorted(bookings,key=lambda x:(x['slot_date'],x.get('slot_time',''))):
+            if b.get('status') == 'confirmed':
+                cls._month_add(summary,b,b['id'])
+            elif b.get('status') == 'cancelled':
+                summary['cancelled'] += 1
+        return summary
+    
+    def get_month_summary(self,month,strict=False):
+        """Materialisierte Monatsübersicht {'days':{datum:{zeit:[{id,user_name,user_email},...]}},
+        'confirmed','cancelled'}; fehlt sie noch, wird sie einmalig aus den Buchungen erzeugt.
+        Bei Fehlern leere Übersicht, mit strict=True Exception"""
+        raise NotImplementedError
+    
+    def _summary_source(self):
+        """Alle Buchungen inkl. Archiv (slot_date, slot_time, user_name, user_email, status)"""
+        raise NotImplementedError
+    
+    def _save_months(self,summaries):
+        raise NotImplementedError
+    
+    def rebuild_month_summaries(self,months=None):
+        """Monatsübersichten aus Buchungen und Archiv neu aufbauen (Backfill/Reparatur)"""
+        try:
+            grouped = {}
+            for b in self._summary_source():
+                grouped.setdefault(b['slot_date'][:7],[]).append(b)
+            if months:
+                grouped = {m:grouped.get(m,[]) for m in months}
+            self._save_months([self._build_month(m,b) for m,b in sorted(grouped.items())])
+            self._bump('bookings')
+            print(f"✅ {len(grouped)} Monatsübersichten neu aufgebaut")
+            return len(grouped)
+        except Exception as e:
+            print(f"❌ rebuild_month_summaries Fehler: {e}")
+            return 0
+    
+    # --- Archiv (komprimierte Monats-Segmente statt Archiv-Collection) ---
+    def archive_index(self,strict=False):
+        """{YYYY-MM:{'key','count','bytes','updated'}} - welches Segment welchen Monat enthält.
+        Liegt außerhalb der Settings (eigener Versionsbereich 'archive'), damit ein Archivlauf
+        nicht Slot-Kalender, Settings-Cache und Kiosk-ETags ungültig macht"""
+        try:
+            index = self._load_archive_index()
+            if index is None:
+                # Ältere Installationen: Index lag in den Settings, wird beim nächsten Archivlauf übernommen
+                index = self.get_setting('archive_index',{}) or {}
+            return index
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ archive_index Fehler: {e}")
+            return {}
+    
+    def _load_archive_index(self):
+        """Gespeicherter Archiv-Index oder None, wenn noch keiner angelegt ist"""
+        raise NotImplementedError
+    
+    def _save_archive_index(self,index):
+        raise NotImplementedError
+    
+    def archived_bookings(self,month):
+        """Archivierte Buchungen eines Monats; liest genau ein Segment"""
+        entry = self.archive_index().get(month)
+        return read_segment(entry['key']) if entry else []
+    
+    def _archived_all(self):
+        index = self.archive_index()
+        for month in sorted(index):
+            yield from read_segment(index[month]['key'])
+    
+    def _write_archive(self,bookings):
+        """Buchungen in die Monats-Segmente übernehmen (bestehende Segmente werden per ID ergänzt,
+        ein erneuter Lauf nach Abbruch ist daher unschädlich) und den Index aktualisieren"""
+        index = self.archive_index(strict=True)
+        grouped = {}
+        for b in bookings:
+            grouped.setdefault(b['slot_date'][:7],{})[b['id']] = b
+        for month,items in sorted(grouped.items()):
+            merged = {b['id']:b for b in read_segment(index[month]['key'])} if month in index else {}
+            merged.update(items)
+            key,size = write_segment(month,list(merged.values()))
+            index[month] = {'key':key,'count':len(merged),'bytes':size,
+                            'updated':datetime.now(TZ).isoformat(timespec='seconds')}
+        self._save_archive_index(index)
+        self._bump('archive')
+    
+    # --- Ereignisprotokoll (booking_events) und abgeleitete Sichten ---
+    @staticmethod
+    def _event(kind,bid,booking,by):
+        """Unveränderliches Ereignis; wird in derselben Transaktion wie die Buchung geschrieben"""
+        return {'type':kind,'booking_id':bid,'slot_date':booking['slot_date'],'slot_time':booking['slot_time'],
+                'user_email':booking.get('user_email',''),'user_name':booking.get('user_name',''),
+                'status':booking.get('status',''),'by':by}
+    
+    @staticmethod
+    def _empty_user_stats(email,name=''):
+        return {'email':email,'name':name,'confirmed':0,'cancelled':0,'hours':0,'years':{},
+                'shifts':[],'history':[]}
+    
+    @staticmethod
+    def _count_shift(user,booking,bid,sign):
+        """Bestätigte Schicht (+1) bzw. Storno (-1) in Stunden, Jahreswerte und Schichtliste einrechnen.
+        'shifts' hält alle kommenden und die RECENT_SHIFTS letzten vergangenen Schichten"""
+        hours = slot_hours(booking.get('slot_time',''))
+        year = user['years'].setdefault(booking['slot_date'][:4],{'shifts':0,'hours':0})
+        year['shifts'] += sign
+        year['hours'] = round(year['hours']+sign*hours,2)
+        user['hours'] = round(user['hours']+sign*hours,2)
+        shifts = [s for s in user['shifts'] if s['booking_id'] != bid]
+        if sign > 0:
+            shifts.append({'booking_id':bid,'slot_date':booking['slot_date'],'slot_time':booking.get('slot_time','')})
+        shifts.sort(key=lambda s:(s['slot_date'],s['slot_time']))
+        today = datetime.now(TZ).strftime('%Y-%m-%d')
+        past = sum(1 for s in shifts if s['slot_date'] < today)
+        user['shifts'] = shifts[max(0,past-RECENT_SHIFTS):]
+    
+    @classmethod
+    def _fold_event(cls,views,users,event):
+        """Ein Ereignis in Scoreboard, Monatszähler und User-Historie einrechnen"""
+        email = event.get('user_email','')
+        user = users.setdefault(email,cls._empty_user_stats(email))
+        score = views['scoreboard'].setdefault(email,{'name':event.get('user_name',''),'count':0})
+        month = views['months'].setdefault(event['slot_date'][:7],{'confirmed':0,'cancelled':0})
+        if event['type'] == 'create':
+            score['count'] += 1
+            month['confirmed'] += 1
+            user['confirmed'] += 1
+            cls._count_shift(user,event,event['booking_id'],1)
+            score['name'] = user['name'] = event.get('user_name','') or user['name']
+        elif event['type'] in ('cancel','override'):
+            score['count'] -= 1
+            month['confirmed'] = max(0,month['confirmed']-1)
+            month['cancelled'] += 1
+            user['confirmed'] = max(0,user['confirmed']-1)
+            user['cancelled'] += 1
+            cls._count_shift(user,event,event['booking_id'],-1)
+        elif event['type'] == 'archive' and event.get('status') == 'confirmed':
+            # Scoreboard zählt nur nicht archivierte Buchungen
+            score['count'] -= 1
+        if score['count'] <= 0:
+            del views['scoreboard'][email]
+        if event['type'] != 'archive':
+            entry = {k:event.get(k) for k in ('type','booking_id','slot_date','slot_time','by','at')}
+            user['history'] = ([entry]+user['history'])[:EVENT_HISTORY]
+        views['events'] += 1
+    
+    def _seed_views(self):
+        """Erstbefüllung aus dem aktuellen Datenbestand, für Buchungen aus der Zeit vor dem Protokoll"""
+        views = {'offset':None,'events':0,'scoreboard':{},'months':{},'schema':VIEWS_SCHEMA}
+        users = {}
+        for b in self.list_bookings(status='confirmed',fields=['user_name','user_email']):
+            score = views['scoreboard'].setdefault(b.get('user_email',''),{'name':b.get('user_name',''),'count':0})
+            score['count'] += 1
+        for b in self._summary_source():
+            status = b.get('status')
+            if status not in ('confirmed','cancelled'):
+                continue
+            views['months'].setdefault(b['slot_date'][:7],{'confirmed':0,'cancelled':0})[status] += 1
+            user = users.setdefault(b.get('user_email',''),self._empty_user_stats(b.get('user_email',''),b.get('user_name','')))
+            user[status] += 1
+            if status == 'confirmed':
+                self._count_shift(user,b,b['id'],1)
+        users.pop('',None)
+        return views,users
+    
+    def fold_events(self,strict=False):
+        """Neue Ereignisse ab dem gespeicherten Offset in die Sichten einrechnen (O(neue Ereignisse));
+        Rückgabe: Anzahl verarbeiteter Ereignisse (bei Fehlern 0, mit strict=True Exception)"""
+        raise NotImplementedError
+    
+    def get_views(self):
+        """{'scoreboard':{email:{name,count}},'months':{YYYY-MM:{confirmed,cancelled}},'events':n}"""
+        raise NotImplementedError
+    
+    def get_user_stats(self,email):
+        """{'confirmed','cancelled','hours','years':{JJJJ:{shifts,hours}},'shifts':[kommende + letzte],
+        'history':[letzte EVENT_HISTORY Ereignisse]} eines Users (ein Dokument)"""
+        raise NotImplementedError
+    
+    @staticmethod
+    def _history_page(bookings,cursor,limit):
+        """Seite aus nach (Datum,ID) absteigend sortierten Buchungen ab cursor={'date','ids'}"""
+        if cursor:
+            seen = set(cursor['ids'])
+            bookings = [b for b in bookings if b['slot_date'] < cursor['date']
+                        or (b['slot_date'] == cursor['date'] and b['id'] not in seen)]
+        page = bookings[:limit]
+        if len(bookings) <= limit:
+            return page,None
+        last = page[-1]['slot_date']
+        ids = [b['id'] for b in page if b['slot_date'] == last]
+        if cursor and cursor['date'] == last:
+            ids += cursor['ids']
+        return page,{'date':last,'ids':ids}
+    
+    def user_history(self,email,before,cursor=None,limit=HISTORY_PAGE):
+        """Bestätigte Schichten vor 'before', neueste zuerst, seitenweise.
+        Rückgabe (buchungen, cursor der nächsten Seite oder None)"""
+        bookings = self.list_bookings(status='confirmed',date_to=before,user_email=email)
+        bookings = [b for b in bookings if b['slot_date'] < before]
+        bookings.sort(key=lambda b:(b['slot_date'],b['id']),reverse=True)
+        return self._history_page(bookings,cursor,limit)
+    
+    def list_events(self,booking_id=None,user_email=None,limit=200):
+        """Audit-Trail: Ereignisse, neueste zuerst"""
+        raise NotImplementedError
+    
+    def reset_views(self):
+        """Sichten verwerfen; der nächste fold_events() baut sie aus dem Bestand neu auf"""
+        raise NotImplementedError
+    
+    # --- Benachrichtigungs-Warteschlange (Tageszusammenfassung) ---
+    def queue_notification(self,recipient,item):
+        """Eintrag {'line','at'} für die nächste Zusammenfassung an recipient vormerken"""
+        raise NotImplementedError
+    
+    def pending_notifications(self):
+        """Alle vorgemerkten Einträge inkl. 'id' und 'recipient'"""
+        raise NotImplementedError
+    
+    def delete_notifications(self,ids):
+        raise NotImplementedError
+    
+    # --- Job-Ledger und Idempotenz-Schlüssel ---
+    def begin_job_run(self,job,scheduled_for,stale_after):
+        """Lauf für (job, geplanter Termin) beginnen. False, wenn er schon erfolgreich war oder
+        gerade läuft (jünger als stale_after Sekunden); abgebrochene/fehlerhafte Läufe werden übernommen"""
+        raise NotImplementedError
+    
+    def finish_job_run(self,job,scheduled_for,status,items,error,duration_ms):
+        raise NotImplementedError
+    
+    def list_job_runs(self,limit=200):
+        """Letzte Läufe, neueste zuerst: {'job','scheduled_for','status','started_at','finished_at',
+        'duration_ms','items','error','attempts'}"""
+        raise NotImplementedError
+    
+    def claim_key(self,key):
+        """Schlüssel atomar belegen; False, wenn er schon belegt ist (Aktion bereits erledigt)"""
+        raise NotImplementedError
+    
+    def release_key(self,key):
+        raise NotImplementedError
+    
+    def purge_keys(self,before):
+        """Schlüssel, die vor 'before' (ISO-Zeit) belegt wurden, löschen"""
+        raise NotImplementedError
+    
+    @staticmethod
+    def _job_run_id(job,scheduled_for):
+        return f"{job}_{scheduled_for}".replace('/','-')
+    
+    @staticmethod
+    def _job_run_blocked(run,stale_after):
+        if run.get('status') == 'ok':
+            return True
+        cutoff = (datetime.now(TZ)-timedelta(seconds=stale_after)).isoformat(timespec='seconds')
+        return run.get('status') == 'running' and run.get('started_at','') > cutoff
+    
+    @staticmethod
+    def _job_run_start(job,scheduled_for,run):
+        return {'job':job,'scheduled_for':scheduled_for,'status':'running',
+                'started_at':datetime.now(TZ).isoformat(timespec='seconds'),'finished_at':None,
+                'duration_ms':None,'items':None,'error':None,'attempts':run.get('attempts',0)+1}
+    
+    # --- Settings & Slots ---
+    def get_setting(self,key,default=''):
+        raise NotImplementedError
+    
+    def set_setting(self,key,value):
+        raise NotImplementedError
+    
+    def get_slot_templates(self):
+        raise NotImplementedError
+    
+    def add_slot_template(self,day,start,end,valid_from=None,valid_until=None,capacity=1):
+        raise NotImplementedError
+    
+    def update_slot_template(self,tid,**kwargs):
+        raise NotImplementedError
+    
+    def get_stats(self):
+        """FIX: Robuste Statistiken mit Fehlerbehandlung"""
+        try:
+            today = datetime.now().strftime("%Y-%m-%d")
+            horizon = (datetime.now()+timedelta(days=27)).strftime("%Y-%m-%d")
+            months = sorted({today[:7],horizon[:7]})
+            
+            # Unabhängige Abfragen parallel: User, kommende Buchungen, Monatsübersichten
+            data = fetch_all(total_users=self.count_users,
+                             future_bookings=lambda: self.count_bookings(status='confirmed',date_from=today),
+                             **{m:(lambda m=m: self.get_month_summary(m)) for m in months})
+            total_users = data['total_users']
+            future_bookings = data['future_bookings']
+            
+            # Month Bookings + Free Slots aus den Monatsübersichten (max. 2 Dokumente)
+            summaries = {m:data[m] for m in months}
+            month_bookings = summaries[today[:7]]['confirmed']
+            free_slots = []
+            for inst in slot_calendar().between(today, horizon):
+                taken = len(self.slot_entries(summaries[inst.date[:7]],inst.date,inst.time))
+                if not is_blocked(inst.date) and taken < inst.capacity:
+                    free_slots.append({
+                        'date':inst.date,
+                        'slot':f"{inst.day_name} {inst.time}" + (f" ({taken}/{inst.capacity} belegt)" if inst.capacity > 1 else "")
+                    })
+            
+            return {
+                'total_users':total_users,
+                'future_bookings':future_bookings,
+                'month_bookings':month_bookings,
+                'free_slots_next_4weeks':free_slots
+            }
+        except Exception as e:
+            print(f"❌ get_stats Fehler: {e}")
+            return {'total_users':0,'future_bookings':0,'month_bookings':0,'free_slots_next_4weeks':[]}
+
+
+class WasserwachtDB(StorageBackend):
+    """Firestore-Backend"""
+    remote = True
+    
+    def __init__(self,client):
+        self.db = client
+        self.index_state = firestore_index_state()
+        super().__init__()
+        if not self.index_state['indexes']:
+            self._probe_indexes()
     
     def get_user(self,email):
         try:
@@ -192,22 +1110,16 @@ class WasserwachtDB:
             self.db.collection('users').add({
                 'email':email,'name':name,'phone':phone,'password_hash':hash_pw(password),
                 'role':role,'active':True,'email_notifications':True,'sms_notifications':False,
-                'sms_booking_confirmation':True,'created_at':firestore.SERVER_TIMESTAMP
+                'sms_booking_confirmation':True,'created_at':firestore.SERVER_TIMESTAMP,
+                'updated_at':firestore.SERVER_TIMESTAMP
             })
+            self._bump('users')
             print(f"✅ User erstellt: {email}")
             return True,"Registrierung erfolgreich"
         except Exception as e:
             print(f"❌ create_user Fehler: {e}")
             return False,str(e)
     
-    def auth(self,email,password):
-        u = self.get_user(email)
-        if not u or not u.get('active',True):
-            return False,None
-        if u['password_hash'] == hash_pw(password):
-            return True,u
-        return False,None
-    
     def get_all_users(self):
         try:
             users = []
@@ -222,7 +1134,8 @@ class WasserwachtDB:
     
     def update_user(self,uid,**kwargs):
         try:
-            self.db.collection('users').document(uid).update(kwargs)
+            self.db.collection('users').document(uid).update({**self._revoke_sessions(kwargs),'updated_at':firestore.SERVER_TIMESTAMP})
+            self._bump('users')
             print(f"✅ User geupdatet: {uid}")
             return True
         except Exception as e:
@@ -234,6 +1147,7 @@ class WasserwachtDB:
             u = self.get_user(email)
             if u:
                 self.db.collection('users').document(u['id']).delete()
+                self._bump('users')
                 print(f"✅ User gelöscht: {email}")
                 return True
             return False
@@ -241,93 +1155,606 @@ class WasserwachtDB:
             print(f"❌ delete_user Fehler: {e}")
             return False
     
-    # FIX: Robuste get_week_bookings mit Fallback
-    def get_week_bookings(self, ws):
-        """CRITICAL: Option C - Optimiert mit Fallback"""
+    def _existing_emails(self):
+        return [doc.get('email') or '' for doc in self.db.collection('users').select(['email']).stream()]
+    
+    def _insert_users(self,docs):
+        # WriteBatch erlaubt höchstens 500 Schreibvorgänge
+        for i in range(0,len(docs),500):
+            batch = self.db.batch()
+            for data in docs[i:i+500]:
+                batch.set(self.db.collection('users').document(),{
+                    **data,'created_at':firestore.SERVER_TIMESTAMP,'updated_at':firestore.SERVER_TIMESTAMP
+                })
+            batch.commit()
+    
+    def _probe_indexes(self):
+        """Composite-Indizes einmal pro Prozess prüfen (je eine Query mit limit(1))"""
+        with self.index_state['lock']:
+            if self.index_state['indexes']:
+                return
+            probe_date = datetime.now().strftime("%Y-%m-%d")
+            for name,fields in REQUIRED_INDEXES.items():
+                q = self.db.collection('bookings').where('slot_date','>=',probe_date)
+                for f in fields:
+                    if f != 'slot_date':
+                        q = q.where(f,'==','_probe_')
+                try:
+                    list(q.limit(1).stream())
+                    self.index_state['indexes'][frozenset(fields)] = True
+                except FailedPrecondition as e:
+                    self.index_state['indexes'][frozenset(fields)] = False
+                    print(f"⚠️ Firestore-Index fehlt: {name} {fields} ({e})")
+                except Exception as e:
+                    print(f"⚠️ Index-Prüfung {name} fehlgeschlagen: {e}")
+    
+    def index_status(self):
+        state = self.index_state
+        missing = [n for n,f in REQUIRED_INDEXES.items() if state['indexes'].get(frozenset(f)) is False]
+        return {'missing':missing,'degraded_queries':state['degraded_queries']}
+    
+    # FIX: Robuste Abfrage mit Fallback
+    def list_bookings(self,status=None,date_from=None,date_to=None,user_email=None,fields=None):
+        """Indexierte Query, falls der Composite-Index existiert; sonst begrenzter
+        Fallback über einen Einzelfeld-Index (slot_date-Bereich bzw. user_email)"""
+        return self._bookings_query(status,date_from,date_to,user_email,fields)
+    
+    def count_bookings(self,status=None,date_from=None,date_to=None,user_email=None):
+        """Aggregation count() statt Dokumente zu laden"""
+        return self._bookings_query(status,date_from,date_to,user_email,count=True)
+    
+    def count_users(self,active_only=True):
         try:
-            # Versuch 1: Optimierte Query mit Index
-            we = (datetime.strptime(ws,'%Y-%m-%d')+timedelta(days=6)).strftime('%Y-%m-%d')
+            users = self.db.collection('users')
+            total = users.count(alias='n').get()[0][0].value
+            if active_only:
+                total -= users.where('active','==',False).count(alias='n').get()[0][0].value
+            return total
+        except Exception as e:
+            print(f"⚠️ count_users Aggregation fehlgeschlagen: {e}")
+            return super().count_users(active_only)
+    
+    def _bookings_query(self,status=None,date_from=None,date_to=None,user_email=None,fields=None,count=False):
+        exact = date_from and date_from == date_to
+        equals = {f:v for f,v in (('status',status),('user_email',user_email)) if v}
+        indexed = frozenset(equals) | ({'slot_date'} if (date_from or date_to) and not exact else set())
+        needs_index = len(indexed) > 1 and 'slot_date' in indexed
+        
+        def stream(q,mask=None):
+            if mask:
+                q = q.select(sorted(set(mask)))
             result = []
-            for doc in self.db.collection('bookings')\
-                    .where('slot_date','>=',ws)\
-                    .where('slot_date','<=',we)\
-                    .where('status','==','confirmed').stream():
+            for doc in q.stream():
                 data = doc.to_dict()
                 data['id'] = doc.id
                 result.append(data)
-            print(f"✅ get_week_bookings: {len(result)} Buchungen geladen (optimiert)")
             return result
+        
+        def date_range(q):
+            if exact:
+                return q.where('slot_date','==',date_from)
+            if date_from:
+                q = q.where('slot_date','>=',date_from)
+            if date_to:
+                q = q.where('slot_date','<=',date_to)
+            return q
+        
+        try:
+            if not needs_index or self.index_state['indexes'].get(indexed,True):
+                q = date_range(self.db.collection('bookings'))
+                for f,v in equals.items():
+                    q = q.where(f,'==',v)
+                try:
+                    if count:
+                        return q.count(alias='n').get()[0][0].value
+                    return stream(q,fields)
+                except FailedPrecondition as e:
+                    self.index_state['indexes'][indexed] = False
+                    print(f"⚠️ Firestore-Index fehlt für {sorted(indexed)}: {e}")
+            
+            # Fallback: nur Einzelfeld-Filter, Rest clientseitig
+            with self.index_state['lock']:
+                self.index_state['degraded_queries'] += 1
+            q = self.db.collection('bookings')
+            q = q.where('user_email','==',user_email) if user_email else date_range(q)
+            mask = None if fields is None else [*fields,'slot_date',*equals]
+            result = [b for b in stream(q,mask)
+                      if all(b.get(f) == v for f,v in equals.items())
+                      and (not date_from or b.get('slot_date','') >= date_from)
+                      and (not date_to or b.get('slot_date','') <= date_to)]
+            print(f"⚠️ list_bookings: {len(result)} Buchungen geladen (Fallback ohne Index)")
+            return len(result) if count else result
         except Exception as e:
-            print(f"⚠️ Optimierte Query fehlgeschlagen: {e}")
-            # Fallback: Einfache Query ohne Index
-            try:
-                result = []
-                for doc in self.db.collection('bookings').where('status','==','confirmed').stream():
-                    b = doc.to_dict()
-                    if ws <= b.get('slot_date','') <= we:
-                        b['id'] = doc.id
-                        result.append(b)
-                print(f"✅ get_week_bookings: {len(result)} Buchungen geladen (Fallback)")
-                return result
-            except Exception as e2:
-                print(f"❌ Fallback Query fehlgeschlagen: {e2}")
-                return []
-    
-    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone):
-        try:
-            existing = self.get_booking(slot_date,slot_time)
-            if existing:
-                return False,"Slot bereits gebucht"
-            self.db.collection('bookings').add({
-                'slot_date':slot_date,'slot_time':slot_time,'user_email':user_email,
-                'user_name':user_name,'user_phone':user_phone,'status':'confirmed',
-                'created_at':firestore.SERVER_TIMESTAMP
-            })
-            print(f"✅ Buchung erstellt: {user_name} | {slot_date} {slot_time}")
-            return True,"Buchung erfolgreich"
+            print(f"❌ list_bookings Fehler: {e}")
+            return 0 if count else []
+    
+    def get_versions(self):
+        try:
+            doc = self.db.collection('meta').document('versions').get()
+            return doc.to_dict() if doc.exists else {}
         except Exception as e:
-            print(f"❌ create_booking Fehler: {e}")
-            return False,str(e)
+            print(f"❌ get_versions Fehler: {e}")
+            return {}
     
-    def get_booking(self,slot_date,slot_time):
+    def _bump_version(self,area):
+        self.db.collection('meta').document('versions').set({area:firestore.Increment(1)},merge=True)
+    
+    def subscribe_versions(self,callback):
         try:
-            for doc in self.db.collection('bookings').where('slot_date','==',slot_date)\
-                    .where('slot_time','==',slot_time).where('status','==','confirmed').limit(1).stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                return data
-            return None
+            return self.db.collection('meta').document('versions').on_snapshot(
+                lambda docs,changes,read_time: [callback(d.to_dict() or {}) for d in docs])
         except Exception as e:
-            print(f"❌ get_booking Fehler: {e}")
+            print(f"⚠️ meta/versions nicht abonnierbar, lese pro Rerun: {e}")
             return None
     
-    def get_user_bookings(self,email,future_only=False):
-        try:
-            q = self.db.collection('bookings').where('user_email','==',email).where('status','==','confirmed')
-            if future_only:
-                q = q.where('slot_date','>=',datetime.now().strftime("%Y-%m-%d"))
-            bookings = []
+    def changes_since(self,since,date_from,date_to):
+        def docs(q):
+            result = {}
             for doc in q.stream():
-                data = doc.to_dict()
-                data['id'] = doc.id
-                bookings.append(data)
-            return sorted(bookings,key=lambda x:x['slot_date'])
-        except Exception as e:
-            print(f"❌ get_user_bookings Fehler: {e}")
-            return []
+                result[doc.id] = doc.to_dict()
+            return result
+        
+        users,settings,bookings = (self.db.collection(c) for c in ('users','settings','bookings'))
+        if since is None:
+            bookings = bookings.where('slot_date','>=',date_from).where('slot_date','<=',date_to)
+        else:
+            # Nur Einzelfeld-Index auf updated_at; Fenster wird clientseitig gefiltert
+            users,settings,bookings = (q.where('updated_at','>',since) for q in (users,settings,bookings))
+        bookings = {i:b for i,b in docs(bookings).items() if date_from <= b.get('slot_date','') <= date_to}
+        return {'users':docs(users),'settings':docs(settings),'bookings':bookings}
     
-    def cancel_booking(self,bid,cancelled_by):
+    def _month_bookings(self,month,transaction=None):
+        q = self.db.collection('bookings').where('slot_date','>=',f"{month}-01").where('slot_date','<=',f"{month}-31")
+        result = []
+        for doc in q.select(['slot_date','slot_time','user_name','user_email','status']).stream(transaction=transaction):
+            data = doc.to_dict()
+            data['id'] = doc.id
+            result.append(data)
+        return result
+    
+    def get_month_summary(self,month,strict=False):
         try:
-            self.db.collection('bookings').document(bid).update({
-                'status':'cancelled','cancelled_by':cancelled_by,
-                'cancelled_at':firestore.SERVER_TIMESTAMP
-            })
+            ref = self.db.collection('booking_months').document(month)
+            doc = ref.get()
+            if doc.exists:
+                return doc.to_dict()
+            summary = self._build_month(month,self._month_bookings(month))
+            try:
+                ref.create(summary)
+            except AlreadyExists:
+                return ref.get().to_dict()
+            return summary
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ get_month_summary Fehler: {e}")
+            return self._empty_month(month)
+    
+    def _summary_source(self):
+        fields = ['slot_date','slot_time','user_name','user_email','status']
+        for name in ('bookings','archive'):
+            for doc in self.db.collection(name).select(fields).stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                if data.get('slot_date'):
+                    yield data
+        yield from self._archived_all()
+    
+    def _save_months(self,summaries):
+        for i in range(0,len(summaries),500):
+            batch = self.db.batch()
+            for summary in summaries[i:i+500]:
+                batch.set(self.db.collection('booking_months').document(summary['month']),summary)
+            batch.commit()
+    
+    # --- Slot-Belegung (slot_occupancy/{datum}_{zeit}) ---
+    def _occupancy_ref(self,slot_date,slot_time):
+        return self.db.collection('slot_occupancy').document(f"{slot_date}_{slot_time}")
+    
+    def _occupancy_in_transaction(self,ref,slot_date,slot_time,transaction):
+        """Belegung eines Slots {'slot_date','slot_time','capacity','entries'}; Sperre gegen Überbuchung.
+        Fehlt das Dokument, wird es aus den bestätigten Buchungen des Slots erzeugt"""
+        doc = ref.get(transaction=transaction)
+        if doc.exists:
+            return doc.to_dict()
+        q = self.db.collection('bookings').where('slot_date','==',slot_date).where('slot_time','==',slot_time)\
+            .where('status','==','confirmed')
+        entries = [self._slot_entry(d.to_dict(),d.id) for d in q.select(['user_name','user_email']).stream(transaction=transaction)]
+        return {'slot_date':slot_date,'slot_time':slot_time,'capacity':None,'entries':entries}
+    
+    def _refresh_months(self,slots,cancelled=0):
+        """Monatsübersichten (abgeleitete Sicht) nach dem Commit aus der Slot-Belegung nachziehen.
+        Die Belegung wird in derselben Transaktion gelesen, ein älterer Stand überschreibt daher nie
+        einen neueren. Fehler lassen die Buchung bestehen; rebuild_month_summaries repariert"""
+        by_month = {}
+        for slot in sorted(set(slots)):
+            by_month.setdefault(slot[0][:7],[]).append(slot)
+        for month,month_slots in by_month.items():
+            month_ref = self.db.collection('booking_months').document(month)
+            
+            @firestore.transactional
+            def refresh(transaction):
+                doc = month_ref.get(transaction=transaction)
+                # Neu erzeugte Übersicht enthält die Stornierung bereits
+                summary = doc.to_dict() if doc.exists else self._build_month(month,self._month_bookings(month,transaction))
+                for sd,stime in month_slots:
+                    occupancy = self._occupancy_ref(sd,stime).get(transaction=transaction)
+                    self._month_set_slot(summary,sd,stime,occupancy.to_dict().get('entries',[]) if occupancy.exists else [])
+                summary['cancelled'] += cancelled if doc.exists else 0
+                transaction.set(month_ref,summary)
+            
+            try:
+                refresh(self.db.transaction())
+            except Exception as e:
+                print(f"⚠️ Monatsübersicht {month} nicht aktualisiert: {e}")
+    
+    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone,capacity=1):
+        """Buchung und Slot-Belegung in einer Transaktion; die Belegung des einen Slots dient
+        als Sperre gegen Überbuchung, die Monatsübersicht wird nach dem Commit nachgezogen"""
+        try:
+            occupancy_ref = self._occupancy_ref(slot_date,slot_time)
+            booking_ref = self.db.collection('bookings').document()
+            data = {
+                'slot_date':slot_date,'slot_time':slot_time,'user_email':user_email,
+                'user_name':user_name,'user_phone':user_phone,'status':'confirmed',
+                'created_at':firestore.SERVER_TIMESTAMP,'updated_at':firestore.SERVER_TIMESTAMP
+            }
+            
+            @firestore.transactional
+            def book(transaction):
+                occupancy = self._occupancy_in_transaction(occupancy_ref,slot_date,slot_time,transaction)
+                refusal = self.slot_refusal(occupancy['entries'],user_email,capacity)
+                if refusal:
+                    return refusal
+                occupancy['entries'].append(self._slot_entry(data,booking_ref.id))
+                transaction.set(booking_ref,data)
+                transaction.set(occupancy_ref,{**occupancy,'capacity':capacity,'updated_at':firestore.SERVER_TIMESTAMP})
+                transaction.set(self.db.collection('booking_events').document(),
+                                {**self._event('create',booking_ref.id,data,user_email),'at':firestore.SERVER_TIMESTAMP})
+                return None
+            
+            refusal = book(self.db.transaction())
+            if refusal:
+                return False,refusal
+            self._refresh_months([(slot_date,slot_time)])
+            self._bump('bookings')
+            print(f"✅ Buchung erstellt: {user_name} | {slot_date} {slot_time}")
+            return True,"Buchung erfolgreich"
+        except Exception as e:
+            print(f"❌ create_booking Fehler: {e}")
+            return False,str(e)
+    
+    def create_series(self,slots,user_email,user_name,user_phone):
+        """Eine Transaktion für die ganze Serie: sperrt nur die Belegung der betroffenen Slots
+        (alle Lesezugriffe vor dem ersten Schreiben), danach alle Buchungen in einem Commit"""
+        try:
+            slots = sorted(set(slots))[:SERIES_MAX_SLOTS]
+            occupancy_refs = {(sd,stime):self._occupancy_ref(sd,stime) for sd,stime,_ in slots}
+            
+            @firestore.transactional
+            def book(transaction):
+                occupancies = {slot:self._occupancy_in_transaction(ref,*slot,transaction) for slot,ref in occupancy_refs.items()}
+                booked,taken = [],[]
+                for sd,stime,capacity in slots:
+                    occupancy = occupancies[(sd,stime)]
+                    if self.slot_refusal(occupancy['entries'],user_email,capacity):
+                        taken.append((sd,stime))
+                        continue
+                    ref = self.db.collection('bookings').document()
+                    data = {
+                        'slot_date':sd,'slot_time':stime,'user_email':user_email,
+                        'user_name':user_name,'user_phone':user_phone,'status':'confirmed',
+                        'created_at':firestore.SERVER_TIMESTAMP,'updated_at':firestore.SERVER_TIMESTAMP
+                    }
+                    occupancy['entries'].append(self._slot_entry(data,ref.id))
+                    transaction.set(ref,data)
+                    transaction.set(occupancy_refs[(sd,stime)],{**occupancy,'capacity':capacity,'updated_at':firestore.SERVER_TIMESTAMP})
+                    transaction.set(self.db.collection('booking_events').document(),
+                                    {**self._event('create',ref.id,data,user_email),'at':firestore.SERVER_TIMESTAMP})
+                    booked.append((sd,stime))
+                return booked,taken
+            
+            booked,taken = book(self.db.transaction()) if slots else ([],[])
+            if booked:
+                self._refresh_months(booked)
+                self._bump('bookings')
+            print(f"✅ Serie gebucht: {user_name} | {len(booked)} Termine, {len(taken)} bereits belegt")
+            return True,{'booked':booked,'taken':taken}
+        except Exception as e:
+            print(f"❌ create_series Fehler: {e}")
+            return False,str(e)
+    
+    def get_booking(self,slot_date,slot_time):
+        try:
+            for doc in self.db.collection('bookings').where('slot_date','==',slot_date)\
+                    .where('slot_time','==',slot_time).where('status','==','confirmed').limit(1).stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                return data
+            return None
+        except Exception as e:
+            print(f"❌ get_booking Fehler: {e}")
+            return None
+    
+    def cancel_booking(self,bid,cancelled_by,event='cancel'):
+        try:
+            booking_ref = self.db.collection('bookings').document(bid)
+            
+            @firestore.transactional
+            def cancel(transaction):
+                """Rückgabe: None (nicht gefunden), sonst der Slot bei bestätigter Buchung bzw. ()"""
+                doc = booking_ref.get(transaction=transaction)
+                if not doc.exists:
+                    return None
+                booking = doc.to_dict()
+                slot = (booking['slot_date'],booking['slot_time'])
+                occupancy_ref = self._occupancy_ref(*slot)
+                occupancy = self._occupancy_in_transaction(occupancy_ref,*slot,transaction) if booking.get('status') == 'confirmed' else None
+                transaction.update(booking_ref,{
+                    'status':'cancelled','cancelled_by':cancelled_by,
+                    'cancelled_at':firestore.SERVER_TIMESTAMP,'updated_at':firestore.SERVER_TIMESTAMP
+                })
+                if occupancy is None:
+                    return ()
+                occupancy['entries'] = [e for e in occupancy['entries'] if e.get('id') != bid]
+                transaction.set(occupancy_ref,{**occupancy,'updated_at':firestore.SERVER_TIMESTAMP})
+                transaction.set(self.db.collection('booking_events').document(),
+                                {**self._event(event,bid,booking,cancelled_by),'at':firestore.SERVER_TIMESTAMP})
+                return slot
+            
+            slot = cancel(self.db.transaction())
+            if slot is None:
+                return False
+            if slot:
+                self._refresh_months([slot],cancelled=1)
+            self._bump('bookings')
             print(f"✅ Buchung storniert: {bid}")
             return True
         except Exception as e:
             print(f"❌ cancel_booking Fehler: {e}")
             return False
     
+    def fold_events(self,strict=False):
+        views_ref = self.db.collection('views').document('bookings')
+        try:
+            doc = views_ref.get()
+            outdated = doc.exists and (doc.to_dict() or {}).get('schema',1) < VIEWS_SCHEMA
+            if outdated:
+                print("⚠️ Sichten veraltet, werden neu aufgebaut")
+                self.reset_views()
+            if outdated or not doc.exists:
+                self._create_views(views_ref)
+            
+            @firestore.transactional
+            def fold(transaction):
+                views = views_ref.get(transaction=transaction).to_dict()
+                offset = views.get('offset') or {}
+                seen = set(offset.get('ids',[]))
+                # Offset = (Zeitstempel, IDs mit genau diesem Zeitstempel); Einzelfeld-Index auf 'at'
+                q = self.db.collection('booking_events').order_by('at')
+                if offset.get('at'):
+                    q = q.where('at','>=',offset['at'])
+                docs = [d for d in q.limit(EVENT_BATCH+len(seen)).stream(transaction=transaction) if d.id not in seen][:EVENT_BATCH]
+                if not docs:
+                    return 0
+                events = [d.to_dict() for d in docs]
+                refs = {e['user_email']:self.db.collection('user_stats').document(e['user_email'])
+                        for e in events if e.get('user_email')}
+                users = {}
+                for user_email,ref in refs.items():
+                    doc = ref.get(transaction=transaction)
+                    users[user_email] = doc.to_dict() if doc.exists else self._empty_user_stats(user_email)
+                for event in events:
+                    self._fold_event(views,users,event)
+                last = events[-1]['at']
+                ids = [d.id for d,e in zip(docs,events) if e['at'] == last]
+                views['offset'] = {'at':last,'ids':ids+list(seen) if last == offset.get('at') else ids}
+                transaction.set(views_ref,views)
+                for user_email,ref in refs.items():
+                    transaction.set(ref,users[user_email])
+                return len(events)
+            
+            total = 0
+            while True:
+                n = fold(self.db.transaction())
+                total += n
+                if n < EVENT_BATCH:
+                    break
+            if total:
+                print(f"✅ {total} Buchungsereignisse verarbeitet")
+            return total
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ fold_events Fehler: {e}")
+            return 0
+    
+    def _event_head(self):
+        docs = list(self.db.collection('booking_events').order_by('at',direction=firestore.Query.DESCENDING).limit(1).stream())
+        return (docs[0].get('at'),docs[0].id) if docs else None
+    
+    def _create_views(self,views_ref):
+        """Sichten einmalig aus dem Bestand anlegen. Offset = neuestes Ereignis, gelesen vor und nach dem
+        Bestandsscan; weichen beide ab (Buchung während des Scans), wird der Scan wiederholt, damit kein
+        Ereignis doppelt (im Bestand und beim Einrechnen) oder gar nicht gezählt wird"""
+        for attempt in range(3):
+            head = self._event_head()
+            views,users = self._seed_views()
+            after = self._event_head()
+            if after == head:
+                break
+            print("⚠️ Ereignisse während des Bestandsscans, wiederhole")
+        if after:
+            views['offset'] = {'at':after[0],'ids':[after[1]]}
+        try:
+            views_ref.create(views)
+        except AlreadyExists:
+            return
+        items = list(users.items())
+        for i in range(0,len(items),500):
+            batch = self.db.batch()
+            for user_email,stats in items[i:i+500]:
+                batch.set(self.db.collection('user_stats').document(user_email),stats)
+            batch.commit()
+        print(f"✅ Sichten aus Bestand erzeugt: {len(users)} User")
+    
+    def get_views(self):
+        try:
+            doc = self.db.collection('views').document('bookings').get()
+            return doc.to_dict() if doc.exists else {'scoreboard':{},'months':{},'events':0}
+        except Exception as e:
+            print(f"❌ get_views Fehler: {e}")
+            return {'scoreboard':{},'months':{},'events':0}
+    
+    def get_user_stats(self,email):
+        try:
+            doc = self.db.collection('user_stats').document(email).get()
+            return doc.to_dict() if doc.exists else self._empty_user_stats(email)
+        except Exception as e:
+            print(f"❌ get_user_stats Fehler: {e}")
+            return self._empty_user_stats(email)
+    
+    def list_events(self,booking_id=None,user_email=None,limit=200):
+        try:
+            q = self.db.collection('booking_events')
+            if booking_id:
+                q = q.where('booking_id','==',booking_id).limit(EVENT_SCAN_LIMIT)
+                docs = list(q.stream())
+            elif user_email:
+                q = q.where('user_email','==',user_email)
+                try:
+                    # Composite-Index user_email + at (absteigend)
+                    docs = list(q.order_by('at',direction=firestore.Query.DESCENDING).limit(limit).stream())
+                except FailedPrecondition as e:
+                    print(f"⚠️ Firestore-Index fehlt für Ereignisse je User, begrenzter Fallback: {e}")
+                    docs = list(q.limit(EVENT_SCAN_LIMIT).stream())
+            else:
+                docs = list(q.order_by('at',direction=firestore.Query.DESCENDING).limit(limit).stream())
+            events = []
+            for doc in docs:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                events.append(data)
+            # Sortierung clientseitig, damit kein Composite-Index nötig ist
+            return sorted(events,key=lambda e:e.get('at') or datetime.min.replace(tzinfo=timezone.utc),reverse=True)[:limit]
+        except Exception as e:
+            print(f"❌ list_events Fehler: {e}")
+            return []
+    
+    def user_history(self,email,before,cursor=None,limit=HISTORY_PAGE):
+        # Composite-Index user_email + status + slot_date (absteigend); fehlt er, Fallback über list_bookings
+        if self.index_state['indexes'].get(frozenset(REQUIRED_INDEXES['bookings_user_status_date'])) is False:
+            return super().user_history(email,before,cursor,limit)
+        try:
+            q = (self.db.collection('bookings').where('user_email','==',email).where('status','==','confirmed')
+                 .where('slot_date','<',cursor['date'] if cursor else before)
+                 .order_by('slot_date',direction=firestore.Query.DESCENDING))
+            if cursor:
+                # Gleiches Datum wie das Seitenende separat, da nur nach slot_date sortiert wird
+                q = q.limit(limit+1)
+                same = self.db.collection('bookings').where('user_email','==',email).where('status','==','confirmed') \
+                    .where('slot_date','==',cursor['date'])
+                docs = list(same.stream())+list(q.stream())
+            else:
+                docs = list(q.limit(limit+1).stream())
+            bookings = []
+            for doc in docs:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                bookings.append(data)
+            bookings.sort(key=lambda b:(b['slot_date'],b['id']),reverse=True)
+            return self._history_page(bookings,cursor,limit)
+        except FailedPrecondition as e:
+            print(f"⚠️ Firestore-Index fehlt für Schichtverlauf: {e}")
+            return super().user_history(email,before,cursor,limit)
+        except Exception as e:
+            print(f"❌ user_history Fehler: {e}")
+            return [],None
+    
+    def reset_views(self):
+        try:
+            for ref in self.db.collection('user_stats').list_documents():
+                ref.delete()
+            self.db.collection('views').document('bookings').delete()
+            self._bump('bookings')
+            return True
+        except Exception as e:
+            print(f"❌ reset_views Fehler: {e}")
+            return False
+    
+    def queue_notification(self,recipient,item):
+        try:
+            self.db.collection('notifications').add({**item,'recipient':recipient})
+            return True
+        except Exception as e:
+            print(f"❌ queue_notification Fehler: {e}")
+            return False
+    
+    def pending_notifications(self):
+        try:
+            return [{**doc.to_dict(),'id':doc.id} for doc in self.db.collection('notifications').stream()]
+        except Exception as e:
+            print(f"❌ pending_notifications Fehler: {e}")
+            return []
+    
+    def delete_notifications(self,ids):
+        ids = list(ids)
+        for i in range(0,len(ids),500):
+            batch = self.db.batch()
+            for nid in ids[i:i+500]:
+                batch.delete(self.db.collection('notifications').document(nid))
+            batch.commit()
+    
+    def begin_job_run(self,job,scheduled_for,stale_after):
+        ref = self.db.collection('job_runs').document(self._job_run_id(job,scheduled_for))
+        
+        @firestore.transactional
+        def begin(transaction):
+            doc = ref.get(transaction=transaction)
+            run = doc.to_dict() if doc.exists else {}
+            if self._job_run_blocked(run,stale_after):
+                return False
+            transaction.set(ref,self._job_run_start(job,scheduled_for,run))
+            return True
+        
+        return begin(self.db.transaction())
+    
+    def finish_job_run(self,job,scheduled_for,status,items,error,duration_ms):
+        try:
+            self.db.collection('job_runs').document(self._job_run_id(job,scheduled_for)).update({
+                'status':status,'items':items,'error':error,'duration_ms':duration_ms,
+                'finished_at':datetime.now(TZ).isoformat(timespec='seconds')})
+        except Exception as e:
+            print(f"❌ finish_job_run Fehler: {e}")
+    
+    def list_job_runs(self,limit=200):
+        try:
+            q = self.db.collection('job_runs').order_by('started_at',direction=firestore.Query.DESCENDING).limit(limit)
+            return [doc.to_dict() for doc in q.stream()]
+        except Exception as e:
+            print(f"❌ list_job_runs Fehler: {e}")
+            return []
+    
+    def claim_key(self,key):
+        try:
+            self.db.collection('idempotency').document(key.replace('/','-')).create(
+                {'at':datetime.now(TZ).isoformat(timespec='seconds')})
+            return True
+        except AlreadyExists:
+            return False
+    
+    def release_key(self,key):
+        self.db.collection('idempotency').document(key.replace('/','-')).delete()
+    
+    def purge_keys(self,before):
+        refs = [doc.reference for doc in self.db.collection('idempotency').where('at','<',before).stream()]
+        for i in range(0,len(refs),500):
+            batch = self.db.batch()
+            for ref in refs[i:i+500]:
+                batch.delete(ref)
+            batch.commit()
+        return len(refs)
+    
     def get_setting(self,key,default=''):
         try:
             doc = self.db.collection('settings').document(key).get()
@@ -340,129 +1767,1141 @@ class WasserwachtDB:
             self.db.collection('settings').document(key).set({
                 'value':value,'updated_at':firestore.SERVER_TIMESTAMP
             },merge=True)
+            self._bump('settings')
             return True
         except:
             return False
     
-    def get_stats(self):
-        """FIX: Robuste Statistiken mit Fehlerbehandlung"""
+    def get_slot_templates(self):
+        """Slot-Templates aus Firestore, sonst WEEKLY_SLOTS"""
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            
-            # Total Users
-            all_users = self.get_all_users()
-            total_users = len([u for u in all_users if u.get('active',True)])
-            
-            # Future Bookings
-            future_bookings = []
-            try:
-                for doc in self.db.collection('bookings').where('status','==','confirmed').stream():
-                    b = doc.to_dict()
-                    if b.get('slot_date','') >= today:
-                        future_bookings.append(b)
-            except:
-                pass
-            
-            # Month Bookings
-            month_start = datetime.now().replace(day=1).strftime("%Y-%m-%d")
-            month_bookings = []
+            templates = []
+            for doc in self.db.collection('slot_templates').stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                data.setdefault('day_name', WEEKDAY_NAMES[WEEKDAYS.index(data.get('day','monday'))])
+                templates.append(data)
+            return templates or [dict(t) for t in WEEKLY_SLOTS]
+        except Exception as e:
+            print(f"❌ get_slot_templates Fehler: {e}")
+            return [dict(t) for t in WEEKLY_SLOTS]
+    
+    def _slot_templates_seeded(self):
+        """Bei der ersten Änderung die Standard-Slots nach Firestore übernehmen"""
+        col = self.db.collection('slot_templates')
+        if not any(True for _ in col.limit(1).stream()):
+            for t in WEEKLY_SLOTS:
+                col.document(str(t['id'])).set({
+                    'day':t['day'],'start':t['start'],'end':t['end'],
+                    'valid_from':None,'valid_until':None,'active':True
+                })
+        return col
+    
+    def add_slot_template(self,day,start,end,valid_from=None,valid_until=None,capacity=1):
+        try:
+            col = self._slot_templates_seeded()
+            col.add({
+                'day':day,'start':start,'end':end,'valid_from':valid_from,'valid_until':valid_until,
+                'capacity':capacity,'active':True,'created_at':firestore.SERVER_TIMESTAMP
+            })
+            self._bump('settings')
+            print(f"✅ Slot-Template erstellt: {day} {start}-{end}")
+            return True
+        except Exception as e:
+            print(f"❌ add_slot_template Fehler: {e}")
+            return False
+    
+    def update_slot_template(self,tid,**kwargs):
+        try:
+            col = self._slot_templates_seeded()
+            col.document(str(tid)).update(kwargs)
+            self._bump('settings')
+            return True
+        except Exception as e:
+            print(f"❌ update_slot_template Fehler: {e}")
+            return False
+    
+    def _load_archive_index(self):
+        doc = self.db.collection('meta').document('archive_index').get()
+        return doc.to_dict().get('months',{}) if doc.exists else None
+    
+    def _save_archive_index(self,index):
+        self.db.collection('meta').document('archive_index').set({'months':index,'updated_at':firestore.SERVER_TIMESTAMP})
+    
+    def archive_old(self,strict=False):
+        """Alte Buchungen archivieren"""
+        try:
+            months = 12
+            archive_date = (datetime.now()-timedelta(days=30*months)).strftime("%Y-%m-%d")
+            docs = list(self.db.collection('bookings').where('slot_date','<',archive_date).stream())
+            # Alte Archiv-Collection wird dabei in die Segmente überführt und geleert
+            legacy = list(self.db.collection('archive').stream())
+            if docs or legacy:
+                self._write_archive([{**d.to_dict(),'id':d.id} for d in legacy+docs])
+            # Erst nach geschriebenem Segment löschen: je Buchung Löschen + Ereignis (max. 500 pro Batch)
+            for i in range(0,len(docs),250):
+                batch = self.db.batch()
+                for doc in docs[i:i+250]:
+                    batch.delete(doc.reference)
+                    batch.set(self.db.collection('booking_events').document(),
+                              {**self._event('archive',doc.id,doc.to_dict(),'system'),'at':firestore.SERVER_TIMESTAMP})
+                batch.commit()
+            for i in range(0,len(legacy),500):
+                batch = self.db.batch()
+                for doc in legacy[i:i+500]:
+                    batch.delete(doc.reference)
+                batch.commit()
+            count = len(docs)
+            if count > 0:
+                self._bump('bookings')
+                print(f"✅ {count} Buchungen archiviert")
+            return count
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ archive_old Fehler: {e}")
+            return 0
+
+
+class SQLiteDB(StorageBackend):
+    """Lokales SQLite-Backend (ohne Cloud-Abhängigkeit). Dokumente liegen als JSON
+    in der Spalte 'data'; abgefragte Felder sind zusätzlich indizierte Spalten."""
+    
+    def __init__(self,path):
+        self.conn,self.lock = init_sqlite(path)
+        super().__init__()
+    
+    @staticmethod
+    def _new_id():
+        return uuid.uuid4().hex[:20]
+    
+    @staticmethod
+    def _now():
+        return datetime.now(TZ).isoformat(timespec='seconds')
+    
+    @staticmethod
+    def _doc(row):
+        data = json.loads(row['data'])
+        data['id'] = row['id']
+        return data
+    
+    def _query(self,sql,params=()):
+        with self.lock:
+            return [self._doc(r) for r in self.conn.execute(sql,params).fetchall()]
+    
+    def get_user(self,email):
+        try:
+            rows = self._query("SELECT id,data FROM users WHERE email=? LIMIT 1",(email,))
+            return rows[0] if rows else None
+        except Exception as e:
+            print(f"❌ get_user Fehler: {e}")
+            return None
+    
+    def create_user(self,email,name,phone,password,role='user'):
+        try:
+            data = {
+                'email':email,'name':name,'phone':phone,'password_hash':hash_pw(password),
+                'role':role,'active':True,'email_notifications':True,'sms_notifications':False,
+                'sms_booking_confirmation':True,'created_at':self._now()
+            }
+            with self.lock:
+                self.conn.execute("INSERT INTO users (id,email,data) VALUES (?,?,?)",
+                                  (self._new_id(),email,json.dumps(data)))
+            self._bump('users')
+            print(f"✅ User erstellt: {email}")
+            return True,"Registrierung erfolgreich"
+        except sqlite3.IntegrityError:
+            return False,"E-Mail bereits registriert"
+        except Exception as e:
+            print(f"❌ create_user Fehler: {e}")
+            return False,str(e)
+    
+    def get_all_users(self):
+        try:
+            return self._query("SELECT id,data FROM users")
+        except Exception as e:
+            print(f"❌ get_all_users Fehler: {e}")
+            return []
+    
+    def update_user(self,uid,**kwargs):
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT data FROM users WHERE id=?",(uid,)).fetchone()
+                if not row:
+                    return False
+                data = json.loads(row['data'])
+                data.update(self._revoke_sessions(kwargs))
+                self.conn.execute("UPDATE users SET email=?,data=? WHERE id=?",
+                                  (data.get('email',''),json.dumps(data),uid))
+            self._bump('users')
+            print(f"✅ User geupdatet: {uid}")
+            return True
+        except Exception as e:
+            print(f"❌ update_user Fehler: {e}")
+            return False
+    
+    def delete_user(self,email):
+        try:
+            with self.lock:
+                deleted = self.conn.execute("DELETE FROM users WHERE email=?",(email,)).rowcount
+            if deleted:
+                self._bump('users')
+                print(f"✅ User gelöscht: {email}")
+            return deleted > 0
+        except Exception as e:
+            print(f"❌ delete_user Fehler: {e}")
+            return False
+    
+    def _existing_emails(self):
+        with self.lock:
+            return [r['email'] for r in self.conn.execute("SELECT email FROM users")]
+    
+    def _insert_users(self,docs):
+        now = self._now()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
             try:
-                for doc in self.db.collection('bookings').where('status','==','confirmed').stream():
-                    b = doc.to_dict()
-                    date_str = b.get('slot_date','')
-                    if month_start <= date_str:
-                        month_bookings.append(b)
-            except:
-                pass
-            
-            # Free Slots
-            free_slots = []
-            for i in range(28):
-                check_date = (datetime.now()+timedelta(days=i)).strftime("%Y-%m-%d")
-                if not is_blocked(check_date):
-                    for slot in WEEKLY_SLOTS:
-                        ws = week_start(datetime.strptime(check_date,"%Y-%m-%d"))
-                        slot_d = slot_date(ws,slot['day'])
-                        if slot_d == check_date:
-                            if not self.get_booking(check_date,f"{slot['start']}-{slot['end']}"):
-                                free_slots.append({
-                                    'date':check_date,
-                                    'slot':f"{slot['day_name']} {slot['start']}-{slot['end']}"
-                                })
-            
-            return {
-                'total_users':total_users,
-                'future_bookings':len(future_bookings),
-                'month_bookings':len(month_bookings),
-                'free_slots_next_4weeks':free_slots
+                self.conn.executemany("INSERT INTO users (id,email,data) VALUES (?,?,?)",
+                                      [(self._new_id(),d['email'],json.dumps({**d,'created_at':now})) for d in docs])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    @staticmethod
+    def _where(status=None,date_from=None,date_to=None,user_email=None):
+        where,params = [],[]
+        for cond,value in (("slot_date>=?",date_from),("slot_date<=?",date_to),
+                           ("status=?",status),("user_email=?",user_email)):
+            if value:
+                where.append(cond)
+                params.append(value)
+        return (" WHERE "+" AND ".join(where) if where else ""),params
+    
+    def list_bookings(self,status=None,date_from=None,date_to=None,user_email=None,fields=None):
+        try:
+            where,params = self._where(status,date_from,date_to,user_email)
+            # Projektion direkt in SQLite, damit nur die benötigten Felder geparst werden
+            data = "data" if fields is None else \
+                "json_object("+",".join(f"'{f}',json_extract(data,'$.{f}')" for f in fields if f.isidentifier())+")"
+            return self._query(f"SELECT id,{data} AS data FROM bookings{where}",params)
+        except Exception as e:
+            print(f"❌ list_bookings Fehler: {e}")
+            return []
+    
+    def count_bookings(self,status=None,date_from=None,date_to=None,user_email=None):
+        try:
+            where,params = self._where(status,date_from,date_to,user_email)
+            with self.lock:
+                return self.conn.execute(f"SELECT COUNT(*) FROM bookings{where}",params).fetchone()[0]
+        except Exception as e:
+            print(f"❌ count_bookings Fehler: {e}")
+            return 0
+    
+    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone,capacity=1):
+        try:
+            data = {
+                'slot_date':slot_date,'slot_time':slot_time,'user_email':user_email,
+                'user_name':user_name,'user_phone':user_phone,'status':'confirmed',
+                'created_at':self._now()
             }
+            bid = self._new_id()
+            with self.lock:
+                # Prüfen, Einfügen und Monatsübersicht in einer Transaktion (keine Überbuchung)
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    entries = [{'user_email':r['user_email']} for r in self.conn.execute(
+                        "SELECT user_email FROM bookings WHERE slot_date=? AND slot_time=? AND status='confirmed'",
+                        (slot_date,slot_time))]
+                    refusal = self.slot_refusal(entries,user_email,capacity)
+                    if refusal:
+                        self.conn.execute("ROLLBACK")
+                        return False,refusal
+                    summary = self._load_month(slot_date[:7])
+                    self.conn.execute("INSERT INTO bookings (id,slot_date,slot_time,status,user_email,data) VALUES (?,?,?,?,?,?)",
+                                      (bid,slot_date,slot_time,'confirmed',user_email,json.dumps(data)))
+                    self._month_add(summary,data,bid)
+                    self._store_month(summary)
+                    self._log_event(self._event('create',bid,data,user_email))
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            self._bump('bookings')
+            print(f"✅ Buchung erstellt: {user_name} | {slot_date} {slot_time}")
+            return True,"Buchung erfolgreich"
         except Exception as e:
-            print(f"❌ get_stats Fehler: {e}")
-            return {'total_users':0,'future_bookings':0,'month_bookings':0,'free_slots_next_4weeks':[]}
+            print(f"❌ create_booking Fehler: {e}")
+            return False,str(e)
+    
+    def create_series(self,slots,user_email,user_name,user_phone):
+        try:
+            slots = sorted(set(slots))[:SERIES_MAX_SLOTS]
+            booked,taken,rows,summaries = [],[],[],{}
+            with self.lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Eine Bereichsabfrage für alle Termine der Serie statt get_booking je Termin
+                    occupied = {}
+                    for r in self.conn.execute(
+                            "SELECT slot_date,slot_time,user_email FROM bookings WHERE status='confirmed' AND slot_date BETWEEN ? AND ?",
+                            (slots[0][0],slots[-1][0])) if slots else ():
+                        occupied.setdefault((r['slot_date'],r['slot_time']),[]).append({'user_email':r['user_email']})
+                    for sd,stime,capacity in slots:
+                        if self.slot_refusal(occupied.get((sd,stime),[]),user_email,capacity):
+                            taken.append((sd,stime))
+                            continue
+                        data = {
+                            'slot_date':sd,'slot_time':stime,'user_email':user_email,
+                            'user_name':user_name,'user_phone':user_phone,'status':'confirmed',
+                            'created_at':self._now()
+                        }
+                        bid = self._new_id()
+                        rows.append((bid,sd,stime,'confirmed',user_email,json.dumps(data)))
+                        if sd[:7] not in summaries:
+                            summaries[sd[:7]] = self._load_month(sd[:7])
+                        self._month_add(summaries[sd[:7]],data,bid)
+                        booked.append((sd,stime))
+                    self.conn.executemany("INSERT INTO bookings (id,slot_date,slot_time,status,user_email,data) VALUES (?,?,?,?,?,?)",rows)
+                    for bid,sd,stime,_,_,data in rows:
+                        self._log_event(self._event('create',bid,json.loads(data),user_email))
+                    for summary in summaries.values():
+                        self._store_month(summary)
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if booked:
+                self._bump('bookings')
+            print(f"✅ Serie gebucht: {user_name} | {len(booked)} Termine, {len(taken)} bereits belegt")
+            return True,{'booked':booked,'taken':taken}
+        except Exception as e:
+            print(f"❌ create_series Fehler: {e}")
+            return False,str(e)
+    
+    def get_booking(self,slot_date,slot_time):
+        try:
+            rows = self._query("SELECT id,data FROM bookings WHERE slot_date=? AND slot_time=? AND status='confirmed' LIMIT 1",
+                               (slot_date,slot_time))
+            return rows[0] if rows else None
+        except Exception as e:
+            print(f"❌ get_booking Fehler: {e}")
+            return None
+    
+    def cancel_booking(self,bid,cancelled_by,event='cancel'):
+        try:
+            with self.lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.conn.execute("SELECT data FROM bookings WHERE id=?",(bid,)).fetchone()
+                    if not row:
+                        self.conn.execute("ROLLBACK")
+                        return False
+                    data = json.loads(row['data'])
+                    if data.get('status') == 'confirmed':
+                        summary = self._load_month(data['slot_date'][:7])
+                        self._month_cancel(summary,data,bid)
+                        self._store_month(summary)
+                        self._log_event(self._event(event,bid,data,cancelled_by))
+                    data.update({'status':'cancelled','cancelled_by':cancelled_by,'cancelled_at':self._now()})
+                    self.conn.execute("UPDATE bookings SET status='cancelled',data=? WHERE id=?",(json.dumps(data),bid))
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            self._bump('bookings')
+            print(f"✅ Buchung storniert: {bid}")
+            return True
+        except Exception as e:
+            print(f"❌ cancel_booking Fehler: {e}")
+            return False
+    
+    def get_versions(self):
+        try:
+            with self.lock:
+                return {r['key']:r['value'] for r in self.conn.execute("SELECT key,value FROM meta")}
+        except Exception as e:
+            print(f"❌ get_versions Fehler: {e}")
+            return {}
+    
+    def _bump_version(self,area):
+        with self.lock:
+            self.conn.execute("INSERT INTO meta (key,value) VALUES (?,1) ON CONFLICT(key) DO UPDATE SET value=value+1",(area,))
+    
+    def _load_month(self,month):
+        """Monatsübersicht lesen oder aus den Buchungen erzeugen (Aufrufer hält self.lock)"""
+        row = self.conn.execute("SELECT data FROM booking_months WHERE month=?",(month,)).fetchone()
+        if row:
+            return json.loads(row['data'])
+        rows = self.conn.execute("SELECT id,data FROM bookings WHERE slot_date BETWEEN ? AND ?",
+                                 (f"{month}-01",f"{month}-31")).fetchall()
+        return self._build_month(month,[self._doc(r) for r in rows])
+    
+    def _store_month(self,summary):
+        self.conn.execute("INSERT OR REPLACE INTO booking_months (month,data) VALUES (?,?)",
+                          (summary['month'],json.dumps(summary)))
+    
+    def get_month_summary(self,month,strict=False):
+        try:
+            with self.lock:
+                summary = self._load_month(month)
+                self.conn.execute("INSERT OR IGNORE INTO booking_months (month,data) VALUES (?,?)",
+                                  (month,json.dumps(summary)))
+            return summary
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ get_month_summary Fehler: {e}")
+            return self._empty_month(month)
+    
+    def _summary_source(self):
+        return self._query("SELECT id,data FROM bookings UNION ALL SELECT id,data FROM archive") + list(self._archived_all())
+    
+    def _save_months(self,summaries):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                for summary in summaries:
+                    self._store_month(summary)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def _log_event(self,event):
+        """Ereignis anhängen (Aufrufer hält self.lock und die Transaktion)"""
+        self.conn.execute("INSERT INTO booking_events (booking_id,user_email,data) VALUES (?,?,?)",
+                          (event['booking_id'],event['user_email'],json.dumps({**event,'at':self._now()})))
+    
+    def fold_events(self,strict=False):
+        try:
+            with self.lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.conn.execute("SELECT data FROM views WHERE key='bookings'").fetchone()
+                    views = json.loads(row['data']) if row else None
+                    if views and views.get('schema',1) >= VIEWS_SCHEMA:
+                        users = {}
+                    else:
+                        if row:
+                            print("⚠️ Sichten veraltet, werden neu aufgebaut")
+                            self.conn.execute("DELETE FROM user_stats")
+                            row = None
+                        views,users = self._seed_views()
+                        views['offset'] = self.conn.execute("SELECT COALESCE(MAX(seq),0) FROM booking_events").fetchone()[0]
+                    rows = self.conn.execute("SELECT seq,data FROM booking_events WHERE seq>? ORDER BY seq",
+                                             (views['offset'] or 0,)).fetchall()
+                    events = [json.loads(r['data']) for r in rows]
+                    for user_email in {e['user_email'] for e in events if e.get('user_email')} - set(users):
+                        r = self.conn.execute("SELECT data FROM user_stats WHERE email=?",(user_email,)).fetchone()
+                        users[user_email] = json.loads(r['data']) if r else self._empty_user_stats(user_email)
+                    for event in events:
+                        self._fold_event(views,users,event)
+                    if rows:
+                        views['offset'] = rows[-1]['seq']
+                    if rows or not row:
+                        self.conn.execute("INSERT OR REPLACE INTO views (key,data) VALUES ('bookings',?)",(json.dumps(views),))
+                    self.conn.executemany("INSERT OR REPLACE INTO user_stats (email,data) VALUES (?,?)",
+                                          [(user_email,json.dumps(u)) for user_email,u in users.items() if user_email])
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if events:
+                print(f"✅ {len(events)} Buchungsereignisse verarbeitet")
+            return len(events)
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ fold_events Fehler: {e}")
+            return 0
+    
+    def get_views(self):
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT data FROM views WHERE key='bookings'").fetchone()
+            return json.loads(row['data']) if row else {'scoreboard':{},'months':{},'events':0}
+        except Exception as e:
+            print(f"❌ get_views Fehler: {e}")
+            return {'scoreboard':{},'months':{},'events':0}
+    
+    def get_user_stats(self,email):
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT data FROM user_stats WHERE email=?",(email,)).fetchone()
+            return json.loads(row['data']) if row else self._empty_user_stats(email)
+        except Exception as e:
+            print(f"❌ get_user_stats Fehler: {e}")
+            return self._empty_user_stats(email)
+    
+    def list_events(self,booking_id=None,user_email=None,limit=200):
+        try:
+            sql,params = "SELECT seq,data FROM booking_events",()
+            if booking_id:
+                sql,params = sql+" WHERE booking_id=?",(booking_id,)
+            elif user_email:
+                sql,params = sql+" WHERE user_email=?",(user_email,)
+            with self.lock:
+                rows = self.conn.execute(sql+" ORDER BY seq DESC LIMIT ?",params+(limit,)).fetchall()
+            return [{**json.loads(r['data']),'id':r['seq']} for r in rows]
+        except Exception as e:
+            print(f"❌ list_events Fehler: {e}")
+            return []
+    
+    def user_history(self,email,before,cursor=None,limit=HISTORY_PAGE):
+        try:
+            sql = "SELECT id,data FROM bookings WHERE user_email=? AND status='confirmed' AND slot_date<?"
+            if cursor:
+                rows = self._query(sql+" AND (slot_date<? OR (slot_date=? AND id NOT IN (SELECT value FROM json_each(?))))"
+                                   " ORDER BY slot_date DESC,id DESC LIMIT ?",
+                                   (email,before,cursor['date'],cursor['date'],json.dumps(cursor['ids']),limit+1))
+            else:
+                rows = self._query(sql+" ORDER BY slot_date DESC,id DESC LIMIT ?",(email,before,limit+1))
+            return self._history_page(rows,cursor,limit)
+        except Exception as e:
+            print(f"❌ user_history Fehler: {e}")
+            return [],None
+    
+    def reset_views(self):
+        try:
+            with self.lock:
+                self.conn.execute("DELETE FROM views WHERE key='bookings'")
+                self.conn.execute("DELETE FROM user_stats")
+            self._bump('bookings')
+            return True
+        except Exception as e:
+            print(f"❌ reset_views Fehler: {e}")
+            return False
+    
+    def queue_notification(self,recipient,item):
+        try:
+            with self.lock:
+                self.conn.execute("INSERT INTO notifications (recipient,data) VALUES (?,?)",(recipient,json.dumps(item)))
+            return True
+        except Exception as e:
+            print(f"❌ queue_notification Fehler: {e}")
+            return False
+    
+    def pending_notifications(self):
+        try:
+            with self.lock:
+                rows = self.conn.execute("SELECT id,recipient,data FROM notifications ORDER BY id").fetchall()
+            return [{**json.loads(r['data']),'id':r['id'],'recipient':r['recipient']} for r in rows]
+        except Exception as e:
+            print(f"❌ pending_notifications Fehler: {e}")
+            return []
+    
+    def delete_notifications(self,ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM notifications WHERE id=?",[(i,) for i in ids])
+    
+    def begin_job_run(self,job,scheduled_for,stale_after):
+        rid = self._job_run_id(job,scheduled_for)
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT data FROM job_runs WHERE id=?",(rid,)).fetchone()
+                run = json.loads(row['data']) if row else {}
+                if self._job_run_blocked(run,stale_after):
+                    self.conn.execute("ROLLBACK")
+                    return False
+                run = self._job_run_start(job,scheduled_for,run)
+                self.conn.execute("INSERT OR REPLACE INTO job_runs (id,job,started_at,data) VALUES (?,?,?,?)",
+                                  (rid,job,run['started_at'],json.dumps(run)))
+                self.conn.execute("COMMIT")
+                return True
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+    
+    def finish_job_run(self,job,scheduled_for,status,items,error,duration_ms):
+        try:
+            rid = self._job_run_id(job,scheduled_for)
+            with self.lock:
+                row = self.conn.execute("SELECT data FROM job_runs WHERE id=?",(rid,)).fetchone()
+                run = {**(json.loads(row['data']) if row else {}),'status':status,'items':items,'error':error,
+                       'duration_ms':duration_ms,'finished_at':self._now()}
+                self.conn.execute("UPDATE job_runs SET data=? WHERE id=?",(json.dumps(run),rid))
+        except Exception as e:
+            print(f"❌ finish_job_run Fehler: {e}")
+    
+    def list_job_runs(self,limit=200):
+        try:
+            with self.lock:
+                rows = self.conn.execute("SELECT data FROM job_runs ORDER BY started_at DESC LIMIT ?",(limit,)).fetchall()
+            return [json.loads(r['data']) for r in rows]
+        except Exception as e:
+            print(f"❌ list_job_runs Fehler: {e}")
+            return []
+    
+    def claim_key(self,key):
+        with self.lock:
+            return self.conn.execute("INSERT OR IGNORE INTO idempotency (key,at) VALUES (?,?)",(key,self._now())).rowcount == 1
+    
+    def release_key(self,key):
+        with self.lock:
+            self.conn.execute("DELETE FROM idempotency WHERE key=?",(key,))
+    
+    def purge_keys(self,before):
+        with self.lock:
+            return self.conn.execute("DELETE FROM idempotency WHERE at<?",(before,)).rowcount
+    
+    def get_setting(self,key,default=''):
+        try:
+            with self.lock:
+                row = self.conn.execute("SELECT value FROM settings WHERE key=?",(key,)).fetchone()
+            return json.loads(row['value']) if row else default
+        except:
+            return default
+    
+    def set_setting(self,key,value):
+        try:
+            with self.lock:
+                self.conn.execute("INSERT INTO settings (key,value) VALUES (?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                                  (key,json.dumps(value)))
+            self._bump('settings')
+            return True
+        except:
+            return False
+    
+    def get_slot_templates(self):
+        """Slot-Templates aus SQLite, sonst WEEKLY_SLOTS"""
+        try:
+            templates = self._query("SELECT id,data FROM slot_templates")
+            for t in templates:
+                t.setdefault('day_name', WEEKDAY_NAMES[WEEKDAYS.index(t.get('day','monday'))])
+            return templates or [dict(t) for t in WEEKLY_SLOTS]
+        except Exception as e:
+            print(f"❌ get_slot_templates Fehler: {e}")
+            return [dict(t) for t in WEEKLY_SLOTS]
+    
+    def _seed_slot_templates(self):
+        """Bei der ersten Änderung die Standard-Slots übernehmen"""
+        if not self.conn.execute("SELECT 1 FROM slot_templates LIMIT 1").fetchone():
+            for t in WEEKLY_SLOTS:
+                self.conn.execute("INSERT INTO slot_templates (id,data) VALUES (?,?)",(str(t['id']),json.dumps({
+                    'day':t['day'],'start':t['start'],'end':t['end'],
+                    'valid_from':None,'valid_until':None,'active':True
+                })))
+    
+    def add_slot_template(self,day,start,end,valid_from=None,valid_until=None,capacity=1):
+        try:
+            with self.lock:
+                self._seed_slot_templates()
+                self.conn.execute("INSERT INTO slot_templates (id,data) VALUES (?,?)",(self._new_id(),json.dumps({
+                    'day':day,'start':start,'end':end,'valid_from':valid_from,'valid_until':valid_until,
+                    'capacity':capacity,'active':True,'created_at':self._now()
+                })))
+            self._bump('settings')
+            print(f"✅ Slot-Template erstellt: {day} {start}-{end}")
+            return True
+        except Exception as e:
+            print(f"❌ add_slot_template Fehler: {e}")
+            return False
+    
+    def update_slot_template(self,tid,**kwargs):
+        try:
+            with self.lock:
+                self._seed_slot_templates()
+                row = self.conn.execute("SELECT data FROM slot_templates WHERE id=?",(str(tid),)).fetchone()
+                if not row:
+                    return False
+                data = json.loads(row['data'])
+                data.update(kwargs)
+                self.conn.execute("UPDATE slot_templates SET data=? WHERE id=?",(json.dumps(data),str(tid)))
+            self._bump('settings')
+            return True
+        except Exception as e:
+            print(f"❌ update_slot_template Fehler: {e}")
+            return False
+    
+    def _load_archive_index(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT month,data FROM archive_index").fetchall()
+        return {r['month']:json.loads(r['data']) for r in rows} if rows else None
+    
+    def _save_archive_index(self,index):
+        with self.lock:
+            self.conn.executemany("INSERT INTO archive_index (month,data) VALUES (?,?) ON CONFLICT(month) DO UPDATE SET data=excluded.data",
+                                  [(m,json.dumps(e)) for m,e in index.items()])
+    
+    def archive_old(self,strict=False):
+        """Alte Buchungen archivieren"""
+        try:
+            months = 12
+            archive_date = (datetime.now()-timedelta(days=30*months)).strftime("%Y-%m-%d")
+            with self.lock:
+                rows = self.conn.execute("SELECT id,data FROM bookings WHERE slot_date<?",(archive_date,)).fetchall()
+                # Alte Archiv-Tabelle wird dabei in die Segmente überführt und geleert
+                legacy = self.conn.execute("SELECT id,data FROM archive").fetchall()
+                if rows or legacy:
+                    self._write_archive([self._doc(r) for r in legacy+rows])
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for row in rows:
+                        self._log_event(self._event('archive',row['id'],json.loads(row['data']),'system'))
+                    self.conn.executemany("DELETE FROM bookings WHERE id=?",[(r['id'],) for r in rows])
+                    self.conn.execute("DELETE FROM archive")
+                    count = len(rows)
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if count > 0:
+                self._bump('bookings')
+                print(f"✅ {count} Buchungen archiviert")
+            return count
+        except Exception as e:
+            if strict:
+                raise
+            print(f"❌ archive_old Fehler: {e}")
+            return 0
+
+
+@st.cache_resource
+def firestore_index_state():
+    """Prozessweit gemerkter Index-Status: {frozenset(Felder): vorhanden}, Fallback-Zähler"""
+    return {'indexes':{},'degraded_queries':0,'lock':threading.Lock()}
+
+def create_storage():
+    """Backend gemäß STORAGE_BACKEND wählen"""
+    backend = str(get_secret("STORAGE_BACKEND","firestore")).lower()
+    if backend == "sqlite":
+        return SQLiteDB(get_secret("SQLITE_PATH","wasserwacht.db"))
+    return WasserwachtDB(init_firestore())
+
+@st.cache_resource
+def version_watch():
+    """Prozessweit zuletzt gesehener Stand von meta/versions. Mehrere Replikas bleiben
+    kohärent, weil alle Caches mit der Version ihres Bereichs verschlüsselt sind."""
+    return {'versions':None,'subscription':None,'lock':threading.Lock()}
+
+_run_versions = None  # pro Rerun höchstens einmal lesen
+
+def _merge_versions(watch,versions):
+    """Versionen steigen nur; verspätete Snapshots dürfen nichts zurückdrehen"""
+    with watch['lock']:
+        old = watch['versions'] or {}
+        watch['versions'] = {k:max(old.get(k,0),versions.get(k,0)) for k in {*old,*versions}}
+
+def data_versions():
+    """Aktuelle Datenversionen; per on_snapshot aktuell gehalten (Firestore),
+    sonst einmal pro Rerun gelesen. Hintergrund-Threads (Scheduler, Kiosk)
+    haben keinen Rerun und lesen daher bei jedem Aufruf."""
+    global _run_versions
+    in_run = get_script_run_ctx() is not None
+    if _run_versions is None or not in_run:
+        watch = version_watch()
+        with watch['lock']:
+            if watch['subscription'] is None:
+                watch['subscription'] = ww_db.subscribe_versions(lambda v: _merge_versions(watch,v)) or False
+        if not watch['subscription'] or watch['versions'] is None:
+            _merge_versions(watch,ww_db.get_versions())
+        if not in_run:
+            return dict(watch['versions'])
+        _run_versions = dict(watch['versions'])
+    return _run_versions
+
+def invalidate_versions():
+    """Nach eigenen Schreibzugriffen nicht auf den Snapshot warten"""
+    global _run_versions
+    _run_versions = None
+    version_watch()['versions'] = None
+
+# ===== LOKALER SNAPSHOT (Warmstart) =====
+SNAPSHOT_WINDOW = (35, 120)       # Buchungen von heute-35 bis heute+120 Tage
+SNAPSHOT_SAVE_INTERVAL = 60       # Sekunden zwischen Schreibvorgängen auf Platte
+SNAPSHOT_MARGIN = timedelta(seconds=60)  # Überlappung beim Delta gegen Uhr-Versatz
+
+def _snap_encode(o):
+    if isinstance(o, datetime):
+        return {'$dt': o.isoformat()}
+    return str(o)
+
+def _snap_decode(d):
+    return datetime.fromisoformat(d['$dt']) if len(d) == 1 and '$dt' in d else d
+
+class Snapshot:
+    """Lokale Kopie von Users, Settings und dem Buchungsfenster als gzip-JSONL.
+    Die Kopfzeile enthält High-Water-Mark (max. updated_at), Fenster und die
+    meta/versions, auf deren Stand die Kopie ist."""
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self._reset()
+    
+    def _reset(self):
+        self.users, self.settings, self.bookings = {}, {}, {}
+        self.hwm, self.window, self.versions = None, None, {}
+        self.dirty = False
+    
+    def load(self):
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                head = json.loads(f.readline(), object_hook=_snap_decode)
+                for line in f:
+                    rec = json.loads(line, object_hook=_snap_decode)
+                    getattr(self, rec['kind'])[rec['id']] = rec['data']
+            self.hwm, self.window, self.versions = head['hwm'], tuple(head['window']), head['versions']
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"⚠️ Snapshot unlesbar, wird neu aufgebaut: {e}")
+            self._reset()
+            return False
+    
+    def save(self):
+        with self.lock:
+            tmp = self.path + ".tmp"
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                head = {'hwm': self.hwm, 'window': self.window, 'versions': self.versions}
+                f.write(json.dumps(head, default=_snap_encode) + "\n")
+                for kind in ('users', 'settings', 'bookings'):
+                    for key, data in getattr(self, kind).items():
+                        f.write(json.dumps({'kind': kind, 'id': key, 'data': data}, default=_snap_encode) + "\n")
+            os.replace(tmp, self.path)
+            self.dirty = False
+    
+    def _apply(self, changes):
+        for kind in ('users', 'settings', 'bookings'):
+            for key, data in changes[kind].items():
+                getattr(self, kind)[key] = data
+                ts = data.get('updated_at')
+                if isinstance(ts, datetime) and (self.hwm is None or ts > self.hwm):
+                    self.hwm = ts
+        return sum(len(c) for c in changes.values())
+    
+    def sync(self, db):
+        """Auf den aktuellen Stand bringen; lädt nur Änderungen seit der High-Water-Mark"""
+        with self.lock:
+            versions = db.get_versions()
+            today = datetime.now(TZ).date()
+            lo = (today - timedelta(days=SNAPSHOT_WINDOW[0])).isoformat()
+            hi = (today + timedelta(days=SNAPSHOT_WINDOW[1])).isoformat()
+            if versions == self.versions and self.window == (lo, hi):
+                return 0
+            if self.window is None or self.hwm is None:
+                self._reset()
+                n = self._apply(db.changes_since(None, lo, hi))
+                self.hwm = self.hwm or datetime.now(timezone.utc)
+            else:
+                n = self._apply(db.changes_since(self.hwm - SNAPSHOT_MARGIN, lo, hi))
+                if hi > self.window[1]:
+                    # Neu ins Fenster gerückte Tage einmalig nachladen
+                    start = (date.fromisoformat(self.window[1]) + timedelta(days=1)).isoformat()
+                    for b in db.list_bookings(date_from=start, date_to=hi):
+                        self.bookings[b.pop('id')] = b
+                        n += 1
+                self.bookings = {i: b for i, b in self.bookings.items() if b.get('slot_date', '') >= lo}
+                if versions.get('users') != self.versions.get('users') and \
+                        db.count_users(active_only=False) != len(self.users):
+                    # Gelöschte User tauchen im Delta nicht auf: dann komplett neu laden
+                    self.users = {u.pop('id'): u for u in db.get_all_users()}
+            self.window, self.versions = (lo, hi), versions
+            self.dirty = True
+            return n
+    
+    def covers(self, date_from, date_to):
+        return self.window is not None and self.window[0] <= date_from and date_to <= self.window[1]
+    
+    def user_list(self):
+        return [{**u, 'id': i} for i, u in self.users.items()]
+    
+    def bookings_between(self, date_from, date_to, status=None):
+        return [{**b, 'id': i} for i, b in self.bookings.items()
+                if date_from <= b.get('slot_date', '') <= date_to and (not status or b.get('status') == status)]
+
+@st.cache_resource
+def snapshot():
+    """Prozessweiter Snapshot (nur Firestore, SNAPSHOT_PATH=\"\" schaltet ab): beim Start von
+    Platte laden, per Delta nachziehen und im Hintergrund regelmäßig zurückschreiben"""
+    path = get_secret("SNAPSHOT_PATH", ".wasserwacht_snapshot.jsonl.gz")
+    if not path or not ww_db.remote:
+        return None
+    t0 = time.perf_counter()
+    snap = Snapshot(path)
+    try:
+        loaded = snap.load()
+        n = snap.sync(ww_db)
+        snap.save()
+    except Exception as e:
+        print(f"❌ Snapshot Fehler: {e}")
+        return None
+    print(f"✅ Snapshot {'geladen' if loaded else 'neu erstellt'}: {len(snap.users)} User, "
+          f"{len(snap.bookings)} Buchungen, {n} Änderungen nachgezogen ({(time.perf_counter()-t0)*1000:.0f} ms)")
+    
+    def persist():
+        while True:
+            time.sleep(SNAPSHOT_SAVE_INTERVAL)
+            if snap.dirty:
+                try:
+                    snap.save()
+                except Exception as e:
+                    print(f"❌ Snapshot speichern Fehler: {e}")
+    
+    threading.Thread(target=persist, name="snapshot", daemon=True).start()
+    return snap
+
+def snapshot_for(area, version):
+    """Snapshot, falls er für den Bereich auf 'version' steht (bei Bedarf per Delta nachgezogen)"""
+    snap = snapshot()
+    if snap is None:
+        return None
+    if snap.versions.get(area, 0) < version:
+        try:
+            snap.sync(ww_db)
+        except Exception as e:
+            print(f"⚠️ Snapshot-Sync fehlgeschlagen: {e}")
+            return None
+    return snap if snap.versions.get(area, 0) >= version else None
+
+_storage_t0 = time.perf_counter()
+ww_db = create_storage()
+_storage_ms = round((time.perf_counter()-_storage_t0)*1000, 1)
+
+@st.cache_resource(ttl=600, max_entries=4)
+def _slot_calendar(version):
+    return SlotCalendar(ww_db.get_slot_templates())
+
+def slot_calendar():
+    """Gecachter Slot-Kalender, neu aufgebaut sobald sich die Settings-Version ändert"""
+    return _slot_calendar(data_versions().get('settings',0))
+
+@st.cache_data(ttl=600, max_entries=4, show_spinner=False)
+def _cached_users(version):
+    snap = snapshot_for('users', version)
+    return snap.user_list() if snap else ww_db.get_all_users()
+
+def cached_users():
+    return _cached_users(data_versions().get('users',0))
+
+@st.cache_data(ttl=600, max_entries=64, show_spinner=False)
+def _cached_week_bookings(ws, version):
+    we = (date.fromisoformat(ws)+timedelta(days=6)).isoformat()
+    snap = snapshot_for('bookings', version)
+    if snap and snap.covers(ws, we):
+        return snap.bookings_between(ws, we, status='confirmed')
+    return ww_db.get_week_bookings(ws)
+
+def cached_week_bookings(ws):
+    return _cached_week_bookings(ws, data_versions().get('bookings',0))
+
+@st.cache_data(ttl=600, max_entries=64, show_spinner=False)
+def _cached_month_summary(month, version):
+    snap = snapshot_for('bookings', version)
+    if snap and snap.covers(f"{month}-01", f"{month}-31"):
+        return StorageBackend._build_month(month, snap.bookings_between(f"{month}-01", f"{month}-31"))
+    return ww_db.get_month_summary(month)
+
+def cached_month_summary(month):
+    return _cached_month_summary(month, data_versions().get('bookings',0))
+
+@st.cache_data(ttl=600, max_entries=4, show_spinner=False)
+def _folded(version):
+    return ww_db.fold_events()
+
+@st.cache_data(ttl=600, max_entries=4, show_spinner=False)
+def _cached_views(version):
+    _folded(version)
+    return ww_db.get_views()
+
+def cached_views():
+    """Scoreboard und Monatszähler; neue Buchungsereignisse werden vorher eingerechnet"""
+    return _cached_views(data_versions().get('bookings',0))
+
+def user_stats(email):
+    """Persönliche Statistik: Ereignisse einmal je Datenversion einrechnen, dann ein Dokument lesen"""
+    _folded(data_versions().get('bookings',0))
+    return ww_db.get_user_stats(email)
+
+def shift_totals(stats, today):
+    """Geleistete Schichten/Stunden je Jahr (gebuchte Summen abzüglich noch ausstehender Schichten),
+    ausstehende Schichten und letzte geleistete Schicht"""
+    years = {y: dict(v) for y, v in stats.get('years', {}).items()}
+    shifts = stats.get('shifts', [])
+    pending = [s for s in shifts if s['slot_date'] >= today]
+    for s in pending:
+        year = years.setdefault(s['slot_date'][:4], {'shifts': 0, 'hours': 0})
+        year['shifts'] -= 1
+        year['hours'] = round(year['hours'] - slot_hours(s['slot_time']), 2)
+    past = [s['slot_date'] for s in shifts if s['slot_date'] < today]
+    return {y: v for y, v in years.items() if v['shifts'] > 0}, pending, max(past) if past else None
+
+def week_occupancy(ws):
+    """Belegung der Woche ab Montag ws aus den Monatsübersichten: {(datum,zeit):[Buchungen]}"""
+    first, last = ws.isoformat(), (ws+timedelta(days=6)).isoformat()
+    occupancy = {}
+    for month in sorted({first[:7], last[:7]}):
+        summary = cached_month_summary(month)
+        for d, slots in summary['days'].items():
+            if first <= d <= last:
+                for t in slots:
+                    occupancy[(d, t)] = StorageBackend.slot_entries(summary, d, t)
+    return occupancy
+
+@st.cache_data(ttl=600, max_entries=32, show_spinner=False)
+def _cached_setting(key, default, version):
+    snap = snapshot_for('settings', version)
+    if snap:
+        return snap.settings[key].get('value', default) if key in snap.settings else default
+    return ww_db.get_setting(key, default)
+
+def cached_setting(key, default=''):
+    return _cached_setting(key, default, data_versions().get('settings',0))
+
+@st.cache_resource
+def io_pool():
+    """Gemeinsamer Thread-Pool für unabhängige Lesezugriffe einer Seite"""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="ww-io")
+
+def fetch_all(**tasks):
+    """Unabhängige Lesezugriffe gleichzeitig ausführen: fetch_all(a=f, b=g) -> {'a':f(),'b':g()}.
+    Die Seite wartet so lange wie die langsamste Abfrage statt auf die Summe aller.
+    Die erste Aufgabe läuft im aufrufenden Thread; innerhalb eines Pool-Threads wird
+    alles direkt ausgeführt, damit ein voller Pool nicht auf sich selbst wartet."""
+    if threading.current_thread().name.startswith("ww-io"):
+        return {name: fn() for name, fn in tasks.items()}
+    ctx = get_script_run_ctx()
     
-    def archive_old(self):
-        """Alte Buchungen archivieren"""
+    def run(fn):
+        # Script-Kontext weitergeben, damit st.cache_* auch im Worker greift; danach den
+        # vorherigen wiederherstellen, damit keine beendete Session am Pool-Thread hängen bleibt
+        thread = threading.current_thread()
+        previous = get_script_run_ctx(suppress_warning=True)
+        if ctx is not None:
+            add_script_run_ctx(thread, ctx)
         try:
-            months = 12
-            archive_date = (datetime.now()-timedelta(days=30*months)).strftime("%Y-%m-%d")
-            count = 0
-            for doc in self.db.collection('bookings').where('slot_date','<',archive_date).stream():
-                self.db.collection('archive').add(doc.to_dict())
-                doc.reference.delete()
-                count += 1
-            if count > 0:
-                print(f"✅ {count} Buchungen archiviert")
-            return count
-        except Exception as e:
-            print(f"❌ archive_old Fehler: {e}")
-            return 0
-
-ww_db = WasserwachtDB()
+            return fn()
+        finally:
+            if previous is None:
+                thread.__dict__.pop(SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+            else:
+                add_script_run_ctx(thread, previous)
+    
+    first, *rest = tasks
+    futures = {name: io_pool().submit(run, tasks[name]) for name in rest}
+    results = {first: tasks[first]()}
+    results.update({name: f.result() for name, f in futures.items()})
+    return results
 
 # ===== ENDE TEIL 1 =====
 # ===== EMAIL & SMS CLASSES (FIX: Aus alter funktionierender Version) =====
+def with_retries(fn,transient,attempts,backoff,label):
+    """fn ausführen; vorübergehende Fehler (transient(e) True) mit exponentiellem Backoff wiederholen"""
+    for attempt in range(1,attempts+1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == attempts or not transient(e):
+                raise
+            delay = backoff*2**(attempt-1)
+            print(f"⚠️ {label}: Versuch {attempt} fehlgeschlagen ({e}), neuer Versuch in {delay:.1f}s")
+            time.sleep(delay)
+
+def smtp_transient(e):
+    """4xx-Antworten sind laut SMTP vorübergehend (z.B. 421/451 Greylisting, Rate-Limit)"""
+    if isinstance(e,smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code,_ in e.recipients.values())
+    return isinstance(e,smtplib.SMTPResponseException) and 400 <= e.smtp_code < 500
+
+def twilio_transient(e):
+    return isinstance(e,TwilioRestException) and (e.status == 429 or e.status >= 500)
+
+class SmtpTransport:
+    """SMTP-Zustellung; mit SMTP_STARTTLS=false auch gegen lokale Server ohne TLS (Mail-Sink, Tests)"""
+    def __init__(self,server,port,user,pw,starttls=True,attempts=3,backoff=0.5):
+        self.server,self.port,self.user,self.pw = server,port,user,pw
+        self.starttls = starttls
+        self.attempts,self.backoff = attempts,backoff
+    
+    def connect(self):
+        server = smtplib.SMTP(self.server, self.port, timeout=30)
+        server.ehlo()
+        if self.starttls:
+            server.starttls()
+            server.ehlo()
+        server.login(self.user, self.pw)
+        return server
+    
+    def deliver(self,server,msg):
+        with_retries(lambda: server.send_message(msg),smtp_transient,self.attempts,self.backoff,f"E-Mail an {msg['To']}")
+
+class _RebasedHttpClient(TwilioHttpClient):
+    """Leitet Aufrufe an api.twilio.com auf eine andere Basis-URL um"""
+    def __init__(self,base_url,**kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url.rstrip('/')
+    
+    def request(self,method,url,*args,**kwargs):
+        return super().request(method,url.replace("https://api.twilio.com",self.base_url),*args,**kwargs)
+
+class TwilioTransport:
+    """Twilio-Client wird einmal erzeugt und wiederverwendet (Keep-Alive statt TLS-Handshake pro SMS);
+    TWILIO_API_BASE leitet die API auf einen anderen Server um (Testserver)"""
+    def __init__(self,sid,token,base_url="",attempts=3,backoff=0.5):
+        self.sid,self.token,self.base_url = sid,token,base_url
+        self.attempts,self.backoff = attempts,backoff
+        self._client = None
+        self._lock = threading.Lock()
+    
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                http = _RebasedHttpClient(self.base_url,timeout=30) if self.base_url else TwilioHttpClient(timeout=30)
+                self._client = Client(self.sid, self.token, http_client=http)
+            return self._client
+    
+    def send(self,to,from_,body):
+        return with_retries(lambda: self.client.messages.create(to=to,from_=from_,body=body),
+                            twilio_transient,self.attempts,self.backoff,f"SMS an {to}")
+
 class Mailer:
     def __init__(self):
         if hasattr(st,'secrets'):
-            self.server = st.secrets.get("SMTP_SERVER","smtp.gmail.com")
-            self.port = int(st.secrets.get("SMTP_PORT",587))
-            self.user = st.secrets.get("SMTP_USER","")
-            self.pw = st.secrets.get("SMTP_PASSWORD","")
-            self.admin_receiver = st.secrets.get("ADMIN_EMAIL_RECEIVER","")
+            self.server = get_secret("SMTP_SERVER","smtp.gmail.com")
+            self.port = int(get_secret("SMTP_PORT",587))
+            self.user = get_secret("SMTP_USER","")
+            self.pw = get_secret("SMTP_PASSWORD","")
+            self.admin_receiver = get_secret("ADMIN_EMAIL_RECEIVER","")
             self.fromname = "Wasserwacht Dienstplan"
+            starttls = str(get_secret("SMTP_STARTTLS","true")).lower() == "true"
         else:
             self.server = self.port = self.user = self.pw = self.admin_receiver = ""
             self.fromname = "Dienstplan"
+            starttls = True
+        self.transport = SmtpTransport(self.server,self.port,self.user,self.pw,starttls)
+    
+    def _message(self,to,subject,body,attachments=None):
+        msg = MIMEMultipart()
+        msg['From'] = email.utils.formataddr((self.fromname, self.user))
+        msg['To'] = to
+        msg['Subject'] = subject
+        msg['Date'] = email.utils.formatdate(localtime=True)
+        msg.attach(MIMEText(body, 'html', 'utf-8'))
+        
+        if attachments:
+            for filename, data in attachments:
+                part = MIMEBase('application', 'octet-stream')
+                if isinstance(data, bytes):
+                    part.set_payload(data)
+                else:
+                    part.set_payload(data.encode('utf-8'))
+                encoders.encode_base64(part)
+                part.add_header('Content-Disposition', f'attachment; filename={filename}')
+                msg.attach(part)
+        return msg
     
     def send(self,to,subject,body,attachments=None):
         if not self.user or not self.pw:
             print("❌ E-Mail: Keine Credentials in Secrets")
             return False
         try:
-            msg = MIMEMultipart()
-            msg['From'] = email.utils.formataddr((self.fromname, self.user))
-            msg['To'] = to
-            msg['Subject'] = subject
-            msg['Date'] = email.utils.formatdate(localtime=True)
-            msg.attach(MIMEText(body, 'html', 'utf-8'))
-            
-            if attachments:
-                for filename, data in attachments:
-                    part = MIMEBase('application', 'octet-stream')
-                    if isinstance(data, bytes):
-                        part.set_payload(data)
-                    else:
-                        part.set_payload(data.encode('utf-8'))
-                    encoders.encode_base64(part)
-                    part.add_header('Content-Disposition', f'attachment; filename={filename}')
-                    msg.attach(part)
-            
-            with smtplib.SMTP(self.server, self.port, timeout=30) as server:
-                server.ehlo()
-                server.starttls()
-                server.ehlo()
-                server.login(self.user, self.pw)
-                server.send_message(msg)
+            msg = self._message(to,subject,body,attachments)
+            with self.transport.connect() as server:
+                self.transport.deliver(server,msg)
             
             print(f"✅ E-Mail gesendet an {to}")
             return True
@@ -470,27 +2909,87 @@ class Mailer:
             print(f"❌ E-Mail-Fehler: {e}")
             return False
     
+    def send_many(self,messages):
+        """[(to,subject,body[,attachments]),...] über eine SMTP-Verbindung; Rückgabe: erfolgreich belieferte Empfänger"""
+        if not messages:
+            return []
+        if not self.user or not self.pw:
+            print("❌ E-Mail: Keine Credentials in Secrets")
+            return []
+        sent = []
+        try:
+            with self.transport.connect() as server:
+                for to,subject,body,*attachments in messages:
+                    try:
+                        self.transport.deliver(server,self._message(to,subject,body,*attachments))
+                        sent.append(to)
+                    except (smtplib.SMTPRecipientsRefused,smtplib.SMTPDataError,smtplib.SMTPSenderRefused) as e:
+                        print(f"❌ E-Mail an {to} abgelehnt: {e}")
+            print(f"✅ {len(sent)} E-Mails über eine Verbindung gesendet")
+        except Exception as e:
+            print(f"❌ E-Mail-Fehler: {e}")
+        return sent
+    
+    def _queued(self,to,line):
+        """Empfänger mit Tageszusammenfassung: Zeile vormerken statt sofort zu senden"""
+        user = ww_db.get_user(to)
+        if not user or user.get('notification_mode') != 'daily':
+            return False
+        return ww_db.queue_notification(to,{'line':line,'at':datetime.now(TZ).isoformat(timespec='seconds')})
+    
+    def digest(self,user_name,lines):
+        body = f"""<html><body style='font-family:Arial,sans-serif'>
+        <h2 style='color:{COLORS['rot']}'>🌊 Wasserwacht Dienstplan+</h2>
+        <p>Hallo {user_name}, hier deine Änderungen seit der letzten Zusammenfassung:</p>
+        <ul>{"".join(f"<li>{html.escape(l)}</li>" for l in lines)}</ul>
+        <hr>
+        <p style='color:{COLORS['grau_dunkel']};font-size:0.9rem'>
+        Die Zustellung kannst du im Profil auf "Sofort" umstellen.<br>
+        Bei Fragen: {self.admin_receiver}
+        </p></body></html>"""
+        return f"📋 Deine Schichten: {len(lines)} Änderung{'en' if len(lines) != 1 else ''}",body
+    
     def booking_confirmation(self,user_email,user_name,slot_date,slot_time):
-        template = ww_db.getsetting('email_booking_template',
+        if self._queued(user_email,f"✅ Gebucht: {fmt_de(slot_date)} um {slot_time}"):
+            return True
+        template = ww_db.get_setting('email_booking_template',
             'Hallo {name}, deine Schicht am {date} um {time} wurde gebucht. Wir freuen uns auf dich!')
         body = f"""<html><body style='font-family:Arial,sans-serif'>
         <h2 style='color:{COLORS['rot']}'>🌊 Wasserwacht Dienstplan+</h2>
-        <p>{template.format(name=user_name,date=fmtde(slot_date),time=slot_time)}</p>
+        <p>{template.format(name=user_name,date=fmt_de(slot_date),time=slot_time)}</p>
+        <hr>
+        <p style='color:{COLORS['grau_dunkel']};font-size:0.9rem'>
+        Du erhältst automatische Erinnerungen 24h und 1h vor Schichtbeginn.<br>
+        Bei Fragen: {self.admin_receiver}
+        </p></body></html>"""
+        return self.send(user_email,f"✅ Buchungsbestätigung {fmt_de(slot_date)}",body)
+    
+    def series_confirmation(self,user_email,user_name,slots):
+        """Eine Sammel-Bestätigung für alle Termine einer Serienbuchung"""
+        if self._queued(user_email,f"✅ Serie gebucht: {len(slots)} Schichten, {fmt_de(slots[0][0])} bis {fmt_de(slots[-1][0])}"):
+            return True
+        rows = "".join(f"<li>{WEEKDAY_NAMES[date.fromisoformat(d).weekday()]}, {fmt_de(d)} um {t}</li>" for d,t in slots)
+        body = f"""<html><body style='font-family:Arial,sans-serif'>
+        <h2 style='color:{COLORS['rot']}'>🌊 Wasserwacht Dienstplan+</h2>
+        <p>Hallo {user_name}, folgende {len(slots)} Schichten wurden für dich gebucht:</p>
+        <ul>{rows}</ul>
         <hr>
         <p style='color:{COLORS['grau_dunkel']};font-size:0.9rem'>
         Du erhältst automatische Erinnerungen 24h und 1h vor Schichtbeginn.<br>
         Bei Fragen: {self.admin_receiver}
         </p></body></html>"""
-        return self.send(user_email,f"✅ Buchungsbestätigung {fmtde(slot_date)}",body)
+        return self.send(user_email,f"✅ Serienbuchung: {len(slots)} Schichten ab {fmt_de(slots[0][0])}",body)
     
     def cancellation_confirmation(self,user_email,user_name,slot_date,slot_time):
-        template = ww_db.getsetting('email_cancellation_template',
+        if self._queued(user_email,f"🔴 Storniert: {fmt_de(slot_date)} um {slot_time}"):
+            return True
+        template = ww_db.get_setting('email_cancellation_template',
             'Hallo {name}, deine Schicht am {date} um {time} wurde storniert.')
         body = f"""<html><body style='font-family:Arial,sans-serif'>
         <h2 style='color:{COLORS['rot']}'>🌊 Wasserwacht Dienstplan+</h2>
-        <p>{template.format(name=user_name,date=fmtde(slot_date),time=slot_time)}</p>
+        <p>{template.format(name=user_name,date=fmt_de(slot_date),time=slot_time)}</p>
         </body></html>"""
-        return self.send(user_email,f"🔴 Stornierung {fmtde(slot_date)}",body)
+        return self.send(user_email,f"🔴 Stornierung {fmt_de(slot_date)}",body)
     
     def test_email(self,to):
         body = f"""<html><body style='font-family:Arial,sans-serif'>
@@ -516,19 +3015,15 @@ class Mailer:
             backup_emails = []
             if hasattr(st,'secrets'):
                 try:
-                    backup_emails = json.loads(st.secrets.get("BACKUP_EMAILS","[]"))
+                    backup_emails = json.loads(get_secret("BACKUP_EMAILS","[]"))
                 except:
                     backup_emails = []
-                admin = st.secrets.get("ADMIN_EMAIL_RECEIVER","")
+                admin = get_secret("ADMIN_EMAIL_RECEIVER","")
                 if admin and admin not in backup_emails:
                     backup_emails.append(admin)
             
-            success_count = 0
-            for email in backup_emails:
-                if self.send(email, subject, body, [(filename, backup_zip)]):
-                    success_count += 1
-            
-            return success_count > 0
+            sent = self.send_many([(email, subject, body, [(filename, backup_zip)]) for email in backup_emails])
+            return len(sent) > 0
         except Exception as e:
             print(f"❌ Backup-E-Mail Fehler: {e}")
             return False
@@ -565,13 +3060,15 @@ class Mailer:
 class TwilioSMS:
     def __init__(self):
         if hasattr(st,'secrets'):
-            self.sid = st.secrets.get("TWILIO_ACCOUNT_SID","")
-            self.token = st.secrets.get("TWILIO_AUTH_TOKEN","")
-            self.phone = st.secrets.get("TWILIO_PHONE_NUMBER","")
-            self.enabled = st.secrets.get("ENABLE_SMS_REMINDER","false").lower()=="true"
+            self.sid = get_secret("TWILIO_ACCOUNT_SID","")
+            self.token = get_secret("TWILIO_AUTH_TOKEN","")
+            self.phone = get_secret("TWILIO_PHONE_NUMBER","")
+            self.enabled = get_secret("ENABLE_SMS_REMINDER","false").lower()=="true"
+            base_url = get_secret("TWILIO_API_BASE","")
         else:
-            self.sid = self.token = self.phone = ""
+            self.sid = self.token = self.phone = base_url = ""
             self.enabled = False
+        self.transport = TwilioTransport(self.sid,self.token,base_url)
     
     # FIX: EXAKTE Syntax aus alter funktionierender Version
     def send(self,to,message):
@@ -592,12 +3089,7 @@ class TwilioSMS:
                 else:
                     to = '+49' + to
             
-            client = Client(self.sid, self.token)
-            msg = client.messages.create(
-                to=to,
-                from_=self.phone,
-                body=message
-            )
+            msg = self.transport.send(to,self.phone,message)
             
             print(f"✅ SMS gesendet an {to}: {msg.sid}")
             return True
@@ -614,6 +3106,12 @@ class TwilioSMS:
         msg = template.format(name=user_name,date=fmt_de(slot_date),time=slot_time)
         return self.send(user_phone,msg)
     
+    def series_confirmation(self,user_phone,user_name,slots):
+        """Eine SMS für die ganze Serie statt einer pro Termin"""
+        msg = (f"Wasserwacht: {len(slots)} Schichten bestätigt, "
+               f"{fmt_de(slots[0][0])} bis {fmt_de(slots[-1][0])}. Details per E-Mail.")
+        return self.send(user_phone,msg)
+    
     def reminder_24h(self,user_phone,user_name,slot_date,slot_time):
         """24h Reminder"""
         template = ww_db.get_setting('sms_24h_template',
@@ -637,80 +3135,503 @@ mailer = Mailer()
 sms = TwilioSMS()
 
 # ===== SCHEDULER =====
+JOB_MISFIRE_GRACE = 3600  # Sekunden: verpasste Läufe (Neustart, Schlafmodus) werden so lange nachgeholt
+JOB_STALE_AFTER = 1800    # Sekunden: ein 'running'-Lauf ohne Ende gilt danach als abgebrochen
+IDEMPOTENCY_DAYS = 30     # so lange bleiben "bereits gesendet"-Schlüssel erhalten
+
+# Die Job-Funktionen geben die Anzahl verarbeiteter Einträge zurück und lassen Fehler durch;
+# run_job protokolliert beides im Job-Ledger.
 def daily_tasks():
     """Tägliche Aufgaben: Archivierung + Backup"""
-    ww_db.archive_old()
-    if hasattr(st,'secrets') and st.secrets.get("ENABLE_DAILY_BACKUP","true").lower()=="true":
-        try:
-            buffer = io.BytesIO()
-            with zipfile.ZipFile(buffer,'w') as zf:
-                csv = "date,time,user,phone,status\n"
-                for doc in ww_db.db.collection('bookings').stream():
-                    d = doc.to_dict()
-                    csv += f"{d.get('slot_date','')},{d.get('slot_time','')},{d.get('user_name','')},{d.get('user_phone','')},{d.get('status','')}\n"
-                zf.writestr('bookings.csv',csv)
-            mailer.backup_email(buffer.getvalue())
-        except Exception as e:
-            print(f"❌ Daily Backup Fehler: {e}")
+    items = ww_db.archive_old(strict=True)
+    ww_db.fold_events(strict=True)
+    ww_db.purge_keys((datetime.now(TZ)-timedelta(days=IDEMPOTENCY_DAYS)).isoformat(timespec='seconds'))
+    key = f"backup:{datetime.now(TZ).strftime('%Y-%m-%d')}"
+    enabled = hasattr(st,'secrets') and get_secret("ENABLE_DAILY_BACKUP","true").lower()=="true"
+    if enabled and (not mailer.user or not mailer.pw):
+        print("⚠️ Backup: E-Mail nicht eingerichtet, übersprungen")
+    elif enabled and ww_db.claim_key(key):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer,'w') as zf:
+            csv_text = "date,time,user,phone,status\n"
+            for d in ww_db.list_bookings(fields=['slot_date','slot_time','user_name','user_phone','status']):
+                csv_text += f"{d.get('slot_date','')},{d.get('slot_time','')},{d.get('user_name','')},{d.get('user_phone','')},{d.get('status','')}\n"
+            zf.writestr('bookings.csv',csv_text)
+        if not mailer.backup_email(buffer.getvalue()):
+            ww_db.release_key(key)
+            raise RuntimeError("Backup-E-Mail konnte nicht gesendet werden")
+        items += 1
+    return items
 
 def reminder_tasks():
-    """24h Reminder-SMS versenden"""
+    """24h Reminder-SMS versenden; je Buchung höchstens einmal (Idempotenz-Schlüssel), auch bei Wiederholung"""
     tomorrow = (datetime.now()+timedelta(days=1)).strftime("%Y-%m-%d")
+    bookings = ww_db.list_bookings(status='confirmed',date_from=tomorrow,date_to=tomorrow)
+    # User einmal laden statt einer Abfrage pro Buchung
+    users = {u['email']:u for u in ww_db.get_all_users()} if bookings else {}
+    sent = 0
+    for b in bookings:
+        if b.get('user_phone'):
+            u = users.get(b['user_email'])
+            key = f"sms24:{b['id']}"
+            if u and u.get('sms_notifications',False) and ww_db.claim_key(key):
+                ok = False
+                try:
+                    ok = sms.reminder_24h(b['user_phone'],b['user_name'],b['slot_date'],b['slot_time'])
+                finally:
+                    if ok:
+                        sent += 1
+                    else:
+                        ww_db.release_key(key)
+    return sent
+
+def check_free_slots_alarm():
+    """Warnung bei freien Slots; nur wenn seit dem letzten Lauf Slots neu frei oder leerer geworden sind"""
+    critical = []
+    start = (datetime.now()+timedelta(days=1)).strftime("%Y-%m-%d")
+    end = (datetime.now()+timedelta(days=7)).strftime("%Y-%m-%d")
+    summaries = {m:ww_db.get_month_summary(m,strict=True) for m in sorted({start[:7],end[:7]})}
+    for inst in slot_calendar().between(start, end):
+        taken = len(StorageBackend.slot_entries(summaries[inst.date[:7]],inst.date,inst.time))
+        if not is_blocked(inst.date) and taken < inst.capacity:
+            critical.append({'key':f"{inst.date} {inst.time}",'taken':taken,'date':fmt_de(inst.date),'day':inst.day_name,
+                             'time':inst.time + (f" ({taken}/{inst.capacity})" if inst.capacity > 1 else "")})
+    previous = (ww_db.get_setting('free_slots_alarm',{}) or {}).get('slots',{})
+    worse = [s for s in critical if s['key'] not in previous or s['taken'] < previous[s['key']]]
+    state = {'date':datetime.now(TZ).strftime("%Y-%m-%d"),'slots':{s['key']:s['taken'] for s in critical}}
+    if not worse:
+        ww_db.set_setting('free_slots_alarm',state)
+        print(f"ℹ️ Freie-Slots-Alarm unverändert ({len(critical)} offen), keine E-Mail")
+        return 0
+    admins = [u['email'] for u in ww_db.get_all_users() if u.get('role')=='admin' and u.get('active',True)]
+    missing = "E-Mail nicht eingerichtet" if not mailer.user or not mailer.pw else None if admins else "keine aktiven Admins"
+    if missing:
+        # Kein Versandversuch, also kein Fehler; Zustand nicht speichern, damit später noch alarmiert wird
+        print(f"⚠️ Freie-Slots-Alarm: {missing}, {len(worse)} Slots nicht gemeldet")
+        return 0
+    slots_html = "".join([f"<li>{'🆕 ' if s in worse else ''}{s['date']} ({s['day']}) {s['time']}</li>" for s in critical])
+    body = (f"<html><body><h2 style='color:{COLORS['warnung']}'>⚠️ {len(critical)} freie Slots</h2>"
+            f"<p>{len(worse)} neu bzw. weniger besetzt als beim letzten Alarm</p><ul>{slots_html}</ul></body></html>")
+    sent = mailer.send_many([(admin,"⚠️ Freie Slots",body) for admin in admins])
+    if not sent:
+        # Zustand nicht speichern, damit der nächste Lauf erneut alarmiert
+        raise RuntimeError("Freie-Slots-Alarm konnte nicht gesendet werden")
+    ww_db.set_setting('free_slots_alarm',state)
+    return len(sent)
+
+def send_digests():
+    """Vorgemerkte Benachrichtigungen je Empfänger zu einer E-Mail zusammenfassen (eine SMTP-Verbindung);
+    gesendete Einträge werden gelöscht, eine Wiederholung schickt nur den Rest"""
+    pending = ww_db.pending_notifications()
+    if not pending:
+        return 0
+    grouped = {}
+    for n in sorted(pending,key=lambda n:n.get('at','')):
+        grouped.setdefault(n['recipient'],[]).append(n)
+    names = {u['email']:u.get('name','') for u in ww_db.get_all_users()}
+    messages = [(to,*mailer.digest(names.get(to,''),[n['line'] for n in items])) for to,items in grouped.items()]
+    sent = set(mailer.send_many(messages))
+    ww_db.delete_notifications([n['id'] for to,items in grouped.items() if to in sent for n in items])
+    print(f"✅ Zusammenfassung: {len(pending)} Einträge in {len(sent)}/{len(grouped)} E-Mails")
+    return len(sent)
+
+def scheduled_jobs():
+    """Job-Name -> (Funktion, Uhrzeit HH:MM)"""
+    secret = lambda key,default: get_secret(key,default) if hasattr(st,'secrets') else default
+    return {
+        'daily_tasks':(daily_tasks,secret("BACKUP_TIME","20:00")),
+        'reminder_tasks':(reminder_tasks,"18:00"),
+        'free_slots_alarm':(check_free_slots_alarm,"18:00"),
+        'send_digests':(send_digests,secret("DIGEST_TIME","19:00")),
+    }
+
+def last_due(at,now):
+    """Letzter planmäßiger Termin (heute oder gestern) der Uhrzeit at vor now"""
+    h,m = at.split(":")
+    due = now.replace(hour=int(h),minute=int(m),second=0,microsecond=0)
+    return due if due <= now else due-timedelta(days=1)
+
+def run_job(name,scheduled_for=None):
+    """Job ausführen und im Ledger protokollieren (Start, Dauer, Anzahl, Fehler). Ein Termin läuft nur
+    einmal erfolgreich: Nachholen, zweite Prozesse oder Doppel-Trigger überspringen ihn, ein
+    abgebrochener oder fehlgeschlagener Lauf wird beim nächsten Versuch fortgesetzt."""
+    fn,at = scheduled_jobs()[name]
+    scheduled_for = scheduled_for or last_due(at,datetime.now(TZ)).isoformat(timespec='minutes')
+    if not ww_db.begin_job_run(name,scheduled_for,JOB_STALE_AFTER):
+        print(f"ℹ️ Job {name} ({scheduled_for}) bereits erledigt oder aktiv")
+        return None
+    t0 = time.perf_counter()
+    items,status,error = 0,'ok',None
     try:
-        for doc in ww_db.db.collection('bookings').where('slot_date','==',tomorrow)\
-                .where('status','==','confirmed').stream():
-            b = doc.to_dict()
-            if b.get('user_phone'):
-                u = ww_db.get_user(b['user_email'])
-                if u and u.get('sms_notifications',False):
-                    sms.reminder_24h(b['user_phone'],b['user_name'],b['slot_date'],b['slot_time'])
+        items = fn() or 0
     except Exception as e:
-        print(f"❌ Reminder Fehler: {e}")
+        status,error = 'error',str(e)
+        print(f"❌ Job {name} Fehler: {e}")
+    duration_ms = round((time.perf_counter()-t0)*1000,1)
+    ww_db.finish_job_run(name,scheduled_for,status,items,error,duration_ms)
+    if status == 'ok':
+        print(f"✅ Job {name}: {items} Einträge in {duration_ms} ms")
+    return items
 
-def check_free_slots_alarm():
-    """Warnung bei freien Slots"""
+@st.cache_resource
+def start_scheduler():
+    """Ein Scheduler pro Prozess (nicht pro Session). Verpasste Läufe werden innerhalb von
+    JOB_MISFIRE_GRACE einmal nachgeholt, mehrere verpasste Termine zu einem zusammengefasst."""
+    scheduler = BackgroundScheduler(timezone=TZ,job_defaults={'coalesce':True,'max_instances':1,
+                                                              'misfire_grace_time':JOB_MISFIRE_GRACE})
+    now = datetime.now(TZ)
+    for name,(fn,at) in scheduled_jobs().items():
+        h,m = at.split(":")
+        scheduler.add_job(run_job,CronTrigger(hour=int(h),minute=int(m),timezone=TZ),args=[name],id=name,replace_existing=True)
+        # Beim Start verpasster Termin von heute: nachholen (der Ledger verhindert Doppelläufe)
+        due = last_due(at,now)
+        if (now-due).total_seconds() <= JOB_MISFIRE_GRACE:
+            scheduler.add_job(run_job,'date',run_date=now+timedelta(seconds=5),args=[name,due.isoformat(timespec='minutes')],
+                              id=f"catchup_{name}",replace_existing=True)
+    scheduler.start()
+    print("✅ Scheduler gestartet")
+    return scheduler
+
+try:
+    start_scheduler()
+except Exception as e:
+    print(f"❌ Scheduler Fehler: {e}")
+
+# ===== KIOSK (Dienstplan-Anzeige im Hallenbad) =====
+KIOSK_MAX_AGE = 10  # Sekunden ohne erneute Versionsprüfung
+
+def roster_week(ws):
+    """Slots der Woche ab Montag ws für die Anzeige, ohne Kontaktdaten"""
+    names = {}
+    for b in ww_db.get_week_bookings(ws.isoformat()):
+        names.setdefault((b['slot_date'],b['slot_time']),[]).append(b.get('user_name',''))
+    slots = []
+    for inst in slot_calendar().week(ws):
+        n = names.get((inst.date,inst.time),[])
+        slots.append({'date':inst.date,'day':inst.day_name,'time':inst.time,
+                      'name':", ".join(n) or None,'booked':len(n),'capacity':inst.capacity,
+                      'blocked':block_reason(inst.date) if is_blocked(inst.date) else None})
+    return {'week':ws.isoformat(),'kw':ws.isocalendar()[1],'slots':slots}
+
+def roster_html(roster, today):
+    rows = ""
+    for s in roster['slots']:
+        if s['blocked']:
+            who = f"<span style='color:{COLORS['grau_dunkel']}'>🚫 {html.escape(s['blocked'])}</span>"
+        elif s['name']:
+            who = f"<b>{html.escape(s['name'])}</b>"
+            if s['capacity'] > 1:
+                open_color = COLORS['fehler'] if s['booked'] < s['capacity'] else COLORS['grau_dunkel']
+                who += f" <span style='color:{open_color}'>({s['booked']}/{s['capacity']})</span>"
+        else:
+            who = f"<span style='color:{COLORS['fehler']}'>offen</span>"
+        bg = f"{COLORS['rot']}20" if s['date'] == today else COLORS['weiss']
+        rows += f"<tr style='background:{bg}'><td>{s['day']}, {fmt_de(s['date'])}</td><td>{s['time']}</td><td>{who}</td></tr>"
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><meta http-equiv="refresh" content="60">
+<title>Wasserwacht Dienstplan</title><style>body{{font-family:sans-serif;font-size:2rem;margin:2rem;color:{COLORS['text']}}}
+td{{padding:0.5rem 1.5rem;border-bottom:1px solid {COLORS['grau_mittel']}}}h1{{color:{COLORS['rot']}}}</style></head>
+<body><h1>🌊 Dienstplan KW {roster['kw']}</h1><table>{rows}</table></body></html>"""
+
+@st.cache_resource
+def kiosk_state():
+    return {'entries':{},'versions':{},'checked':0.0,'lock':threading.Lock()}
+
+def kiosk_response(ws, fmt):
+    """(Body, ETag) aus dem Cache; neu gerendert nur bei geänderter Buchungs-/Settings-Version"""
+    state = kiosk_state()
+    today = datetime.now(TZ).date().isoformat()
+    with state['lock']:
+        if time.monotonic()-state['checked'] > KIOSK_MAX_AGE:
+            state['versions'] = data_versions()
+            state['checked'] = time.monotonic()
+        v = state['versions']
+        key = (ws, fmt, today, v.get('bookings',0), v.get('settings',0))
+        entry = state['entries'].get(key)
+    if entry is None:
+        roster = roster_week(ws)
+        body = (json.dumps(roster, ensure_ascii=False) if fmt == 'json' else roster_html(roster, today)).encode()
+        entry = (body, f'"{hashlib.sha1(body).hexdigest()[:16]}"')
+        with state['lock']:
+            if len(state['entries']) > 32:
+                state['entries'].clear()
+            state['entries'][key] = entry
+    return entry
+
+class KioskHandler(BaseHTTPRequestHandler):
+    """GET /roster (HTML) und /roster.json, optional ?week=JJJJ-MM-TT;
+    /healthz (Prozess lebt) und /readyz (Warm-up abgeschlossen, sonst 503)"""
+    
+    def _send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/healthz':
+            self._send_json(200, {'status':'ok'})
+            return
+        if url.path == '/readyz':
+            report = self.server.readiness
+            self._send_json(200 if report['ready'] else 503, report)
+            return
+        if url.path not in ('/', '/roster', '/roster.json'):
+            self.send_error(404)
+            return
+        try:
+            week = parse_qs(url.query).get('week')
+            ws = week_start(date.fromisoformat(week[0]) if week else datetime.now(TZ).date())
+        except ValueError:
+            self.send_error(400, "week muss JJJJ-MM-TT sein")
+            return
+        fmt = 'json' if url.path.endswith('.json') else 'html'
+        try:
+            body, etag = kiosk_response(ws, fmt)
+        except Exception as e:
+            print(f"❌ Kiosk Fehler: {e}")
+            self.send_error(500)
+            return
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8' if fmt == 'json' else 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', f'max-age={KIOSK_MAX_AGE}')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass  # Anzeigen pollen im Minutentakt, kein Log pro Request
+
+@st.cache_resource
+def kiosk_server():
+    """Read-only Dienstplan- und Health-Server, ein Thread pro Prozess;
+    nur aktiv wenn KIOSK_PORT (oder HEALTH_PORT) gesetzt ist"""
+    port = get_secret("KIOSK_PORT") or get_secret("HEALTH_PORT")
+    if not port:
+        return None
+    host = get_secret("KIOSK_HOST", "0.0.0.0")
     try:
-        critical = []
-        for i in range(1,8):
-            check_date = (datetime.now()+timedelta(days=i)).strftime("%Y-%m-%d")
-            if not is_blocked(check_date):
-                for slot in WEEKLY_SLOTS:
-                    ws = week_start(datetime.strptime(check_date,"%Y-%m-%d"))
-                    slot_d = slot_date(ws,slot['day'])
-                    if slot_d == check_date and not ww_db.get_booking(check_date,f"{slot['start']}-{slot['end']}"):
-                        critical.append({'date':fmt_de(check_date),'day':slot['day_name'],'time':f"{slot['start']}-{slot['end']}"})
-        if critical:
-            admins = [u['email'] for u in ww_db.get_all_users() if u.get('role')=='admin' and u.get('active',True)]
-            slots_html = "".join([f"<li>{s['date']} ({s['day']}) {s['time']}</li>" for s in critical])
-            body = f"<html><body><h2 style='color:{COLORS['warnung']}'>⚠️ {len(critical)} freie Slots</h2><ul>{slots_html}</ul></body></html>"
-            for admin in admins:
-                mailer.send(admin,"⚠️ Freie Slots",body)
+        server = ThreadingHTTPServer((host, int(port)), KioskHandler)
+        server.daemon_threads = True
+        server.readiness = readiness()
+        threading.Thread(target=server.serve_forever, name="kiosk", daemon=True).start()
+        print(f"✅ Kiosk-Anzeige: http://{host}:{port}/roster")
+        return server
     except Exception as e:
-        print(f"❌ Free Slots Alarm Fehler: {e}")
+        print(f"❌ Kiosk Fehler: {e}")
+        return None
+
+# ===== WARM-UP & READINESS =====
+@st.cache_resource
+def readiness():
+    """Prozessweiter Warm-up-Bericht für /readyz und das Admin-Debug-Panel"""
+    return {'ready':False,'degraded':False,'started':None,'total_ms':None,'timings':{},
+            'missing_indexes':[],'error':None}
 
-if 'scheduler_started' not in st.session_state:
+@st.cache_resource
+def warm_up():
+    """Einmal pro Prozess vor der ersten Seite: Kanal öffnen (Probe-Read), Settings,
+    Slots, User und aktuelle Woche vorladen, Composite-Indizes prüfen"""
+    report = readiness()
+    report['started'] = datetime.now(TZ).isoformat(timespec='seconds')
+    report['timings']['storage'] = _storage_ms
+    steps = [
+        ('ping', ww_db.get_versions),
+        ('snapshot', snapshot),
+        ('settings', lambda: cached_setting('summer_breaks', None)),
+        ('slots', slot_calendar),
+        ('users', cached_users),
+        ('week', lambda: cached_week_bookings(week_start().isoformat())),
+        ('indexes', lambda: report['missing_indexes'].extend(ww_db.index_status()['missing'])),
+    ]
+    t_all = time.perf_counter()
     try:
-        scheduler = BackgroundScheduler(timezone=TZ)
-        h,m = (st.secrets.get("BACKUP_TIME","20:00") if hasattr(st,'secrets') else "20:00").split(":")
-        scheduler.add_job(daily_tasks,'cron',hour=int(h),minute=int(m))
-        scheduler.add_job(reminder_tasks,'cron',hour=18,minute=0)
-        scheduler.add_job(check_free_slots_alarm,'cron',hour=18,minute=0)
-        scheduler.start()
-        st.session_state.scheduler_started = True
-        print("✅ Scheduler gestartet")
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            fn()
+            report['timings'][name] = round((time.perf_counter()-t0)*1000, 1)
+        report['degraded'] = bool(report['missing_indexes'])
+        report['ready'] = True
     except Exception as e:
-        print(f"❌ Scheduler Fehler: {e}")
+        report['error'] = f"{name}: {e}"
+    report['total_ms'] = round((time.perf_counter()-t_all)*1000 + _storage_ms, 1)
+    timings = " ".join(f"{k}={v}ms" for k, v in report['timings'].items())
+    if report['ready']:
+        extra = f" ⚠️ Indizes fehlen: {', '.join(report['missing_indexes'])}" if report['degraded'] else ""
+        print(f"✅ READY in {report['total_ms']} ms ({timings}){extra}")
+    else:
+        print(f"❌ NOT READY nach {report['total_ms']} ms ({timings}) Fehler: {report['error']}")
+    return report
+
+kiosk_server()
+warm_up()
+
+# ===== ANALYSE (spaltenorientierter Buchungs-DataFrame) =====
+ANALYTICS_FIELDS = ['slot_date', 'slot_time', 'user_email', 'user_name', 'status', 'created_at']
+
+def _to_datetime64(values):
+    """Firestore-Zeitstempel, ISO-Strings und None einheitlich als naive Ortszeit (datetime64)"""
+    iso = values.map(lambda v: v.isoformat() if isinstance(v, datetime) else v)
+    return pd.to_datetime(iso, errors='coerce', utc=True, format='ISO8601').dt.tz_convert(TIMEZONE_STR).dt.tz_localize(None)
+
+def bookings_frame(bookings):
+    """Buchungen als DataFrame: Kategorien für User/Slot/Status, datetime64 für Daten"""
+    df = pd.DataFrame(bookings, columns=['id'] + ANALYTICS_FIELDS)
+    df['slot_date'] = pd.to_datetime(df['slot_date'], errors='coerce', format='%Y-%m-%d')
+    df['created_at'] = _to_datetime64(df['created_at'])
+    df = df.dropna(subset=['slot_date'])
+    for col in ('slot_time', 'user_email', 'user_name', 'status'):
+        df[col] = df[col].fillna('').astype('category')
+    return df.reset_index(drop=True)
+
+@st.cache_data(ttl=3600, max_entries=2, show_spinner=False)
+def _archive_frame(index_key):
+    """Archiv-Segmente ändern sich nur beim Archivieren: einmal lesen, per Index-Stand cachen"""
+    return bookings_frame([b for month, key, _ in index_key for b in read_segment(key)])
+
+@st.cache_data(ttl=600, max_entries=2, show_spinner=False)
+def _live_frame(version):
+    return bookings_frame(ww_db.list_bookings(fields=ANALYTICS_FIELDS))
+
+def analytics_frame():
+    """Archiv + Live-Daten; bei neuen Buchungen wird nur der Live-Teil neu geladen"""
+    index = ww_db.archive_index()
+    data = fetch_all(live=lambda: _live_frame(data_versions().get('bookings', 0)),
+                     archive=lambda: _archive_frame(tuple((m, e['key'], e['updated']) for m, e in sorted(index.items()))))
+    frames = [f for f in (data['archive'], data['live']) if len(f)]
+    if len(frames) < 2:
+        return frames[0] if frames else data['live']
+    df = pd.concat(frames, ignore_index=True)
+    for col in ('slot_time', 'user_email', 'user_name', 'status'):
+        df[col] = df[col].astype('category')
+    return df
+
+def slot_supply(start, end):
+    """Angebotene Plätze je Slot-Termin im Zeitraum (ohne Feiertage/Sommerpause)"""
+    instances = [(i.date, i.time, i.capacity) for i in slot_calendar().between(start, end) if not is_blocked(i.date)]
+    supply = pd.DataFrame(instances, columns=['slot_date', 'slot_time', 'capacity'])
+    supply['slot_date'] = pd.to_datetime(supply['slot_date'], format='%Y-%m-%d')
+    return supply
+
+# ===== SITZUNGEN (dauerhafter Login) =====
+SESSION_PARAM = "s"   # Query-Parameter mit dem Sitzungs-Token (übersteht Reload und Reconnect)
+SESSION_DAYS = 14     # Gültigkeit ab letzter Nutzung; das Token wird höchstens einmal täglich erneuert
+
+@st.cache_resource
+def session_key():
+    """HMAC-Schlüssel aus SESSION_SECRET; ohne Secret zufällig pro Prozess (Tokens enden mit dem Neustart)"""
+    key = get_secret("SESSION_SECRET","") if hasattr(st,'secrets') else ""
+    if not key:
+        print("⚠️ SESSION_SECRET fehlt: Logins überstehen keinen Neustart")
+        return secrets.token_bytes(32)
+    return key.encode()
+
+@st.cache_resource
+def session_cache():
+    """Prozessweiter Cache E-Mail -> (Users-Version, User): Reconnects prüfen das Token ohne Datenbankzugriff;
+    jede Änderung an Usern (Deaktivierung, Passwort-Reset, Löschen) erhöht die Version und erzwingt eine neue Prüfung"""
+    return {'users':{},'lock':threading.Lock()}
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def _sign(body):
+    return _b64(hmac.new(session_key(),body.encode(),hashlib.sha256).digest())
+
+def issue_session(user):
+    now = int(time.time()*1000)
+    body = _b64(json.dumps({'u':user['email'],'iat':now,'exp':now+SESSION_DAYS*86400*1000},separators=(',',':')).encode())
+    return f"{body}.{_sign(body)}"
+
+def read_session(token):
+    """Payload {'u','iat','exp'} bei gültiger Signatur und nicht abgelaufen, sonst None"""
+    try:
+        body,sig = token.split('.')
+        if not hmac.compare_digest(sig,_sign(body)):
+            return None
+        payload = json.loads(base64.urlsafe_b64decode(body+'='*(-len(body)%4)))
+        return payload if payload['exp'] > time.time()*1000 else None
+    except Exception:
+        return None
+
+def session_user(token):
+    """User zum Token oder None (abgelaufen, gefälscht, deaktiviert, gelöscht oder widerrufen)"""
+    payload = read_session(token)
+    if not payload:
+        return None
+    cache = session_cache()
+    version = data_versions().get('users',0)
+    with cache['lock']:
+        entry = cache['users'].get(payload['u'])
+    if entry is None or entry[0] != version:
+        entry = (version,ww_db.get_user(payload['u']))
+        with cache['lock']:
+            cache['users'][payload['u']] = entry
+    user = entry[1]
+    if not user or not user.get('active',True) or payload['iat'] < user.get('sessions_revoked_at',0):
+        return None
+    return dict(user)
+
+def remember_login(user,force=False):
+    """Token in die URL schreiben; bestehendes gültiges Token nur erneuern, wenn es älter als ein Tag ist"""
+    payload = read_session(st.query_params.get(SESSION_PARAM,''))
+    if force or not payload or payload['u'] != user['email'] or payload['exp']-time.time()*1000 < (SESSION_DAYS-1)*86400*1000:
+        st.query_params[SESSION_PARAM] = issue_session(user)
+    if force:
+        with session_cache()['lock']:
+            session_cache()['users'].pop(user['email'],None)
+
+def cache_session_user(user):
+    """Frisch aus der Datenbank geladenen User (Login) vormerken: der erste Reconnect braucht keinen
+    Lesezugriff. Nie mit st.session_state.user aufrufen – der kann veraltet sein (z.B. ohne Widerruf)."""
+    cache = session_cache()
+    with cache['lock']:
+        cache['users'][user['email']] = (data_versions().get('users',0),dict(user))
+
+def logout():
+    """Abmelden beendet alle Sitzungen des Users, auch ein in Verlauf oder Lesezeichen gespeichertes Token"""
+    user = st.session_state.user
+    if user and user.get('id') and SESSION_PARAM in st.query_params:
+        ww_db.update_user(user['id'],sessions_revoked_at=int(time.time()*1000))
+    st.query_params.pop(SESSION_PARAM,None)
+    st.session_state.user = None
+    st.session_state.page = 'home'
 
 # ===== MAIN APP =====
 def main():
     if 'user' not in st.session_state:
         st.session_state.user = None
+    
+    # Sitzung aus dem Token wiederherstellen (Reload/Reconnect) bzw. widerrufene Sitzungen beenden
+    token = st.query_params.get(SESSION_PARAM)
+    if token:
+        user = session_user(token)
+        if user is None:
+            st.query_params.pop(SESSION_PARAM,None)
+            if st.session_state.user:
+                st.session_state.user = None
+                st.session_state.page = 'home'
+                st.warning("⏰ Sitzung abgelaufen, bitte neu anmelden")
+        elif st.session_state.user is None:
+            st.session_state.user = user
+            st.session_state.force_password_change = user.get('must_change_password',False)
+    if st.session_state.user and st.session_state.get('remember_login',True):
+        remember_login(st.session_state.user)
+    
     if 'last_activity' not in st.session_state:
         st.session_state.last_activity = datetime.now()
     
-    # Auto-Logout nach Inaktivität
+    # Auto-Logout nach Inaktivität (nur ohne "Angemeldet bleiben"; Token-Sitzungen laufen über SESSION_DAYS ab)
     timeout_min = 30
-    if st.session_state.user:
+    if st.session_state.user and not st.session_state.get('remember_login',True):
         inactive = (datetime.now()-st.session_state.last_activity).total_seconds()
         if inactive > timeout_min*60:
             st.session_state.user = None
@@ -758,6 +3679,9 @@ def main():
                 if st.button("📊 Dashboard",use_container_width=True):
                     st.session_state.page = 'dashboard'
                     st.rerun()
+                if st.button("📈 Analyse",use_container_width=True):
+                    st.session_state.page = 'analytics'
+                    st.rerun()
                 if st.button("👥 Benutzer",use_container_width=True):
                     st.session_state.page = 'users'
                     st.rerun()
@@ -776,8 +3700,7 @@ def main():
                 st.session_state.page = 'impressum'
                 st.rerun()
             if st.button("🚪 Logout",use_container_width=True):
-                st.session_state.user = None
-                st.session_state.page = 'home'
+                logout()
                 st.rerun()
         else:
             if st.button("🔑 Login",use_container_width=True):
@@ -792,6 +3715,13 @@ def main():
             st.session_state.dark_mode = not st.session_state.dark_mode
             st.rerun()
     
+    # Admin-Hinweis: fehlender Firestore-Index -> Fallback-Abfragen
+    if st.session_state.user and st.session_state.user.get('role') == 'admin':
+        idx = ww_db.index_status()
+        if idx['missing']:
+            st.warning(f"⚠️ Firestore-Index fehlt: {', '.join(idx['missing'])} – langsamer Fallback aktiv "
+                       f"({idx['degraded_queries']} Abfragen seit Start). Index anlegen und App neu starten.")
+    
     # Page Routing
     page = st.session_state.page
     if page == 'login':
@@ -810,6 +3740,8 @@ def main():
         show_profile()
     elif page == 'dashboard':
         show_dashboard()
+    elif page == 'analytics':
+        show_analytics()
     elif page == 'users':
         show_users_v2()
     elif page == 'export':
@@ -829,6 +3761,8 @@ def show_login():
         st.subheader("Anmelden")
         email = st.text_input("E-Mail", key="login_email")
         pw = st.text_input("Passwort", type="password", key="login_pw")
+        remember = st.checkbox("Angemeldet bleiben", value=True, key="login_remember",
+                               help=f"{SESSION_DAYS} Tage ohne erneute Anmeldung, auch nach Neuladen der Seite")
         
         if st.button("Login", type="primary", use_container_width=True):
             if not email or not pw:
@@ -837,6 +3771,9 @@ def show_login():
                 success, user = ww_db.auth(email, pw)
                 if success:
                     st.session_state.user = user
+                    st.session_state.remember_login = remember
+                    st.session_state.last_activity = datetime.now()
+                    cache_session_user(user)
                     
                     # NEU: Prüfe ob Passwort-Änderung erzwungen wird
                     if user.get('must_change_password', False):
@@ -869,7 +3806,7 @@ def show_login():
                 elif not accept:
                     st.error("❌ Bitte Datenschutzerklärung akzeptieren!")
                 else:
-                    success, msg = ww_db.createuser(email, name, phone, pw)
+                    success, msg = ww_db.create_user(email, name, phone, pw)
                     if success:
                         st.success(f"✅ {msg}")
                         st.balloons()
@@ -904,14 +3841,21 @@ def show_home():
             st.session_state.current_week += timedelta(days=7)
             st.rerun()
     
-    # FIX: Buchungen laden mit Fallback-Strategie
-    bookings = ww_db.get_week_bookings(cws.strftime("%Y-%m-%d"))
-    booking_map = {(b['slot_date'], b['slot_time']): b for b in bookings}
+    # Belegung der Woche aus den Monatsübersichten (1-2 Dokumente statt aller Buchungen)
+    occupancy = week_occupancy(cws)
+    bookings = [{'slot_date': d, 'slot_time': t, 'status': 'confirmed', **e}
+                for (d, t), entries in sorted(occupancy.items()) for e in entries]
     
     # ADMIN DEBUG-PANEL
     if user.get('role') == 'admin':
         with st.expander("🔧 Debug-Info (Admin)"):
             st.write(f"**Firestore Bookings:** {len(bookings)} geladen")
+            idx = ww_db.index_status()
+            st.write(f"**Index-Status:** {'✅ OK' if not idx['missing'] else '⚠️ Fehlt: '+', '.join(idx['missing'])} "
+                     f"| Fallback-Abfragen: {idx['degraded_queries']}")
+            ready = readiness()
+            st.write(f"**Warm-up:** {'✅ bereit' if ready['ready'] else '❌ '+str(ready['error'])} "
+                     f"in {ready['total_ms']} ms seit {ready['started']}")
             st.write(f"**E-Mail Status:** {'✅ Aktiv' if mailer.user else '❌ Keine Credentials'}")
             if mailer.user:
                 st.write(f"**SMTP User:** {mailer.user[:3]}***@{mailer.user.split('@')[1] if '@' in mailer.user else '???'}")
@@ -930,13 +3874,18 @@ def show_home():
             else:
                 st.info("Keine Buchungen in dieser Woche")
     
+    show_series_booking(user, cws)
+    
     # Slots anzeigen
-    for slot in WEEKLY_SLOTS:
-        sd = slot_date(cws, slot['day'])
-        slot_time_str = f"{slot['start']}-{slot['end']}"
+    for inst in slot_calendar().week(cws):
+        sd = inst.date
+        slot_time_str = inst.time
         
-        # CRITICAL: Prüfe ob gebucht
-        booking = booking_map.get((sd, slot_time_str))
+        # CRITICAL: Belegung prüfen (Plätze pro Slot laut Slot-Template)
+        entries = occupancy.get((sd, slot_time_str), [])
+        names = ", ".join(e['user_name'] for e in entries)
+        full = len(entries) >= inst.capacity
+        mine = any(e['user_email'] == user['email'] for e in entries)
         blocked = is_blocked(sd)
         
         # FIX: FARBEN - ORANGE wenn gebucht!
@@ -944,22 +3893,29 @@ def show_home():
             bg_color = f"{COLORS['grau_mittel']}80"
             border_color = COLORS['grau_mittel']
             status_badge = f"<span style='color:{COLORS['grau_dunkel']};font-weight:600'>🚫 {block_reason(sd)}</span>"
-        elif booking:
+        elif full and inst.capacity == 1:
             # ORANGE HINTERGRUND + NAME!
             bg_color = f"{COLORS['orange']}30"
             border_color = COLORS['orange']
-            status_badge = f"<span style='color:{COLORS['orange']};font-weight:600'>✅ Bereits von: <b>{booking['user_name']}</b> gebucht</span>"
+            status_badge = f"<span style='color:{COLORS['orange']};font-weight:600'>✅ Bereits von: <b>{names}</b> gebucht</span>"
+        elif entries:
+            # Mehrere Plätze: "2/3 belegt", orange erst wenn voll
+            bg_color = f"{COLORS['orange']}30" if full else f"{COLORS['warnung']}20"
+            border_color = COLORS['orange'] if full else COLORS['warnung']
+            status_badge = (f"<span style='color:{border_color};font-weight:600'>👥 {len(entries)}/{inst.capacity} belegt: "
+                            f"<b>{names}</b></span>")
         else:
             bg_color = f"{COLORS['blau']}10"
             border_color = COLORS['blau_hell']
-            status_badge = f"<span style='color:{COLORS['erfolg']};font-weight:600'>📅 Slot verfügbar</span>"
+            free_text = f" (0/{inst.capacity})" if inst.capacity > 1 else ""
+            status_badge = f"<span style='color:{COLORS['erfolg']};font-weight:600'>📅 Slot verfügbar{free_text}</span>"
         
         # Card HTML
         card_html = f'''<div style="background:{bg_color};border:2px solid {border_color};border-radius:12px;
             padding:1rem;margin:0.5rem 0;transition:all 0.3s">
             <div style="display:flex;justify-content:space-between;align-items:center">
                 <div>
-                    <div style="font-weight:bold;font-size:1.1rem">{slot['day_name']}, {fmt_de(sd)}</div>
+                    <div style="font-weight:bold;font-size:1.1rem">{inst.day_name}, {fmt_de(sd)}</div>
                     <div style="color:{COLORS['grau_dunkel']};font-size:0.9rem">{slot_time_str}</div>
                 </div>
                 <div>{status_badge}</div>
@@ -968,64 +3924,109 @@ def show_home():
         
         # Buttons
         if blocked:
-            pass
-        elif booking:
-            # Slot ist gebucht
-            if user['role'] == 'admin' or booking['user_email'] == user['email']:
-                if st.button(f"🔴 Stornieren", key=f"cancel_{slot['id']}_{sd}"):
-                    ww_db.cancel_booking(booking['id'], user['email'])
-                    mailer.cancellation_confirmation(booking['user_email'], booking['user_name'], sd, slot_time_str)
+            continue
+        
+        # Stornieren: eigene Buchung, Admins jede
+        for e in entries:
+            if user['role'] == 'admin' or e['user_email'] == user['email']:
+                label = "🔴 Stornieren" if inst.capacity == 1 or e['user_email'] == user['email'] else f"🔴 {e['user_name']} stornieren"
+                if st.button(label, key=f"cancel_{inst.slot_id}_{sd}_{e['id']}"):
+                    ww_db.cancel_booking(e['id'], user['email'])
+                    mailer.cancellation_confirmation(e['user_email'], e['user_name'], sd, slot_time_str)
                     st.success("✅ Storniert!")
                     st.rerun()
-        else:
-            # Slot ist frei
-            if st.button(f"✅ Buchen", key=f"book_{slot['id']}_{sd}", type="primary"):
-                # Nochmal prüfen (Race Condition)
-                existing = ww_db.get_booking(sd, slot_time_str)
-                
-                if existing and user['role'] != 'admin':
-                    st.error(f"❌ Bereits von **{existing['user_name']}** gebucht!")
+        
+        # Buchen, solange Plätze frei sind
+        if not full and not mine:
+            if st.button("✅ Buchen", key=f"book_{inst.slot_id}_{sd}", type="primary"):
+                success, msg = ww_db.create_booking(sd, slot_time_str, user['email'], user['name'], user.get('phone', ''),
+                                                    capacity=inst.capacity)
+                if success:
+                    mailer.booking_confirmation(user['email'], user['name'], sd, slot_time_str)
+                    u = ww_db.get_user(user['email'])
+                    if u.get('sms_booking_confirmation') and u.get('phone') and u.get('notification_mode') != 'daily':
+                        sms.booking_confirmation(u['phone'], user['name'], sd, slot_time_str)
+                    st.success("✅ Gebucht!")
+                    st.rerun()
                 
-                elif existing and user['role'] == 'admin':
+                # Race Condition: inzwischen belegt
+                existing = ww_db.get_booking(sd, slot_time_str) if inst.capacity == 1 else None
+                if existing and user['role'] == 'admin':
                     # ADMIN ÜBERSCHREIBEN
                     st.warning(f"⚠️ Bereits von **{existing['user_name']}** gebucht!")
-                    if st.button("🔄 Als Admin überschreiben", key=f"override_{slot['id']}_{sd}"):
-                        ww_db.cancel_booking(existing['id'], user['email'])
+                    if st.button("🔄 Als Admin überschreiben", key=f"override_{inst.slot_id}_{sd}"):
+                        ww_db.cancel_booking(existing['id'], user['email'], event='override')
                         success, msg = ww_db.create_booking(sd, slot_time_str, user['email'], user['name'], user.get('phone', ''))
                         if success:
                             mailer.booking_confirmation(user['email'], user['name'], sd, slot_time_str)
                             u = ww_db.get_user(user['email'])
-                            if u.get('sms_booking_confirmation') and u.get('phone'):
+                            if u.get('sms_booking_confirmation') and u.get('phone') and u.get('notification_mode') != 'daily':
                                 sms.booking_confirmation(u['phone'], user['name'], sd, slot_time_str)
                             st.success("✅ Überschrieben und gebucht!")
                             st.rerun()
                         else:
                             st.error(f"❌ {msg}")
-                
+                elif existing:
+                    st.error(f"❌ Bereits von **{existing['user_name']}** gebucht!")
                 else:
-                    # Normal buchen
-                    success, msg = ww_db.create_booking(sd, slot_time_str, user['email'], user['name'], user.get('phone', ''))
-                    if success:
-                        mailer.booking_confirmation(user['email'], user['name'], sd, slot_time_str)
-                        u = ww_db.get_user(user['email'])
-                        if u.get('sms_booking_confirmation') and u.get('phone'):
-                            sms.booking_confirmation(u['phone'], user['name'], sd, slot_time_str)
-                        st.success("✅ Gebucht!")
-                        st.rerun()
-                    else:
-                        st.error(f"❌ {msg}")
+                    st.error(f"❌ {msg}")
+
+def show_series_booking(user, cws):
+    """Serienbuchung: alle freien Termine eines Slots im Zeitraum mit einem Klick"""
+    result = st.session_state.pop('series_result', None)
+    with st.expander("🔁 Serienbuchung", expanded=result is not None):
+        if result:
+            st.success(f"✅ {len(result['booked'])} Schichten gebucht")
+            if result['taken']:
+                st.warning("⚠️ Bereits belegt: " + ", ".join(f"{fmt_de(d)} {t}" for d,t in result['taken']))
+        calendar = slot_calendar()
+        if not calendar.templates:
+            st.info("Keine Slots konfiguriert")
+            return
+        labels = {t['id']:f"{WEEKDAY_NAMES[WEEKDAYS.index(t['day'])]} {t['start']}-{t['end']}" for t in calendar.templates}
+        start = max(cws, date.today())
+        c1,c2,c3 = st.columns(3)
+        slot_id = c1.selectbox("Slot", list(labels), format_func=labels.get, key="series_slot")
+        s_from = c2.date_input("Von", value=start, min_value=date.today(), key="series_from")
+        s_until = c3.date_input("Bis", value=start+timedelta(weeks=8), min_value=date.today(), key="series_until")
+        
+        instances = calendar.series(slot_id, s_from, s_until)
+        summaries = {m: cached_month_summary(m) for m in sorted({i.date[:7] for i in instances})}
+        free = [i for i in instances if not StorageBackend.slot_refusal(
+            StorageBackend.slot_entries(summaries[i.date[:7]], i.date, i.time), user['email'], i.capacity)]
+        st.caption(f"{len(instances)} Termine (Feiertage/Sommerpause ausgelassen), davon {len(free)} frei"
+                   + (f" – maximal {SERIES_MAX_SLOTS} pro Buchung" if len(free) > SERIES_MAX_SLOTS else ""))
+        
+        if st.button(f"✅ Serie buchen ({min(len(free), SERIES_MAX_SLOTS)} Termine)", key="series_book",
+                     type="primary", disabled=not free):
+            success, res = ww_db.create_series([(i.date, i.time, i.capacity) for i in free],
+                                               user['email'], user['name'], user.get('phone', ''))
+            if not success:
+                st.error(f"❌ {res}")
+                return
+            if res['booked']:
+                mailer.series_confirmation(user['email'], user['name'], res['booked'])
+                u = ww_db.get_user(user['email'])
+                if u and u.get('sms_booking_confirmation') and u.get('phone') and u.get('notification_mode') != 'daily':
+                    sms.series_confirmation(u['phone'], user['name'], res['booked'])
+            st.session_state.series_result = res
+            st.rerun()
 
 def show_my_bookings():
     st.title("📅 Meine Schichten")
     user = st.session_state.user
-    bookings = ww_db.get_user_bookings(user['email'])
+    today = datetime.now().strftime("%Y-%m-%d")
+    # Kommende Schichten vollständig (mit Storno), Vergangenes seitenweise
+    cursors = st.session_state.setdefault('history_cursors', [None])
+    upcoming = ww_db.get_user_bookings(user['email'], future_only=True)
+    history, next_cursor = ww_db.user_history(user['email'], today, cursors[-1])
     
-    if not bookings:
+    if not upcoming and not history and len(cursors) == 1:
         st.info("Du hast noch keine Buchungen.")
         return
     
-    for b in bookings:
-        is_past = datetime.strptime(b['slot_date'],"%Y-%m-%d") < datetime.now()
+    for b in upcoming + history:
+        is_past = b['slot_date'] < today
         bg = f"{COLORS['grau_mittel']}40" if is_past else f"{COLORS['erfolg']}20"
         border = COLORS['grau_mittel'] if is_past else COLORS['erfolg']
         
@@ -1044,6 +4045,19 @@ def show_my_bookings():
                 ww_db.cancel_booking(b['id'], user['email'])
                 mailer.cancellation_confirmation(user['email'], user['name'], b['slot_date'], b['slot_time'])
                 st.rerun()
+    
+    if len(cursors) > 1 or next_cursor:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀ Neuere", disabled=len(cursors) == 1, use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Verlauf Seite {len(cursors)}")
+        with col3:
+            if st.button("Ältere ▶", disabled=not next_cursor, use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
 
 def show_all_bookings():
     if st.session_state.user.get('role') != 'admin':
@@ -1055,25 +4069,27 @@ def show_all_bookings():
     col1, col2, col3 = st.columns(3)
     with col1:
         filter_type = st.selectbox("Zeitraum", ["Kommende", "Alle", "Vergangene"])
+    
+    # User und Buchungen parallel laden
+    today = datetime.now().strftime("%Y-%m-%d")
+    yesterday = (datetime.now()-timedelta(days=1)).strftime("%Y-%m-%d")
+    data = fetch_all(
+        users=cached_users,
+        bookings=lambda: ww_db.list_bookings(status='confirmed',
+                                             date_from=today if filter_type == "Kommende" else None,
+                                             date_to=yesterday if filter_type == "Vergangene" else None,
+                                             fields=['slot_date','slot_time','user_name']))
+    
     with col2:
-        all_users = ww_db.get_all_users()
+        all_users = data['users']
         user_filter = st.selectbox("User", ["Alle"] + [u['name'] for u in all_users])
     with col3:
         sort_order = st.selectbox("Sortierung", ["Datum ↑", "Datum ↓"])
     
     try:
-        today = datetime.now().strftime("%Y-%m-%d")
         bookings = []
         
-        for doc in ww_db.db.collection('bookings').where('status', '==', 'confirmed').stream():
-            b = doc.to_dict()
-            b['id'] = doc.id
-            
-            if filter_type == "Kommende" and b['slot_date'] < today:
-                continue
-            elif filter_type == "Vergangene" and b['slot_date'] >= today:
-                continue
-            
+        for b in data['bookings']:
             if user_filter != "Alle" and b.get('user_name') != user_filter:
                 continue
             
@@ -1127,18 +4143,10 @@ def show_month_calendar():
     month = st.session_state.calendar_month
     year = st.session_state.calendar_year
     
-    # Buchungen laden
-    bookings = {}
-    try:
-        for doc in ww_db.db.collection('bookings').where('status', '==', 'confirmed').stream():
-            b = doc.to_dict()
-            date_str = b['slot_date']
-            if date_str.startswith(f"{year}-{month:02d}"):
-                if date_str not in bookings:
-                    bookings[date_str] = []
-                bookings[date_str].append(b)
-    except:
-        pass
+    # Buchungen laden (ein Dokument pro Monat)
+    summary = cached_month_summary(f"{year}-{month:02d}")
+    bookings = {d: [b for t in sorted(slots) for b in StorageBackend.slot_entries(summary, d, t)]
+                for d, slots in summary['days'].items()}
     
     # Kalender anzeigen
     cal = cal_module.monthcalendar(year, month)
@@ -1225,9 +4233,10 @@ def show_profile():
                     st.error("❌ Passwort muss mindestens 6 Zeichen haben!")
                 else:
                     # Passwort ändern
-                    ww_db.updateuser(user['id'], password_hash=hashpw(new_pw), must_change_password=False)
-                    st.session_state.user['password_hash'] = hashpw(new_pw)
-                    st.session_state.user['must_change_password'] = False
+                    ww_db.update_user(user['id'], password_hash=hash_pw(new_pw), must_change_password=False)
+                    if st.session_state.get('remember_login', True):
+                        remember_login(user, force=True)  # altes Token ist mit dem Passwortwechsel widerrufen
+                    st.session_state.user = ww_db.get_user(user['email']) or st.session_state.user
                     if 'force_password_change' in st.session_state:
                         del st.session_state.force_password_change
                     st.success("✅ Passwort erfolgreich geändert! Sie können die App jetzt nutzen.")
@@ -1237,7 +4246,7 @@ def show_profile():
         st.stop()  # Blockiert Zugriff auf restliche Profil-Seite
     
     # NORMALER PROFIL-CODE
-    tab1, tab2, tab3 = st.tabs(["📝 Daten", "🔐 Passwort", "📧 Tests"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📝 Daten", "🔐 Passwort", "📧 Tests", "📊 Statistik"])
     
     with tab1:
         st.info(f"**E-Mail:** {user['email']}")
@@ -1246,12 +4255,16 @@ def show_profile():
         email_notif = st.checkbox("E-Mail-Benachrichtigungen", value=user.get('email_notifications', True))
         sms_notif = st.checkbox("SMS-Reminder (24h/1h vorher)", value=user.get('sms_notifications', False))
         sms_booking = st.checkbox("SMS bei Buchung sofort", value=user.get('sms_booking_confirmation', True))
+        modes = list(NOTIFICATION_MODES)
+        mode = st.radio("Buchungs-/Storno-Mails", modes, format_func=NOTIFICATION_MODES.get, horizontal=True,
+                        index=modes.index(user.get('notification_mode', 'instant')) if user.get('notification_mode') in modes else 0,
+                        help="Tägliche Zusammenfassung: eine E-Mail am Abend statt einzelner Mails, keine Buchungs-SMS")
         
         if st.button("💾 Speichern", type="primary"):
-            ww_db.updateuser(user['id'], name=name, phone=phone, email_notifications=email_notif,
-                           sms_notifications=sms_notif, sms_booking_confirmation=sms_booking)
+            ww_db.update_user(user['id'], name=name, phone=phone, email_notifications=email_notif,
+                           sms_notifications=sms_notif, sms_booking_confirmation=sms_booking, notification_mode=mode)
             st.success("✅ Gespeichert!")
-            st.session_state.user = ww_db.getuser(user['email'])
+            st.session_state.user = ww_db.get_user(user['email'])
     
     with tab2:
         st.subheader("Passwort ändern")
@@ -1262,14 +4275,17 @@ def show_profile():
         if st.button("🔐 Passwort ändern", type="primary"):
             if not old_pw or not new_pw or not new_pw2:
                 st.error("❌ Alle Felder ausfüllen!")
-            elif hashpw(old_pw) != user['password_hash']:
+            elif hash_pw(old_pw) != user['password_hash']:
                 st.error("❌ Altes Passwort falsch!")
             elif new_pw != new_pw2:
                 st.error("❌ Neue Passwörter ungleich!")
             elif len(new_pw) < 8:
                 st.error("❌ Min. 8 Zeichen!")
             else:
-                ww_db.updateuser(user['id'], password_hash=hashpw(new_pw))
+                ww_db.update_user(user['id'], password_hash=hash_pw(new_pw))
+                if st.session_state.get('remember_login', True):
+                    remember_login(user, force=True)  # andere Geräte müssen sich neu anmelden
+                st.session_state.user = ww_db.get_user(user['email']) or st.session_state.user
                 st.success("✅ Passwort geändert!")
     
     with tab3:
@@ -1291,6 +4307,30 @@ def show_profile():
                     st.success("✅ SMS gesendet!")
                 else:
                     st.error("❌ SMS-Fehler!")
+    
+    with tab4:
+        stats = user_stats(user['email'])
+        today = datetime.now().strftime("%Y-%m-%d")
+        years, pending, last = shift_totals(stats, today)
+        this_year = years.get(today[:4], {'shifts': 0, 'hours': 0})
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Schichten geleistet", sum(y['shifts'] for y in years.values()))
+        col2.metric("Stunden gesamt", f"{sum(y['hours'] for y in years.values()):g}")
+        col3.metric(f"Stunden {today[:4]}", f"{this_year['hours']:g}", f"{this_year['shifts']} Schichten", delta_color="off")
+        
+        col1, col2 = st.columns(2)
+        col1.info(f"**Letzte Schicht:** {fmt_de(last) if last else '–'}")
+        col2.info(f"**Nächste Schicht:** {fmt_de(pending[0]['slot_date'])+' '+pending[0]['slot_time'] if pending else '–'}")
+        
+        if years:
+            st.markdown("**Pro Jahr** (für die Ehrenamtsbescheinigung)")
+            st.dataframe(pd.DataFrame([{'Jahr': y, 'Schichten': v['shifts'], 'Stunden': v['hours']}
+                                       for y, v in sorted(years.items(), reverse=True)]),
+                         use_container_width=True, hide_index=True)
+        if pending:
+            st.caption(f"Gebucht, noch nicht geleistet: {len(pending)} Schichten, "
+                       f"{sum(slot_hours(u['slot_time']) for u in pending):g} Stunden")
 
 # FIX: Dashboard mit Scoreboard
 def show_dashboard():
@@ -1299,7 +4339,8 @@ def show_dashboard():
         return
     
     st.title("📊 Dashboard")
-    stats = ww_db.get_stats()
+    data = fetch_all(stats=ww_db.get_stats, views=cached_views)
+    stats = data['stats']
     
     # Statistik-Boxen
     col1, col2, col3 = st.columns(3)
@@ -1315,14 +4356,11 @@ def show_dashboard():
     # NEU: Scoreboard
     st.subheader("🏆 Schicht-Scoreboard")
     try:
-        user_stats = []
-        for doc in ww_db.db.collection('bookings').where('status', '==', 'confirmed').stream():
-            b = doc.to_dict()
-            user_stats.append(b.get('user_name', ''))
+        # Aus dem Ereignisprotokoll fortgeschrieben statt aus allen Buchungen gezählt
+        scoreboard = sorted(data['views']['scoreboard'].values(), key=lambda x: -x['count'])
         
-        if user_stats:
-            user_counts = Counter(user_stats)
-            scoreboard_data = [{'Name': name, 'Schichten': count} for name, count in user_counts.most_common()]
+        if scoreboard:
+            scoreboard_data = [{'Name': row['name'], 'Schichten': row['count']} for row in scoreboard]
             
             for idx, row in enumerate(scoreboard_data[:10]):
                 if idx == 0:
@@ -1338,6 +4376,13 @@ def show_dashboard():
     except Exception as e:
         st.error(f"Scoreboard-Fehler: {e}")
     
+    months = data['views']['months']
+    if months:
+        st.subheader("📈 Schichten pro Monat")
+        recent = sorted(months)[-12:]
+        st.bar_chart(pd.DataFrame({'Gebucht': [months[m]['confirmed'] for m in recent],
+                                   'Storniert': [months[m]['cancelled'] for m in recent]}, index=recent))
+    
     st.divider()
     st.subheader("🆓 Freie Slots (nächste 4 Wochen)")
     free = stats['free_slots_next_4weeks']
@@ -1353,6 +4398,84 @@ def show_dashboard():
     else:
         st.success("✅ Alle Slots gebucht!")
 
+def show_analytics():
+    if st.session_state.user.get('role') != 'admin':
+        st.error("❌ Nur für Admins")
+        return
+    
+    st.title("📈 Analyse")
+    df = analytics_frame()
+    if df.empty:
+        st.info("Noch keine Buchungen")
+        return
+    
+    today = date.today()
+    c1, c2 = st.columns(2)
+    start = c1.date_input("Von", value=max(df['slot_date'].min().date(), today - timedelta(days=730)), format="DD.MM.YYYY")
+    end = c2.date_input("Bis", value=today, format="DD.MM.YYYY")
+    df = df[(df['slot_date'] >= pd.Timestamp(start)) & (df['slot_date'] <= pd.Timestamp(end))]
+    confirmed = df[df['status'] == 'confirmed']
+    
+    # Auslastung: bestätigte Buchungen je Slot-Termin gegen angebotene Plätze
+    supply = slot_supply(start, end)
+    booked = confirmed.groupby(['slot_date', 'slot_time'], observed=True).size().rename('booked').reset_index()
+    booked['slot_time'] = booked['slot_time'].astype(str)
+    fill = supply.merge(booked, on=['slot_date', 'slot_time'], how='left').fillna({'booked': 0})
+    fill['rate'] = (fill['booked'].clip(upper=fill['capacity']) / fill['capacity'])
+    fill['weekday'] = pd.Categorical(fill['slot_date'].dt.dayofweek.map(dict(enumerate(WEEKDAY_NAMES))),
+                                     categories=WEEKDAY_NAMES, ordered=True)
+    fill['month'] = fill['slot_date'].dt.to_period('M').astype(str)
+    
+    cancel_rate = (df['status'] == 'cancelled').mean() if len(df) else 0
+    lead = (confirmed['slot_date'] - confirmed['created_at'].dt.normalize()).dt.days.dropna()
+    lead = lead[lead >= 0]
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Auslastung", f"{fill['rate'].mean():.0%}" if len(fill) else "–")
+    m2.metric("Schichten", f"{len(confirmed)}")
+    m3.metric("Stornoquote", f"{cancel_rate:.0%}")
+    m4.metric("Vorlauf (Median)", f"{lead.median():.0f} Tage" if len(lead) else "–")
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Auslastung", "🔴 Stornos", "⏱️ Vorlauf", "👥 Helfer"])
+    
+    with tab1:
+        if fill.empty:
+            st.info("Keine Slots im Zeitraum")
+        else:
+            heat = fill.pivot_table(index='slot_time', columns='weekday', values='rate', aggfunc='mean', observed=True)
+            st.plotly_chart(px.imshow(heat, text_auto='.0%', color_continuous_scale='RdYlGn', zmin=0, zmax=1,
+                                      labels={'x': 'Wochentag', 'y': 'Slot', 'color': 'Auslastung'}),
+                            use_container_width=True)
+            monthly = fill.groupby('month')['rate'].mean().reset_index()
+            fig = px.line(monthly, x='month', y='rate', markers=True, labels={'month': 'Monat', 'rate': 'Auslastung'})
+            fig.update_yaxes(tickformat='.0%', range=[0, 1])
+            st.plotly_chart(fig, use_container_width=True)
+    
+    with tab2:
+        per_month = df.assign(month=df['slot_date'].dt.to_period('M').astype(str),
+                              cancelled=df['status'] == 'cancelled').groupby('month')['cancelled'].agg(['mean', 'sum']).reset_index()
+        fig = px.bar(per_month, x='month', y='mean', hover_data={'sum': True},
+                     labels={'month': 'Monat', 'mean': 'Stornoquote', 'sum': 'Stornos'})
+        fig.update_yaxes(tickformat='.0%')
+        st.plotly_chart(fig, use_container_width=True)
+    
+    with tab3:
+        if lead.empty:
+            st.info("Keine Buchungszeitpunkte vorhanden")
+        else:
+            st.plotly_chart(px.histogram(lead.clip(upper=120), nbins=40, labels={'value': 'Tage zwischen Buchung und Schicht'})
+                            .update_layout(showlegend=False, yaxis_title='Schichten'), use_container_width=True)
+    
+    with tab4:
+        counts = confirmed['user_name'].value_counts()
+        top = [n for n in counts.index[:5] if n]
+        chosen = st.multiselect("Helfer", [n for n in counts.index if n], default=top)
+        if chosen:
+            trend = (confirmed[confirmed['user_name'].isin(chosen)]
+                     .assign(quarter=lambda d: d['slot_date'].dt.to_period('Q').astype(str))
+                     .groupby(['quarter', 'user_name'], observed=True).size().rename('Schichten').reset_index())
+            st.plotly_chart(px.line(trend, x='quarter', y='Schichten', color='user_name', markers=True,
+                                    labels={'quarter': 'Quartal', 'user_name': 'Helfer'}), use_container_width=True)
+
 def show_users_v2():
     """Benutzerverwaltung (Admin) - MIT PASSWORT-RESET"""
     
@@ -1373,12 +4496,12 @@ def show_users_v2():
     # DEBUG: Version-Check
     st.caption("🔧 Version: Mit Passwort-Reset (v2.0)")
     
-    tab1, tab2, tab3 = st.tabs(["📋 Liste", "➕ Neu anlegen", "👤 Für User buchen"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 Liste", "➕ Neu anlegen", "👤 Für User buchen", "📦 Import/Export"])
     
     # ===== TAB 1: BENUTZER-LISTE (MIT PASSWORT-RESET) =====
     with tab1:
         st.subheader("Alle Benutzer")
-        users = ww_db.getallusers()
+        users = cached_users()
         
         if not users:
             st.info("Noch keine Benutzer vorhanden.")
@@ -1412,9 +4535,13 @@ def show_users_v2():
                         # Button 1: Löschen
                         if u['email'] != st.session_state.user['email']:
                             if st.button("🗑️ Löschen", key=f"del_{u['id']}", use_container_width=True):
-                                ww_db.deleteuser(u['email'])
+                                ww_db.delete_user(u['email'])
                                 st.success("✅ Gelöscht")
                                 st.rerun()
+                            active = u.get('active', True)
+                            if st.button("🚫 Deaktivieren" if active else "✅ Aktivieren", key=f"active_{u['id']}", use_container_width=True):
+                                ww_db.update_user(u['id'], active=not active)  # Deaktivieren beendet alle Sitzungen
+                                st.rerun()
                         else:
                             st.caption("⚠️ Eigener Account")
                         
@@ -1490,9 +4617,9 @@ def show_users_v2():
                                     reset_time = datetime.now(TZ).strftime('%d.%m.%Y %H:%M')
                                     
                                     try:
-                                        ww_db.updateuser(
+                                        ww_db.update_user(
                                             u['id'],
-                                            password_hash=hashpw(new_pw),
+                                            password_hash=hash_pw(new_pw),
                                             must_change_password=True,
                                             password_reset_at=reset_time,
                                             password_reset_by=admin_name
@@ -1535,17 +4662,61 @@ def show_users_v2():
             role = st.selectbox("Rolle", ["user", "admin"])
             
             if st.form_submit_button("User anlegen", type="primary"):
-                success, msg = ww_db.createuser(email, name, phone, password, role)
+                success, msg = ww_db.create_user(email, name, phone, password, role)
                 if success:
                     st.success(f"✅ {msg}")
                 else:
                     st.error(f"❌ {msg}")
     
+    # ===== TAB 4: MASSENIMPORT / -EXPORT =====
+    with tab4:
+        st.subheader("User exportieren")
+        # Dateien erst auf Anforderung erzeugen; gültig bis sich die User ändern
+        stamp = datetime.now().strftime('%Y%m%d')
+        version = data_versions().get('users', 0)
+        if st.session_state.get('users_export') != version:
+            if st.button("📦 Export erstellen", use_container_width=True):
+                st.session_state.users_export = version
+                st.rerun()
+        else:
+            c1, c2 = st.columns(2)
+            c1.download_button("📄 CSV", cached_users_export('csv', version), f"user_{stamp}.csv", "text/csv",
+                               use_container_width=True)
+            c2.download_button("📊 Excel", cached_users_export('xlsx', version), f"user_{stamp}.xlsx",
+                               "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+        
+        st.subheader("User importieren")
+        st.caption(f"Spalten: {', '.join(USER_EXPORT_COLUMNS[:5])}, optional password. "
+                   "Ohne Passwort wird eines erzeugt und muss beim ersten Login geändert werden.")
+        uploaded = st.file_uploader("CSV oder Excel", type=['csv', 'xlsx'], key="user_import")
+        if uploaded:
+            try:
+                rows = read_user_table(uploaded)
+            except Exception as e:
+                st.error(f"❌ Datei nicht lesbar: {e}")
+                rows = []
+            if rows:
+                st.info(f"{len(rows)} Zeilen gelesen")
+                if st.button(f"📥 {len(rows)} User importieren", type="primary", key="user_import_run"):
+                    st.session_state.user_import_result = ww_db.import_users(rows)
+        
+        result = st.session_state.get('user_import_result')
+        if result:
+            ok = sum(1 for r in result if r['status'] == 'ok')
+            if ok:
+                st.success(f"✅ {ok} angelegt")
+            if ok < len(result):
+                st.warning(f"⚠️ {len(result)-ok} Zeilen übersprungen")
+            df = pd.DataFrame(result)
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            st.download_button("💾 Ergebnis mit erzeugten Passwörtern", df.to_csv(index=False).encode('utf-8-sig'),
+                               f"import_ergebnis_{stamp}.csv", "text/csv")
+    
     # ===== TAB 3: FÜR USER BUCHEN =====
     with tab3:
         st.subheader("Für User buchen (Admin)")
         
-        users = ww_db.getallusers()
+        users = ww_db.get_all_users()
         user_options = {f"{u['name']} ({u['email']})": u for u in users}
         
         if not user_options:
@@ -1572,28 +4743,31 @@ def show_users_v2():
                 st.session_state.admin_book_week += timedelta(days=7)
                 st.rerun()
         
-        bookings = ww_db.getweekbookings(cws.strftime("%Y-%m-%d"))
+        bookings = cached_week_bookings(cws.strftime("%Y-%m-%d"))
         
-        for slot in WEEKLY_SLOTS:
-            sd = slotdate(cws, slot['day'])
-            slot_time_str = f"{slot['start']}-{slot['end']}"
+        for inst in slot_calendar().week(cws):
+            sd = inst.date
+            slot_time_str = inst.time
             
-            existing = next((b for b in bookings if b['slot_date'] == sd and slot_time_str in b.get('slot_time', '')), None)
-            blocked = isblocked(sd)
+            existing = [b for b in bookings if b['slot_date'] == sd and slot_time_str in b.get('slot_time', '')]
+            blocked = is_blocked(sd)
             
-            st.markdown(f"**{slot['day_name']}, {fmtde(sd)} - {slot_time_str}**")
+            st.markdown(f"**{inst.day_name}, {fmt_de(sd)} - {slot_time_str}**")
             
             if blocked:
-                st.warning(f"🚫 Blockiert: {blockreason(sd)}")
-            elif existing:
-                st.info(f"✅ Bereits gebucht von: {existing['user_name']}")
+                st.warning(f"🚫 Blockiert: {block_reason(sd)}")
+            elif len(existing) >= inst.capacity or any(b['user_email'] == selected_user['email'] for b in existing):
+                st.info(f"✅ Bereits gebucht von: {', '.join(b['user_name'] for b in existing)}")
             else:
-                if st.button(f"📝 Für {selected_user['name']} buchen", key=f"adminbook_{slot['id']}_{sd}"):
-                    success, msg = ww_db.createbooking(
+                if existing:
+                    st.caption(f"👥 {len(existing)}/{inst.capacity} belegt: {', '.join(b['user_name'] for b in existing)}")
+                if st.button(f"📝 Für {selected_user['name']} buchen", key=f"adminbook_{inst.slot_id}_{sd}"):
+                    success, msg = ww_db.create_booking(
                         sd, slot_time_str,
                         selected_user['email'],
                         selected_user['name'],
-                        selected_user.get('phone', '')
+                        selected_user.get('phone', ''),
+                        capacity=inst.capacity
                     )
                     if success:
                         st.success(f"✅ {msg}")
@@ -1608,6 +4782,96 @@ def show_users_v2():
                         st.error(f"❌ {msg}")
 
 
+def read_user_table(uploaded):
+    """Hochgeladene CSV/XLSX als Liste von Zeilen-Dicts (Spaltennamen normalisiert, alles als Text)"""
+    if uploaded.name.lower().endswith(('.xlsx','.xls')):
+        df = pd.read_excel(uploaded, dtype=str).fillna('')
+    else:
+        # Trennzeichen erkennen: deutsches Excel exportiert mit ';'
+        df = pd.read_csv(uploaded, dtype=str, sep=None, engine='python', keep_default_na=False, encoding='utf-8-sig')
+    df.columns = [USER_IMPORT_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()) for c in df.columns]
+    return df.to_dict('records')
+
+def users_export(users, fmt):
+    """User-Liste im Importformat (ohne Passwort-Hashes) als CSV- oder XLSX-Bytes"""
+    df = pd.DataFrame([{c: u.get(c, '') for c in USER_EXPORT_COLUMNS} for u in users], columns=USER_EXPORT_COLUMNS)
+    if fmt == 'csv':
+        return df.to_csv(index=False).encode('utf-8-sig')
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name="User")
+    return buffer.getvalue()
+
+@st.cache_data(ttl=3600, max_entries=4, show_spinner=False)
+def cached_users_export(fmt, version):
+    """users_export je Users-Version einmal erzeugen"""
+    return users_export(cached_users(), fmt)
+
+def _archived_for_export(date_from, date_to, status, user_email):
+    """Archivierte Buchungen im Zeitraum; liest nur die Segmente der betroffenen Monate"""
+    index = ww_db.archive_index()
+    for month in sorted(index):
+        if (date_from and month < date_from[:7]) or (date_to and month > date_to[:7]):
+            continue
+        for b in read_segment(index[month]['key']):
+            if ((not date_from or b.get('slot_date','') >= date_from) and (not date_to or b.get('slot_date','') <= date_to)
+                    and (not status or b.get('status') == status) and (not user_email or b.get('user_email') == user_email)):
+                yield b
+
+def _export_rows(bookings, as_date=False):
+    for b in sorted(bookings, key=lambda x: (x.get('slot_date',''), x.get('slot_time',''))):
+        row = [b.get(f,'') for f,_,_ in EXPORT_COLUMNS]
+        if as_date and row[0]:
+            row[0] = date.fromisoformat(row[0])
+        yield row
+
+def _write_sheet(wb, title, columns, rows):
+    """Write-only-Blatt: Zeilen werden direkt serialisiert statt im Speicher gehalten"""
+    ws = wb.create_sheet(title)
+    for i, (_, _, width) in enumerate(columns, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    header = []
+    for _, label, _ in columns:
+        cell = WriteOnlyCell(ws, value=label)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    ws.append(header)
+    for row in rows:
+        ws.append(row)
+
+def build_export(fmt, date_from=None, date_to=None, status=None, user_email=None, with_users=False, with_archive=False):
+    """Buchungs-Export als XLSX- (Blätter Buchungen, optional Archiv und User) oder CSV-Bytes.
+    Zeitraum, Status und User werden in die Abfrage übernommen"""
+    bookings = ww_db.list_bookings(status=status, date_from=date_from, date_to=date_to, user_email=user_email,
+                                   fields=[f for f,_,_ in EXPORT_COLUMNS])
+    archived = list(_archived_for_export(date_from, date_to, status, user_email)) if with_archive else []
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow([label for _, label, _ in EXPORT_COLUMNS])
+        writer.writerows(_export_rows(bookings + archived))
+        return out.getvalue().encode('utf-8-sig')
+    wb = Workbook(write_only=True)
+    _write_sheet(wb, "Buchungen", EXPORT_COLUMNS, _export_rows(bookings, as_date=True))
+    if with_archive:
+        _write_sheet(wb, "Archiv", EXPORT_COLUMNS, _export_rows(archived, as_date=True))
+    if with_users:
+        _write_sheet(wb, "User", [(c, c, 18) for c in USER_EXPORT_COLUMNS],
+                     ([u.get(c,'') for c in USER_EXPORT_COLUMNS] for u in sorted(cached_users(), key=lambda u: u.get('name',''))))
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def _cached_export(fmt, date_from, date_to, status, user_email, with_users, with_archive, versions):
+    return build_export(fmt, date_from, date_to, status, user_email, with_users, with_archive)
+
+def cached_export(fmt, date_from=None, date_to=None, status=None, user_email=None, with_users=False, with_archive=False):
+    """Gleicher Export bei gleicher Datenversion kommt aus dem Cache"""
+    v = data_versions()
+    versions = (v.get('bookings',0), v.get('users',0) if with_users else None, v.get('archive',0) if with_archive else None)
+    return _cached_export(fmt, date_from, date_to, status, user_email, with_users, with_archive, versions)
+
 def show_export():
     if st.session_state.user.get('role') != 'admin':
         st.error("❌ Nur für Admins")
@@ -1619,23 +4883,29 @@ def show_export():
     
     with col1:
         st.markdown(f"""<div style='background:{COLORS['grau_hell']};padding:1.5rem;border-radius:12px;text-align:center'>
-            <h3>📊 Excel Export</h3><p>Alle Buchungen als Excel</p></div>""", unsafe_allow_html=True)
+            <h3>📊 Excel Export</h3><p>Buchungen als Excel oder CSV</p></div>""", unsafe_allow_html=True)
+        c1, c2 = st.columns(2)
+        date_from = c1.date_input("Von", value=None, format="DD.MM.YYYY", key="export_from")
+        date_to = c2.date_input("Bis", value=None, format="DD.MM.YYYY", key="export_to")
+        c1, c2 = st.columns(2)
+        status = c1.selectbox("Status", list(EXPORT_STATUS), key="export_status")
+        users = {u['name']: u['email'] for u in cached_users()}
+        user_name = c2.selectbox("User", ["Alle"] + sorted(users), key="export_user")
+        fmt = st.radio("Format", ["Excel", "CSV"], horizontal=True, key="export_fmt")
+        c1, c2 = st.columns(2)
+        with_archive = c1.checkbox("Archiv einbeziehen", key="export_archive")
+        with_users = c2.checkbox("User-Blatt", key="export_users", disabled=fmt == "CSV")
+        
+        ext = 'xlsx' if fmt == "Excel" else 'csv'
+        params = (ext, date_from.isoformat() if date_from else None, date_to.isoformat() if date_to else None,
+                  EXPORT_STATUS[status], users.get(user_name), with_users and ext == 'xlsx', with_archive)
         if st.button("📊 Excel Download", type="primary", use_container_width=True):
-            bookings = []
-            for doc in ww_db.db.collection('bookings').stream():
-                b = doc.to_dict()
-                bookings.append({
-                    'Datum': b.get('slot_date', ''),
-                    'Zeit': b.get('slot_time', ''),
-                    'Name': b.get('user_name', ''),
-                    'Status': b.get('status', '')
-                })
-            df = pd.DataFrame(bookings)
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False)
-            st.download_button("⬇️ Download", buffer.getvalue(),
-                              f"export_{datetime.now().strftime('%Y%m%d')}.xlsx")
+            st.session_state.export_file = (params, cached_export(*params))
+        # Nur anbieten, solange die Filter zum erzeugten Export passen
+        export = st.session_state.get('export_file')
+        if export and export[0] == params:
+            st.download_button("⬇️ Download", export[1], f"export_{datetime.now().strftime('%Y%m%d')}.{ext}",
+                               use_container_width=True)
     
     with col2:
         st.markdown(f"""<div style='background:{COLORS['grau_hell']};padding:1.5rem;border-radius:12px;text-align:center'>
@@ -1643,11 +4913,10 @@ def show_export():
         if st.button("📧 Backup senden", type="primary", use_container_width=True):
             buffer = io.BytesIO()
             with zipfile.ZipFile(buffer, 'w') as zf:
-                csv = "date,time,user,status\n"
-                for doc in ww_db.db.collection('bookings').stream():
-                    d = doc.to_dict()
-                    csv += f"{d.get('slot_date','')},{d.get('slot_time','')},{d.get('user_name','')},{d.get('status','')}\n"
-                zf.writestr('bookings.csv', csv)
+                csv_text = "date,time,user,status\n"
+                for d in ww_db.list_bookings(fields=['slot_date','slot_time','user_name','status']):
+                    csv_text += f"{d.get('slot_date','')},{d.get('slot_time','')},{d.get('user_name','')},{d.get('status','')}\n"
+                zf.writestr('bookings.csv', csv_text)
             if mailer.backup_email(buffer.getvalue()):
                 st.success("✅ Backup gesendet!")
             else:
@@ -1659,14 +4928,21 @@ def show_settings():
         return
     
     st.title("⚙️ Einstellungen")
-    tab1, tab2 = st.tabs(["📧 E-Mail", "📱 SMS"])
+    defaults = {
+        'email_booking_template':'Hallo {name}, deine Schicht am {date} um {time} wurde gebucht.',
+        'email_cancellation_template':'Hallo {name}, deine Schicht am {date} um {time} wurde storniert.',
+        'sms_booking_template':'Wasserwacht: Buchung bestätigt! {date} {time}',
+        'sms_24h_template':'Wasserwacht: Deine Schicht ist morgen {date} um {time}.',
+        'sms_1h_template':'Wasserwacht: Deine Schicht beginnt in 1h ({time}).',
+    }
+    data = fetch_all(slot_templates=ww_db.get_slot_templates,
+                     **{k: (lambda k=k, d=d: ww_db.get_setting(k, d)) for k, d in defaults.items()})
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📧 E-Mail", "📱 SMS", "🏖️ Sommerpause", "🕐 Slots", "🛠️ Wartung", "⏱️ Jobs"])
     
     with tab1:
         st.subheader("E-Mail-Templates")
-        booking = ww_db.get_setting('email_booking_template',
-                                     'Hallo {name}, deine Schicht am {date} um {time} wurde gebucht.')
-        cancel = ww_db.get_setting('email_cancellation_template',
-                                    'Hallo {name}, deine Schicht am {date} um {time} wurde storniert.')
+        booking = data['email_booking_template']
+        cancel = data['email_cancellation_template']
         
         new_booking = st.text_area("Buchung", booking, height=100, help="{name}, {date}, {time}")
         new_cancel = st.text_area("Stornierung", cancel, height=100, help="{name}, {date}, {time}")
@@ -1678,12 +4954,9 @@ def show_settings():
     
     with tab2:
         st.subheader("SMS-Templates")
-        sms_booking = ww_db.get_setting('sms_booking_template',
-                                        'Wasserwacht: Buchung bestätigt! {date} {time}')
-        sms24 = ww_db.get_setting('sms_24h_template',
-                                  'Wasserwacht: Deine Schicht ist morgen {date} um {time}.')
-        sms1 = ww_db.get_setting('sms_1h_template',
-                                 'Wasserwacht: Deine Schicht beginnt in 1h ({time}).')
+        sms_booking = data['sms_booking_template']
+        sms24 = data['sms_24h_template']
+        sms1 = data['sms_1h_template']
         
         new_sms_booking = st.text_area("Bei Buchung", sms_booking, height=80, help="{name}, {date}, {time}")
         new_sms24 = st.text_area("24h Reminder", sms24, height=80, help="{name}, {date}, {time}")
@@ -1694,6 +4967,163 @@ def show_settings():
             ww_db.set_setting('sms_24h_template', new_sms24)
             ww_db.set_setting('sms_1h_template', new_sms1)
             st.success("✅ Gespeichert!")
+    
+    with tab3:
+        st.subheader("Sommerpause")
+        st.caption("Ein Zeitraum pro Zeile: `MM-TT bis MM-TT` (jedes Jahr) oder `JJJJ-MM-TT bis JJJJ-MM-TT`")
+        st.caption("Jährliche Zeiträume dürfen über Neujahr gehen, z.B. `12-20 bis 01-06`.")
+        current = "\n".join(f"{s} bis {e}" for s, e in current_summer_breaks())
+        new_breaks = st.text_area("Zeiträume", current, height=120)
+        
+        if st.button("💾 Sommerpause speichern", type="primary"):
+            ranges, errors = [], []
+            for line in [l.strip() for l in new_breaks.splitlines() if l.strip()]:
+                parts = [p.strip() for p in line.split(' bis ')]
+                error = summer_break_error(*parts) if len(parts) == 2 else "Format: Beginn bis Ende"
+                if error:
+                    errors.append(f"`{line}`: {error}")
+                else:
+                    ranges.append({'start':parts[0],'end':parts[1]})
+            if errors:
+                st.error("❌ Ungültige Zeiträume:\n\n" + "\n\n".join(errors))
+            else:
+                ww_db.set_setting('summer_breaks', ranges)
+                st.success("✅ Gespeichert!")
+    
+    with tab4:
+        st.subheader("Wöchentliche Slots")
+        for t in data['slot_templates']:
+            if not t.get('active', True):
+                continue
+            col1, col2, col3 = st.columns([4, 1, 1])
+            with col1:
+                validity = f"{fmt_de(t['valid_from']) if t.get('valid_from') else '∞'} – {fmt_de(t['valid_until']) if t.get('valid_until') else '∞'}"
+                st.markdown(f"**{t['day_name']}** {t['start']}-{t['end']} &nbsp; <span style='color:{COLORS['grau_dunkel']}'>({validity})</span>",
+                            unsafe_allow_html=True)
+            with col2:
+                capacity = int(t.get('capacity') or 1)
+                new_capacity = st.number_input("Plätze", 1, 10, capacity, key=f"cap_slot_{t['id']}", label_visibility="collapsed")
+                if new_capacity != capacity:
+                    ww_db.update_slot_template(t['id'], capacity=int(new_capacity))
+                    st.rerun()
+            with col3:
+                if st.button("🗑️ Entfernen", key=f"del_slot_{t['id']}"):
+                    ww_db.update_slot_template(t['id'], active=False)
+                    st.rerun()
+        
+        with st.form("new_slot"):
+            st.markdown("**➕ Neuer Slot**")
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                day_idx = st.selectbox("Wochentag", range(7), format_func=lambda i: WEEKDAY_NAMES[i])
+            with c2:
+                start = st.text_input("Beginn", "17:00")
+            with c3:
+                end = st.text_input("Ende", "20:00")
+            c4, c5, c6 = st.columns(3)
+            with c4:
+                valid_from = st.date_input("Gültig ab", value=None, format="DD.MM.YYYY")
+            with c5:
+                valid_until = st.date_input("Gültig bis", value=None, format="DD.MM.YYYY")
+            with c6:
+                capacity = st.number_input("Plätze", 1, 10, 1, help="Wie viele Rettungsschwimmer pro Schicht")
+            
+            if st.form_submit_button("💾 Slot anlegen", type="primary"):
+                try:
+                    datetime.strptime(start, "%H:%M")
+                    datetime.strptime(end, "%H:%M")
+                except ValueError:
+                    st.error("❌ Uhrzeit im Format HH:MM angeben!")
+                else:
+                    ww_db.add_slot_template(WEEKDAYS[day_idx], start, end,
+                                            valid_from.isoformat() if valid_from else None,
+                                            valid_until.isoformat() if valid_until else None,
+                                            int(capacity))
+                    st.success("✅ Gespeichert!")
+                    st.rerun()
+    
+    with tab5:
+        st.subheader("Monatsübersichten")
+        st.caption("Kalender und Dashboard lesen je Monat ein vorberechnetes Dokument. "
+                   "Nach Datenimporten oder manuellen Änderungen neu aufbauen.")
+        if st.button("🔄 Monatsübersichten neu aufbauen"):
+            with st.spinner("Baue auf..."):
+                n = ww_db.rebuild_month_summaries()
+            st.success(f"✅ {n} Monate aktualisiert")
+        
+        st.subheader("Archiv")
+        st.caption("Buchungen älter als 12 Monate liegen als komprimierte Monats-Segmente außerhalb der Datenbank.")
+        index = ww_db.archive_index()
+        if index:
+            st.dataframe(pd.DataFrame([{'Monat': m, 'Buchungen': e['count'], 'KB': round(e['bytes']/1024, 1),
+                                        'Aktualisiert': e['updated']} for m, e in sorted(index.items(), reverse=True)]),
+                         use_container_width=True, hide_index=True)
+            month = st.selectbox("Monat anzeigen", sorted(index, reverse=True), key="archive_month")
+            archived = ww_db.archived_bookings(month)
+            df = pd.DataFrame(archived).reindex(columns=['slot_date', 'slot_time', 'user_name', 'user_email', 'status'])
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            st.download_button("💾 Monat als CSV", df.to_csv(index=False).encode('utf-8-sig'), f"archiv_{month}.csv", "text/csv")
+        else:
+            st.info("Noch nichts archiviert")
+        if st.button("📦 Jetzt archivieren"):
+            with st.spinner("Archiviere..."):
+                n = ww_db.archive_old()
+            st.success(f"✅ {n} Buchungen archiviert")
+        
+        st.subheader("Ereignisprotokoll")
+        st.caption("Jede Buchung, Stornierung, Überschreibung und Archivierung wird unveränderlich protokolliert. "
+                   "Scoreboard, Monatszähler und User-Historien werden daraus fortgeschrieben.")
+        c1, c2 = st.columns(2)
+        event_email = c1.text_input("E-Mail filtern", key="event_email")
+        event_booking = c2.text_input("Buchungs-ID filtern", key="event_booking")
+        events = ww_db.list_events(booking_id=event_booking.strip() or None, user_email=event_email.strip() or None)
+        if events:
+            st.dataframe(pd.DataFrame(events).reindex(columns=['at', 'type', 'slot_date', 'slot_time', 'user_name', 'user_email', 'by', 'booking_id']),
+                         use_container_width=True, hide_index=True)
+        else:
+            st.info("Keine Ereignisse")
+        if st.button("🔄 Auswertungen neu aufbauen"):
+            with st.spinner("Baue auf..."):
+                ww_db.reset_views()
+                n = ww_db.fold_events()
+            st.success(f"✅ Neu aufgebaut ({n} Ereignisse nachgezogen)")
+    
+    with tab6:
+        st.subheader("Geplante Jobs")
+        st.caption("Jeder Lauf wird protokolliert. Ein Termin läuft nur einmal erfolgreich; abgebrochene Läufe "
+                   f"werden bis {JOB_MISFIRE_GRACE//60} Minuten nach dem Termin nachgeholt, ohne bereits Gesendetes zu wiederholen.")
+        runs = ww_db.list_job_runs()
+        df = pd.DataFrame(runs).reindex(columns=['job', 'status', 'scheduled_for', 'started_at', 'duration_ms', 'items', 'attempts', 'error'])
+        latest = {r['job']: r for r in reversed(runs)}
+        for name, (fn, at) in scheduled_jobs().items():
+            c1, c2, c3, c4 = st.columns([3, 2, 2, 2])
+            r = latest.get(name)
+            c1.markdown(f"**{name}** · täglich {at}")
+            if r:
+                icon = {'ok': "✅", 'error': "❌"}.get(r.get('status'), "⏳")
+                c2.markdown(f"{icon} {r.get('started_at', '')[:16].replace('T', ' ')}")
+                c3.markdown(f"{r.get('duration_ms') or 0:.0f} ms · {r.get('items') or 0} Einträge")
+                if r.get('error'):
+                    st.caption(f"❌ {r['error']}")
+            else:
+                c2.markdown("noch nie gelaufen")
+            if c4.button("▶️ Jetzt ausführen", key=f"run_job_{name}"):
+                with st.spinner("Läuft..."):
+                    n = run_job(name, f"manual-{datetime.now(TZ).isoformat(timespec='seconds')}")
+                st.success(f"✅ {n or 0} Einträge verarbeitet")
+                st.rerun()
+        
+        if runs:
+            st.subheader("Laufzeit-Verlauf")
+            trend = df[df['status'] == 'ok'].assign(started_at=lambda d: pd.to_datetime(d['started_at'], utc=True).dt.tz_convert(TZ))
+            if not trend.empty:
+                st.plotly_chart(px.line(trend.sort_values('started_at'), x='started_at', y='duration_ms', color='job', markers=True,
+                                        labels={'started_at': "Start", 'duration_ms': "Dauer (ms)", 'job': "Job"}),
+                                use_container_width=True)
+            with st.expander("Alle Läufe"):
+                st.dataframe(df, use_container_width=True, hide_index=True)
+        else:
+            st.info("Noch keine Läufe protokolliert")
 
 def show_impressum():
     st.title("📄 Impressum")
@@ -0,0 +1,51 @@
+"""
+AppTest der User-Verwaltung gegen das SQLite-Backend.
+
+    python -m pytest tests
+"""
+
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = Path(__file__).resolve().parents[1] / "streamlit_app.py"
+ADMIN_EMAIL = "admin@wasserwacht.de"
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    db_path = tmp_path / "wasserwacht.db"
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(db_path))
+    at = AppTest.from_file(str(APP_PATH), default_timeout=60)
+    at.run()
+    # Als Admin anmelden (der Admin wird beim ersten Start angelegt)
+    with sqlite3.connect(db_path) as conn:
+        user_id, data = conn.execute("SELECT id,data FROM users WHERE email=?", (ADMIN_EMAIL,)).fetchone()
+    at.session_state.user = {**json.loads(data), 'id': user_id}
+    at.session_state.page = 'users'
+    at.run()
+    assert not at.exception
+    return at, db_path
+
+
+def test_import_then_rerun(app):
+    at, db_path = app
+    sys.path.insert(0, str(APP_PATH.parent))
+    from streamlit_app import SQLiteDB
+
+    # AppTest kann keine Datei hochladen: Import direkt ausführen (erhöht die users-Version)
+    # und das Ergebnis wie nach dem Klick auf "User importieren" ablegen
+    rows = [{'email': 'neu@example.org', 'name': 'Neu'}, {'email': ADMIN_EMAIL, 'name': 'Admin'}]
+    at.session_state.user_import_result = SQLiteDB(str(db_path)).import_users(rows)
+    at.run()
+    assert not at.exception
+    assert any(d.proto.label.startswith("💾") for d in at.get('download_button'))
+    assert "✅ 1 angelegt" in [s.value for s in at.success]
+
+    at.run()
+    assert not at.exception